@@ -2,11 +2,15 @@
 # -*- coding: utf-8 -*-
 
 from copy import copy
+import heapq
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import IntegrityError, transaction
 
 from assessment.models import DoseUnits
 from study.models import Study
-from riskofbias.models import RiskOfBiasScore
-from utils.helper import FlatFileExporter
+from utils.helper import FlatFileExporter, SerializerHelper
 
 from . import models
 
@@ -67,9 +71,7 @@ class EndpointGroupFlatComplete(FlatFileExporter):
         return header
 
     def _get_data_rows(self):
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
             row = []
             row.extend(Study.flat_complete_data_row(ser['animal_group']['experiment']['study']))
             row.extend(models.Experiment.flat_complete_data_row(ser['animal_group']['experiment']))
@@ -82,9 +84,7 @@ class EndpointGroupFlatComplete(FlatFileExporter):
                     ser['animal_group']['dosing_regime']['doses'],
                     self.doses, i))
                 row_copy.extend(models.EndpointGroup.flat_complete_data_row(eg, ser))
-                rows.append(row_copy)
-
-        return rows
+                yield row_copy
 
 
 class EndpointGroupFlatDataPivot(FlatFileExporter):
@@ -94,26 +94,23 @@ class EndpointGroupFlatDataPivot(FlatFileExporter):
     """
 
     @classmethod
-    def _get_doses_list(cls, ser, preferred_units):
+    def _get_doses_list(cls, doses, preferred_units):
         # compact the dose-list to only one set of dose-units; using the
         # preferred units if available, else randomly get first available
         units_id = None
 
         if preferred_units:
-            available_units = set([
-                d['dose_units']['id'] for
-                d in ser['animal_group']['dosing_regime']['doses']
-            ])
+            available_units = set([d['dose_units']['id'] for d in doses])
             for units in preferred_units:
                 if units in available_units:
                     units_id = units
                     break
 
         if units_id is None:
-            units_id = ser['animal_group']['dosing_regime']['doses'][0]['dose_units']['id']
+            units_id = doses[0]['dose_units']['id']
 
         return [
-            d for d in ser['animal_group']['dosing_regime']['doses']
+            d for d in doses
             if units_id == d['dose_units']['id']
         ]
 
@@ -147,13 +144,225 @@ class EndpointGroupFlatDataPivot(FlatFileExporter):
             return '|{0}|'.format('|'.join(effs))
         return ''
 
-    @classmethod  
+    @classmethod
     def _get_observation_time_and_time_units(cls, e):
         return '{} {}'.format(
             e['observation_time'],
             e['observation_time_units']
         )
 
+    FLAT_GROUP_FIELDS = (
+        'id', 'dose_group_id', 'n', 'incidence', 'response', 'stdev',
+        'lower_ci', 'upper_ci', 'significant', 'significance_level',
+        'percentControlMean', 'percentControlLow', 'percentControlHigh',
+        'dichotomous_summary', 'percent_affected', 'percent_lower_ci',
+        'percent_upper_ci',
+    )
+
+    @classmethod
+    def _get_flat_endpoint_data(cls, ser):
+        ag = ser['animal_group']
+        exp = ag['experiment']
+        study = exp['study']
+        dr = ag['dosing_regime']
+
+        bmd = None
+        if ser['bmd']:
+            bmd = {
+                'dose_units': ser['bmd']['dose_units'],
+                'output': {
+                    'BMD': ser['bmd']['output']['BMD'],
+                    'BMDL': ser['bmd']['output']['BMDL'],
+                }
+            }
+
+        return {
+            'study_id': study['id'],
+            'study_name': study['short_citation'],
+            'study_identifier': study['study_identifier'],
+            'study_published': study['published'],
+
+            'experiment_id': exp['id'],
+            'experiment_name': exp['name'],
+            'chemical': exp['chemical'],
+
+            'animal_group_id': ag['id'],
+            'animal_group_name': ag['name'],
+            'lifestage_exposed': ag['lifestage_exposed'],
+            'lifestage_assessed': ag['lifestage_assessed'],
+            'species': ag['species'],
+            'species_strain': cls._get_species_strain(ser),
+            'generation': ag['generation'],
+            'animal_description': get_gen_species_strain_sex(ser, withN=False),
+            'animal_description_n': get_gen_species_strain_sex(ser, withN=True),
+            'sex': ag['sex'],
+            'route': dr['route_of_exposure'].lower(),
+            'treatment_period': get_treatment_period(exp, dr),
+            'duration_exposure': dr['duration_exposure_text'],
+
+            'endpoint_id': ser['id'],
+            'endpoint_name': ser['name'],
+            'system': ser['system'],
+            'organ': ser['organ'],
+            'effect': ser['effect'],
+            'effect_subtype': ser['effect_subtype'],
+            'diagnostic': ser['diagnostic'],
+            'tags': cls._get_tags(ser),
+            'observation_time': cls._get_observation_time_and_time_units(ser),
+            'observation_time_text': ser['observation_time_text'],
+            'data_type': ser['data_type_label'],
+            'response_units': ser['response_units'],
+            'expected_adversity_direction': ser['expected_adversity_direction'],
+            'maximum_endpoint_change': ser['percentControlMaxChange'],
+
+            'doses': [
+                {
+                    'dose_units': {
+                        'id': d['dose_units']['id'],
+                        'name': d['dose_units']['name'],
+                    },
+                    'dose_group_id': d['dose_group_id'],
+                    'dose': float(d['dose']),
+                }
+                for d in dr['doses']
+            ],
+            'NOEL': ser['NOEL'],
+            'LOEL': ser['LOEL'],
+            'FEL': ser['FEL'],
+            'bmd': bmd,
+            'trend_value': ser['trend_value'],
+            'trend_result': ser['trend_result'],
+        }
+
+    @classmethod
+    def refresh_flat_rows(cls, endpoint_ids, batch_size=1000):
+        """
+        Build denormalized endpoint-group rows for endpoints which don't
+        have them yet; rows are deleted when endpoint caches are cleared.
+        Endpoints without groups have no rows; a dictionary of
+        {endpoint_id: (assessment_id, endpoint_data)} is returned for them.
+        """
+        Flat = models.EndpointGroupFlat
+        missing = Flat.objects.get_missing_endpoint_ids(endpoint_ids)
+        groupless = {}
+        if len(missing) == 0:
+            return groupless
+
+        def save(objs):
+            try:
+                with transaction.atomic():
+                    Flat.objects.bulk_create(objs)
+            except IntegrityError:
+                # rows were created concurrently by another export
+                pass
+
+        objs = []
+        qs = models.Endpoint.objects.filter(id__in=missing)
+        for ser in SerializerHelper.iter_serialized_many(qs):
+            endpoint_data = cls._get_flat_endpoint_data(ser)
+            if len(ser['groups']) == 0:
+                groupless[ser['id']] = (ser['assessment'], endpoint_data)
+            for eg in ser['groups']:
+                objs.append(Flat(
+                    assessment_id=ser['assessment'],
+                    endpoint_id=ser['id'],
+                    endpoint_group_id=eg['id'],
+                    dose_group_id=eg['dose_group_id'],
+                    endpoint_data=endpoint_data,
+                    group_data={
+                        key: eg[key] for key in cls.FLAT_GROUP_FIELDS
+                    }
+                ))
+            if len(objs) >= batch_size:
+                save(objs)
+                objs = []
+        if objs:
+            save(objs)
+        return groupless
+
+    def _get_flat_endpoints(self):
+        """
+        Yield a tuple of (assessment_id, endpoint_data, groups) for each
+        endpoint in the queryset, read from the denormalized table; groups
+        are empty for endpoints without any endpoint-groups.
+        """
+        ids = list(self.queryset.values_list('id', flat=True))
+        groupless = self.refresh_flat_rows(ids)
+        rows = models.EndpointGroupFlat.objects\
+            .filter(endpoint_id__in=ids)\
+            .order_by('endpoint_id', 'dose_group_id')\
+            .values_list('endpoint_id', 'assessment_id',
+                         'endpoint_data', 'group_data')\
+            .iterator()
+
+        def grouped():
+            for endpoint_id, items in groupby(rows, key=itemgetter(0)):
+                items = list(items)
+                yield endpoint_id, items[0][1], items[0][2], [item[3] for item in items]
+
+        empty = (
+            (endpoint_id, assessment_id, endpoint_data, [])
+            for endpoint_id, (assessment_id, endpoint_data) in sorted(groupless.items())
+        )
+
+        # both sequences are ordered by endpoint id
+        for _, assessment_id, endpoint_data, groups in \
+                heapq.merge(grouped(), empty, key=itemgetter(0)):
+            yield assessment_id, endpoint_data, groups
+
+    def _get_endpoint_row(self, ep, doses):
+        return [
+            ep['study_id'],
+            ep['study_name'],
+            ep['study_identifier'],
+            ep['study_published'],
+
+            ep['experiment_id'],
+            ep['experiment_name'],
+            ep['chemical'],
+
+            ep['animal_group_id'],
+            ep['animal_group_name'],
+            ep['lifestage_exposed'],
+            ep['lifestage_assessed'],
+            ep['species'],
+            ep['species_strain'],
+            ep['generation'],
+            ep['animal_description'],
+            ep['animal_description_n'],
+            ep['sex'],
+            ep['route'],
+            ep['treatment_period'],
+            ep['duration_exposure'],
+
+            ep['endpoint_id'],
+            ep['endpoint_name'],
+            ep['system'],
+            ep['organ'],
+            ep['effect'],
+            ep['effect_subtype'],
+            ep['diagnostic'],
+            ep['tags'],
+            ep['observation_time'],
+            ep['observation_time_text'],
+            ep['data_type'],
+            self._get_doses_str(doses),
+            self._get_dose_units(doses),
+            ep['response_units'],
+            ep['expected_adversity_direction'],
+        ]
+
+    def _get_dose_summary(self, ep, groups, doses):
+        if len(groups) > 1:
+            return [
+                self._get_dose(doses, 1),  # first non-zero dose
+                self._get_dose(doses, ep['NOEL']),
+                self._get_dose(doses, ep['LOEL']),
+                self._get_dose(doses, ep['FEL']),
+                self._get_dose(doses, len(groups) - 1),
+            ]
+        return [None] * 5
+
     def _get_header_row(self):
         # move qs.distinct() call here so we can make qs annotations.
         self.queryset = self.queryset.distinct('pk')
@@ -231,84 +440,28 @@ class EndpointGroupFlatDataPivot(FlatFileExporter):
     def _get_data_rows(self):
 
         preferred_units = self.kwargs.get('preferred_units', None)
- 
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
-            doses = self._get_doses_list(ser, preferred_units)
-            study_id = ser['animal_group']['experiment']['study']['id']
-            fROB = Study.objects.get(pk=study_id).get_overall_confidence()
-            if fROB == -1:
-                finalROB = 'N/A'
-            else:
-                fROB = (fROB+10)%11
-                for cnt, text in RiskOfBiasScore.RISK_OF_BIAS_SCORE_CHOICES:
-                    if cnt == fROB:
-                        finalROB = text
-
-            # build endpoint-group independent data
-            row = [
-                ser['animal_group']['experiment']['study']['id'],
-                ser['animal_group']['experiment']['study']['short_citation'],
-                ser['animal_group']['experiment']['study']['study_identifier'],
-                ser['animal_group']['experiment']['study']['published'],
 
-                ser['animal_group']['experiment']['id'],
-                ser['animal_group']['experiment']['name'],
-                ser['animal_group']['experiment']['chemical'],
+        for assessment_id, ep, groups in self._get_flat_endpoints():
+            doses = self._get_doses_list(ep['doses'], preferred_units)
+            finalROB = self._get_overall_confidence_text({
+                'id': ep['study_id'],
+                'assessment': assessment_id,
+            })
 
-                ser['animal_group']['id'],
-                ser['animal_group']['name'],
-                ser['animal_group']['lifestage_exposed'],
-                ser['animal_group']['lifestage_assessed'],
-                ser['animal_group']['species'],
-                self._get_species_strain(ser),
-                ser['animal_group']['generation'],
-                get_gen_species_strain_sex(ser, withN=False),
-                get_gen_species_strain_sex(ser, withN=True),
-                ser['animal_group']['sex'],
-                ser['animal_group']['dosing_regime']['route_of_exposure'].lower(),
-                get_treatment_period(ser['animal_group']['experiment'],
-                                     ser['animal_group']['dosing_regime']),
-                ser['animal_group']['dosing_regime']['duration_exposure_text'],
-
-                ser['id'],
-                ser['name'],
-                ser['system'],
-                ser['organ'],
-                ser['effect'],
-                ser['effect_subtype'],
-                ser['diagnostic'],
-                self._get_tags(ser),
-                self._get_observation_time_and_time_units(ser),
-                ser['observation_time_text'],
-                ser['data_type_label'],
-                self._get_doses_str(doses),
-                self._get_dose_units(doses),
-                ser['response_units'],
-                ser['expected_adversity_direction'],
-                ser['percentControlMaxChange'],
-            ]
+            # build endpoint-group independent data
+            row = self._get_endpoint_row(ep, doses)
+            row.append(ep['maximum_endpoint_change'])
 
             # dose-group specific information
-            if len(ser['groups']) > 1:
-                row.extend([
-                    self._get_dose(doses, 1),  # first non-zero dose
-                    self._get_dose(doses, ser['NOEL']),
-                    self._get_dose(doses, ser['LOEL']),
-                    self._get_dose(doses, ser['FEL']),
-                    self._get_dose(doses, len(ser['groups']) - 1),
-                ])
-            else:
-                row.extend([None] * 5)
+            row.extend(self._get_dose_summary(ep, groups, doses))
 
             row.extend([
-                ser['trend_value'],
-                ser['trend_result'],
+                ep['trend_value'],
+                ep['trend_result'],
             ])
 
             # endpoint-group information
-            for i, eg in enumerate(ser['groups']):
+            for i, eg in enumerate(groups):
                 row_copy = copy(row)
                 row_copy.extend([
                     eg['id'],
@@ -331,9 +484,7 @@ class EndpointGroupFlatDataPivot(FlatFileExporter):
                     eg['percent_upper_ci'],
                 ])
                 row_copy.append(finalROB)
-                rows.append(row_copy)
-
-        return rows
+                yield row_copy
 
 
 class EndpointFlatDataPivot(EndpointGroupFlatDataPivot):
@@ -442,85 +593,29 @@ class EndpointFlatDataPivot(EndpointGroupFlatDataPivot):
 
         preferred_units = self.kwargs.get('preferred_units', None)
 
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
-            doses = self._get_doses_list(ser, preferred_units)
-            study_id = ser['animal_group']['experiment']['study']['id']
-            fROB = Study.objects.get(pk=study_id).get_overall_confidence()
-            if fROB == -1:
-                finalROB = 'N/A'
-            else:
-                fROB = (fROB+10)%11
-                for cnt, text in RiskOfBiasScore.RISK_OF_BIAS_SCORE_CHOICES:
-                    if cnt == fROB:
-                        finalROB = text
-				
-            # build endpoint-group independent data
-            row = [
-                ser['animal_group']['experiment']['study']['id'],
-                ser['animal_group']['experiment']['study']['short_citation'],
-                ser['animal_group']['experiment']['study']['study_identifier'],
-                ser['animal_group']['experiment']['study']['published'],
-
-                ser['animal_group']['experiment']['id'],
-                ser['animal_group']['experiment']['name'],
-                ser['animal_group']['experiment']['chemical'],
-
-                ser['animal_group']['id'],
-                ser['animal_group']['name'],
-                ser['animal_group']['lifestage_exposed'],
-                ser['animal_group']['lifestage_assessed'],
-                ser['animal_group']['species'],
-                self._get_species_strain(ser),
-                ser['animal_group']['generation'],
-                get_gen_species_strain_sex(ser, withN=False),
-                get_gen_species_strain_sex(ser, withN=True),
-                ser['animal_group']['sex'],
-                ser['animal_group']['dosing_regime']['route_of_exposure'].lower(),
-                get_treatment_period(ser['animal_group']['experiment'],
-                                     ser['animal_group']['dosing_regime']),
-                ser['animal_group']['dosing_regime']['duration_exposure_text'],
+        for assessment_id, ep, groups in self._get_flat_endpoints():
+            doses = self._get_doses_list(ep['doses'], preferred_units)
+            finalROB = self._get_overall_confidence_text({
+                'id': ep['study_id'],
+                'assessment': assessment_id,
+            })
 
-                ser['id'],
-                ser['name'],
-                ser['system'],
-                ser['organ'],
-                ser['effect'],
-                ser['effect_subtype'],
-                ser['diagnostic'],
-                self._get_tags(ser),
-                self._get_observation_time_and_time_units(ser),
-                ser['observation_time_text'],
-                ser['data_type_label'],
-                self._get_doses_str(doses),
-                self._get_dose_units(doses),
-                ser['response_units'],
-                ser['expected_adversity_direction'],
-            ]
+            # build endpoint-group independent data
+            row = self._get_endpoint_row(ep, doses)
 
             # dose-group specific information
-            if len(ser['groups']) > 1:
-                row.extend([
-                    self._get_dose(doses, 1),  # first non-zero dose
-                    self._get_dose(doses, ser['NOEL']),
-                    self._get_dose(doses, ser['LOEL']),
-                    self._get_dose(doses, ser['FEL']),
-                    self._get_dose(doses, len(ser['groups']) - 1),
-                ])
-            else:
-                row.extend([None] * 5)
+            row.extend(self._get_dose_summary(ep, groups, doses))
 
             # bmd/bmdl information
-            row.extend(self._get_bmd_values(ser['bmd'], preferred_units))
+            row.extend(self._get_bmd_values(ep['bmd'], preferred_units))
 
             row.extend([
-                ser['trend_value'],
-                ser['trend_result'],
+                ep['trend_value'],
+                ep['trend_result'],
             ])
 
             dose_list = [self._get_dose(doses, i) for i in range(len(doses))]
-            sigs = self._get_significance_and_direction(ser['groups'])
+            sigs = self._get_significance_and_direction(groups)
 
             dose_list.extend([None] * (self.num_doses - len(dose_list)))
             sigs.extend([None] * (self.num_doses - len(sigs)))
@@ -529,9 +624,7 @@ class EndpointFlatDataPivot(EndpointGroupFlatDataPivot):
             row.extend(sigs)
             row.append(finalROB)
 
-            rows.append(row)
-
-        return rows
+            yield row
 
 
 class EndpointSummary(FlatFileExporter):
@@ -617,9 +710,7 @@ class EndpointSummary(FlatFileExporter):
                     break
             return txt
 
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
 
             doses = ser['animal_group']['dosing_regime']['doses']
             units = getDoseUnits(doses)
@@ -659,6 +750,4 @@ class EndpointSummary(FlatFileExporter):
                     getDR(dosesList, responsesList, unit),
                     responseDirection
                 ])
-                rows.append(row_copy)
-
-        return rows
+                yield row_copy
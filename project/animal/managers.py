@@ -76,3 +76,18 @@ class EndpointManager(BaseManager):
 
 class EndpointGroupManager(BaseManager):
     assessment_relation = 'endpoint__assessment'
+
+
+class EndpointGroupFlatManager(BaseManager):
+    assessment_relation = 'assessment'
+
+    def get_missing_endpoint_ids(self, endpoint_ids):
+        """
+        Return endpoint ids, in the order given, which have no flat rows.
+        """
+        existing = set(
+            self.filter(endpoint_id__in=endpoint_ids)
+                .values_list('endpoint_id', flat=True)
+                .distinct()
+        )
+        return [id_ for id_ in endpoint_ids if id_ not in existing]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessment', '0016_animal_form_instructions_updates'),
+        ('animal', '0028_duration_observation_relocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointGroupFlat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dose_group_id', models.IntegerField()),
+                ('endpoint_data', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('group_data', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flat_endpoint_groups', to='assessment.Assessment')),
+                ('endpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flat_groups', to='animal.Endpoint')),
+                ('endpoint_group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='flat', to='animal.EndpointGroup')),
+            ],
+            options={
+                'ordering': ('endpoint', 'dose_group_id'),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='endpointgroupflat',
+            index_together=set([('endpoint', 'dose_group_id')]),
+        ),
+    ]
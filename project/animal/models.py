@@ -1,16 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import collections
 import json
 import math
 
 from django.db import models
+from django.contrib.postgres.fields import JSONField
 from django.core.urlresolvers import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ObjectDoesNotExist
 
+import numpy as np
 from reversion import revisions as reversion
-from scipy import stats
 
 from assessment.models import Assessment, BaseEndpoint, get_cas_url
 from assessment.serializers import AssessmentSerializer
@@ -18,6 +18,7 @@ from study.models import Study
 from utils.helper import HAWCDjangoJSONEncoder, SerializerHelper, \
     cleanHTML, tryParseInt
 from utils.models import get_crumbs
+from utils import statistics
 
 from . import managers
 
@@ -196,18 +197,13 @@ class Experiment(models.Model):
                 .values_list('id', flat=True)
         )
 
-    def copy_across_assessments(self, cw):
-        children = list(self.animal_groups.all())
-        old_id = self.id
-        self.id = None
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        cw[AnimalGroup.COPY_NAME]['parents'] = collections.defaultdict(list)
-        for child in children:
-            child.copy_across_assessments(cw)
-        for child in self.animal_groups.all():
-            child.complete_copy(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_ids):
+        ids = cloner.clone(
+            cls.objects.filter(study_id__in=study_ids),
+            cls.COPY_NAME,
+            remaps={'study_id': Study.COPY_NAME})
+        AnimalGroup.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         return self.study
@@ -423,31 +419,23 @@ class AnimalGroup(models.Model):
                 .values_list('id', flat=True)
         )
 
-    def copy_across_assessments(self, cw):
-        children = list(self.endpoints.all())
-        old_id = self.id
-        parent_ids = [p.id for p in self.parents.all()]
-        self.id = None
-        self.experiment_id = cw[Experiment.COPY_NAME][self.experiment_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        cw[self.COPY_NAME]['parents'][self.id] = parent_ids
-        for child in children:
-            child.copy_across_assessments(cw)
-
-    def complete_copy(self, cw):
-        # copy parent animal group over
-        for old_parent_id in cw[self.COPY_NAME]['parents'][self.id]:
-            parent_id = cw[AnimalGroup.COPY_NAME][old_parent_id]
-            self.parents.add(AnimalGroup.objects.get(pk=parent_id))
-        # only create dosing_regime if it doesn't exist
-        dosing_regime_created = DosingRegime.objects\
-            .filter(pk=cw[DosingRegime.COPY_NAME].get(self.dosing_regime_id, None))\
-            .exists()
-        if not dosing_regime_created:
-            self.dosing_regime.copy_across_assessments(cw)
-        self.dosing_regime_id = cw[DosingRegime.COPY_NAME][self.dosing_regime_id]
-        self.save()
+    @classmethod
+    def copy_across_assessments(cls, cloner, experiment_ids):
+        ids = cloner.clone(
+            cls.objects.filter(experiment_id__in=experiment_ids),
+            cls.COPY_NAME,
+            remaps={'experiment_id': Experiment.COPY_NAME})
+        cloner.clone_m2m(cls, 'parents', cls.COPY_NAME, ids,
+                         target_copy_name=cls.COPY_NAME)
+
+        # dosing-regimes and animal-groups refer to each other; copy
+        # dosing-regimes second and then update the animal-groups
+        DosingRegime.copy_across_assessments(cloner, ids)
+        cloner.remap_field(
+            cls, 'dosing_regime_id', DosingRegime.COPY_NAME,
+            [cloner.cw[cls.COPY_NAME][id] for id in ids])
+
+        Endpoint.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         if self.experiment is not None:
@@ -633,15 +621,16 @@ class DosingRegime(models.Model):
         else:
             return doses
 
-    def copy_across_assessments(self, cw):
-        children = list(self.dose_groups)
-        old_id = self.id
-        self.id = None
-        self.dosed_animals_id = cw[AnimalGroup.COPY_NAME].get(self.dosed_animals_id, None)
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, animal_group_ids):
+        regime_ids = AnimalGroup.objects\
+            .filter(id__in=animal_group_ids)\
+            .values_list('dosing_regime_id', flat=True)
+        ids = cloner.clone(
+            cls.objects.filter(id__in=regime_ids),
+            cls.COPY_NAME,
+            remaps={'dosed_animals_id': AnimalGroup.COPY_NAME})
+        DoseGroup.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         if self.dosed_animals is not None:
@@ -686,12 +675,12 @@ class DoseGroup(models.Model):
 
         return cols
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.dose_regime_id = cw[DosingRegime.COPY_NAME][self.dose_regime_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, dosing_regime_ids):
+        cloner.clone(
+            cls.objects.filter(dose_regime_id__in=dosing_regime_ids),
+            cls.COPY_NAME,
+            remaps={'dose_regime_id': DosingRegime.COPY_NAME})
 
 
 class Endpoint(BaseEndpoint):
@@ -943,6 +932,15 @@ class Endpoint(BaseEndpoint):
     @classmethod
     def delete_caches(cls, ids):
         SerializerHelper.delete_caches(cls, ids)
+        EndpointGroupFlat.objects.filter(endpoint_id__in=ids).delete()
+
+    @classmethod
+    def delete_generation_caches(cls, assessment_id=None):
+        # flat rows are built from serialized endpoints
+        qs = EndpointGroupFlat.objects.all()
+        if assessment_id is not None:
+            qs = qs.filter(assessment_id=assessment_id)
+        qs.delete()
 
     def __str__(self):
         return self.name
@@ -988,7 +986,7 @@ class Endpoint(BaseEndpoint):
 
     @staticmethod
     def get_qs_json(queryset, json_encode=True):
-        endpoints = [e.get_json(json_encode=False) for e in queryset]
+        endpoints = SerializerHelper.get_serialized_many(queryset)
         if json_encode:
             return json.dumps(endpoints, cls=HAWCDjangoJSONEncoder)
         else:
@@ -1095,10 +1093,7 @@ class Endpoint(BaseEndpoint):
         more computation, its close to free on database access.
         """
 
-        endpoints = [
-            SerializerHelper.get_serialized(obj, json=False)
-            for obj in queryset
-        ]
+        endpoints = SerializerHelper.get_serialized_many(queryset)
         studies = {}
 
         # flip dictionary nesting
@@ -1152,6 +1147,21 @@ class Endpoint(BaseEndpoint):
             "studies": studies
         }
 
+    @staticmethod
+    def add_group_statistics(endpoints):
+        """
+        Calculate endpoint-group statistics for a list of serialized
+        endpoints, in a single batch.
+        """
+        EndpointGroup.getStdevsBatch([
+            (ep['variance_type'], ep['groups']) for ep in endpoints])
+        datasets = [(ep['data_type'], ep['groups']) for ep in endpoints]
+        EndpointGroup.percentControlBatch(datasets)
+        EndpointGroup.getConfidenceIntervalsBatch(datasets)
+        EndpointGroup.get_incidence_summary_batch(datasets)
+        for ep in endpoints:
+            Endpoint.setMaximumPercentControlChange(ep)
+
     @staticmethod
     def setMaximumPercentControlChange(ep):
         """
@@ -1184,35 +1194,17 @@ class Endpoint(BaseEndpoint):
         except ObjectDoesNotExist:
             return None
 
-    def copy_across_assessments(self, cw):
-        children = list(self.groups.all())
-
-        old_id = self.id
-        new_assessment_id = cw[Assessment.COPY_NAME][self.assessment_id]
-
-        # copy base endpoint
-        base = self.baseendpoint_ptr
-        base.id = None
-        base.assessment_id = new_assessment_id
-        base.save()
-
-        # copy endpoint
-        self.id = None
-        self.baseendpoint_ptr = base
-        self.assessment_id = new_assessment_id
-        self.animal_group_id = cw[AnimalGroup.COPY_NAME][self.animal_group_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-
-        # copy tags
-        for tag in self.effects.through.objects.filter(baseendpoint_id=old_id):
-            tag.id = None
-            tag.baseendpoint_id = self.id
-            tag.save()
-
-        # copy other children
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, animal_group_ids):
+        ids = cloner.clone(
+            cls.objects.filter(animal_group_id__in=animal_group_ids),
+            cls.COPY_NAME,
+            remaps={
+                'assessment_id': Assessment.COPY_NAME,
+                'animal_group_id': AnimalGroup.COPY_NAME,
+            })
+        cloner.clone_m2m(cls, 'effects', cls.COPY_NAME, ids)
+        EndpointGroup.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         if self.animal_group is not None:
@@ -1253,146 +1245,143 @@ class ConfidenceIntervalsMixin(object):
 
     @classmethod
     def getStdevs(cls, variance_type, egs):
-        for eg in egs:
-            eg['stdev'] = cls.stdev(variance_type, eg['variance'], eg['n'])
+        cls.getStdevsBatch([(variance_type, egs)])
+
+    @staticmethod
+    def getStdevsBatch(datasets):
+        """
+        Expects a list of (variance_type, endpoint-groups) tuples, for one or
+        more endpoints. Appends stdev to the dictionary for each endpoint-group.
+        """
+        egs, variance_types, _ = statistics.flatten(datasets)
+        if len(egs) == 0:
+            return
+        values = statistics.stdevs(
+            statistics.get_array(egs, 'variance'),
+            statistics.get_array(egs, 'n'),
+            variance_types == 1,
+            variance_types == 2)
+        statistics.update_groups(egs, stdev=values)
+
+    @classmethod
+    def percentControl(cls, data_type, egs):
+        cls.percentControlBatch([(data_type, egs)])
 
     @staticmethod
-    def percentControl(data_type, egs):
+    def percentControlBatch(datasets):
         """
-        Expects a dictionary of endpoint groups and the endpoint data-type.
-        Appends results to the dictionary for each endpoint-group.
+        Expects a list of (data_type, endpoint-groups) tuples, for one or more
+        endpoints. Appends results to the dictionary for each endpoint-group.
 
         Calculates a 95% confidence interval for the percent-difference from
         control, taking into account variance from both groups using a
         Fisher Information Matrix, assuming independent normal distributions.
+        The first group of each endpoint is the control.
         """
-        for i, eg in enumerate(egs):
-            mean = low = high = None
-            if data_type == "C":
-
-                if i == 0:
-                    n_1 = eg['n']
-                    mu_1 = eg['response']
-                    sd_1 = eg.get('stdev')
-
-                n_2 = eg['n']
-                mu_2 = eg['response']
-                sd_2 = eg.get('stdev')
-
-                if mu_1 and mu_2 and mu_1 != 0:
-                    mean = (mu_2 - mu_1) / mu_1 * 100.
-                    if sd_1 and sd_2 and n_1 and n_2:
-                        sd = math.sqrt(
-                            pow(mu_1, -2) * (
-                                (pow(sd_2, 2) / n_2) +
-                                (pow(mu_2, 2) * pow(sd_1, 2)) / (n_1 * pow(mu_1,  2))
-                            )
-                        )
-                        ci = (1.96 * sd) * 100
-                        rng = sorted([mean - ci, mean + ci])
-                        low = rng[0]
-                        high = rng[1]
-
-            elif data_type == "P":
-                mean = eg['response']
-                low = eg['lower_ci']
-                high = eg['upper_ci']
-
-            eg.update(percentControlMean=mean, percentControlLow=low, percentControlHigh=high)
+        egs, data_types, controls = statistics.flatten(datasets)
+        if len(egs) == 0:
+            return
+
+        response = statistics.get_array(egs, 'response')
+        mean, low, high = statistics.percent_control(
+            statistics.get_array(egs, 'n'),
+            response,
+            statistics.get_array(egs, 'stdev'),
+            controls)
+
+        is_continuous = data_types == "C"
+        is_percent = data_types == "P"
+        statistics.update_groups(
+            egs,
+            percentControlMean=np.where(
+                is_continuous, mean,
+                np.where(is_percent, response, np.nan)),
+            percentControlLow=np.where(
+                is_continuous, low,
+                np.where(is_percent, statistics.get_array(egs, 'lower_ci'), np.nan)),
+            percentControlHigh=np.where(
+                is_continuous, high,
+                np.where(is_percent, statistics.get_array(egs, 'upper_ci'), np.nan)),
+        )
+
+    @classmethod
+    def getConfidenceIntervals(cls, data_type, egs):
+        cls.getConfidenceIntervalsBatch([(data_type, egs)])
 
     @staticmethod
-    def getConfidenceIntervals(data_type, egs):
+    def getConfidenceIntervalsBatch(datasets):
         """
-        Expects a dictionary of endpoint groups and the endpoint data-type.
-        Appends results to the dictionary for each endpoint-group.
+        Expects a list of (data_type, endpoint-groups) tuples, for one or more
+        endpoints. Appends results to the dictionary for each endpoint-group,
+        unless confidence intervals were already reported.
+
+        Continuous data use a two-tailed t-test, assuming 95% confidence
+        interval. Dichotomous data use the procedure from bmds231_manual.pdf,
+        pg 124-5; the error bars shown in BMDS plots use alpha = 0.05 and so
+        represent the 95% confidence intervals on the observed proportions
+        (independent of model).
         """
-        for eg in egs:
-            lower_ci = eg.get('lower_ci')
-            upper_ci = eg.get('upper_ci')
-            n = eg.get('n')
-            update = False
-
-            if lower_ci is not None or upper_ci is not None or n is None:
-                continue
-
-            if (data_type == "C" and eg['response'] is not None and eg['stdev'] is not None):
-                """
-                Two-tailed t-test, assuming 95% confidence interval.
-                """
-                try:
-                    se = eg['stdev'] / math.sqrt(n)
-                except ZeroDivisionError:
-                    se = 0
-                change = stats.t.ppf(0.975, max(n - 1, 1)) * se
-                lower_ci = round(eg['response'] - change, 2)
-                upper_ci = round(eg['response'] + change, 2)
-                update = True
-            elif (data_type in ["D", "DC"] and eg['incidence'] is not None):
-                """
-                Procedure adds confidence intervals to dichotomous datasets.
-                Taken from bmds231_manual.pdf, pg 124-5
-
-                LL = {(2np + z2 - 1) - z*sqrt[z2 - (2+1/n) + 4p(nq+1)]}/[2*(n+z2)]
-                UL = {(2np + z2 + 1) + z*sqrt[z2 + (2-1/n) + 4p(nq-1)]}/[2*(n+z2)]
-
-                - p = the observed proportion
-                - n = the total number in the group in question
-                - z = Z(1-alpha/2) is the inverse standard normal cumulative
-                      distribution function evaluated at 1-alpha/2
-                - q = 1-p.
-
-                The error bars shown in BMDS plots use alpha = 0.05 and so
-                represent the 95% confidence intervals on the observed
-                proportions (independent of model).
-                """
-                try:
-                    p = eg['incidence'] / float(n)
-                except ZeroDivisionError:
-                    p = 0
-                z = stats.norm.ppf(0.975)
-                q = 1. - p
-
-                try:
-                    lower_ci = round(
-                        ((2 * n * p + 2 * z - 1) - z * math.sqrt(
-                            2 * z - (2 + 1 / n) + 4 * p * (n * q + 1))) / (2 * (n + 2 * z)), 3)
-                except ZeroDivisionError:
-                    lower_ci = 0
-                try:
-                    upper_ci = round(
-                        ((2 * n * p + 2 * z + 1) + z * math.sqrt(
-                            2 * z + (2 + 1 / n) + 4 * p * (n * q - 1))) / (2 * (n + 2 * z)), 3)
-                except ZeroDivisionError:
-                    upper_ci = 0
-                update = True
-
-            if update:
-                eg.update(lower_ci=lower_ci, upper_ci=upper_ci)
+        egs, data_types, _ = statistics.flatten(datasets)
+        if len(egs) == 0:
+            return
+
+        n = statistics.get_array(egs, 'n')
+        response = statistics.get_array(egs, 'response')
+        stdev = statistics.get_array(egs, 'stdev')
+        incidence = statistics.get_array(egs, 'incidence')
+        missing = np.isnan(statistics.get_array(egs, 'lower_ci')) & \
+            np.isnan(statistics.get_array(egs, 'upper_ci')) & \
+            ~np.isnan(n)
+
+        is_continuous = missing & (data_types == "C") & \
+            ~np.isnan(response) & ~np.isnan(stdev)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            se = np.where(n > 0, stdev / np.sqrt(n), 0.)
+        lower, upper = statistics.t_confidence_intervals(response, se, n, is_continuous)
+        statistics.update_groups(
+            egs, mask=is_continuous, ndigits=2, lower_ci=lower, upper_ci=upper)
+
+        is_dichotomous = missing & \
+            ((data_types == "D") | (data_types == "DC")) & \
+            ~np.isnan(incidence)
+        lower, upper = statistics.dichotomous_confidence_intervals(incidence, n)
+        statistics.update_groups(
+            egs, mask=is_dichotomous, ndigits=3, lower_ci=lower, upper_ci=upper)
+
+    @classmethod
+    def get_incidence_summary(cls, data_type, egs):
+        cls.get_incidence_summary_batch([(data_type, egs)])
 
     @staticmethod
-    def get_incidence_summary(data_type, egs):
+    def get_incidence_summary_batch(datasets):
         # For plotting purposes, present incidence numbers as percentage and
         # generate a pretty-printing format for dichotomous data
-        for eg in egs:
+        egs, data_types, _ = statistics.flatten(datasets)
+        if len(egs) == 0:
+            return
+
+        n = statistics.get_array(egs, 'n')
+        incidence = statistics.get_array(egs, 'incidence')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            valid = ((data_types == "D") | (data_types == "DC")) & \
+                (n > 0) & ~np.isnan(incidence)
+            percent = (incidence / n * 100).tolist()
+        lower = (statistics.get_array(egs, 'lower_ci') * 100).tolist()
+        upper = (statistics.get_array(egs, 'upper_ci') * 100).tolist()
+
+        for i, eg in enumerate(egs):
             additions = dict(
                 dichotomous_summary='-',
                 percent_affected=None,
                 percent_lower_ci=None,
                 percent_upper_ci=None,
             )
-            n = eg['n']
-            inc = eg['incidence']
-            if (
-                data_type in ["D", "DC"] and
-                n is not None and
-                n > 0 and
-                inc is not None
-            ):
+            if valid[i]:
                 additions.update(
-                    dichotomous_summary=f'{inc}/{n} ({inc / n * 100:.1f}%)',
-                    percent_affected=inc / n * 100,
-                    percent_lower_ci=eg['lower_ci'] * 100,
-                    percent_upper_ci=eg['upper_ci'] * 100,
+                    dichotomous_summary=f"{eg['incidence']}/{eg['n']} ({percent[i]:.1f}%)",
+                    percent_affected=statistics.to_value(percent[i]),
+                    percent_lower_ci=statistics.to_value(lower[i]),
+                    percent_upper_ci=statistics.to_value(upper[i]),
                 )
 
             eg.update(**additions)
@@ -1507,12 +1496,46 @@ class EndpointGroup(ConfidenceIntervalsMixin, models.Model):
             ser['dose_group_id'] == endpoint['FEL'],
         )
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.endpoint_id = cw[Endpoint.COPY_NAME][self.endpoint_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, endpoint_ids):
+        cloner.clone(
+            cls.objects.filter(endpoint_id__in=endpoint_ids),
+            cls.COPY_NAME,
+            remaps={'endpoint_id': Endpoint.COPY_NAME})
+
+
+class EndpointGroupFlat(models.Model):
+    """
+    Denormalized copy of endpoint-group data used for data-pivot exports;
+    one row per endpoint-group, with endpoint-level data repeated on each
+    row. Rows are removed whenever an endpoint's caches are deleted, and
+    rebuilt from the endpoint serialization the next time they're needed.
+    """
+    objects = managers.EndpointGroupFlatManager()
+
+    assessment = models.ForeignKey(
+        Assessment,
+        related_name='flat_endpoint_groups')
+    endpoint = models.ForeignKey(
+        Endpoint,
+        related_name='flat_groups')
+    endpoint_group = models.OneToOneField(
+        EndpointGroup,
+        related_name='flat')
+    dose_group_id = models.IntegerField()
+    endpoint_data = JSONField(
+        default=dict)
+    group_data = JSONField(
+        default=dict)
+    created = models.DateTimeField(
+        auto_now_add=True)
+
+    class Meta:
+        ordering = ('endpoint', 'dose_group_id')
+        index_together = (('endpoint', 'dose_group_id'), )
+
+    def get_assessment(self):
+        return self.assessment
 
 
 reversion.register(Experiment)
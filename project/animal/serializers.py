@@ -102,6 +102,21 @@ class EndpointGroupSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class EndpointListSerializer(serializers.ListSerializer):
+    """
+    Calculate endpoint-group statistics for all endpoints in a single batch.
+    """
+
+    def to_representation(self, data):
+        self.context['defer_group_statistics'] = True
+        try:
+            ret = super().to_representation(data)
+        finally:
+            self.context.pop('defer_group_statistics')
+        models.Endpoint.add_group_statistics(ret)
+        return ret
+
+
 class EndpointSerializer(serializers.ModelSerializer):
     assessment = serializers.PrimaryKeyRelatedField(read_only=True)
     effects = EffectTagsSerializer()
@@ -122,11 +137,8 @@ class EndpointSerializer(serializers.ModelSerializer):
         ret['additional_fields'] = json.loads(instance.additional_fields)
         ret['litter_effects_display'] = instance.get_litter_effects_display()
         ret['experiment_type'] = instance.animal_group.experiment.type
-        models.EndpointGroup.getStdevs(ret['variance_type'], ret['groups'])
-        models.EndpointGroup.percentControl(ret['data_type'], ret['groups'])
-        models.EndpointGroup.getConfidenceIntervals(ret['data_type'], ret['groups'])
-        models.EndpointGroup.get_incidence_summary(ret['data_type'], ret['groups'])
-        models.Endpoint.setMaximumPercentControlChange(ret)
+        if not self.context.get('defer_group_statistics'):
+            models.Endpoint.add_group_statistics([ret])
 
         ret['bmd'] = None
         ret['bmd_notes'] = ''
@@ -144,6 +156,7 @@ class EndpointSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Endpoint
         fields = '__all__'
+        list_serializer_class = EndpointListSerializer
 
 
 class ExperimentCleanupFieldsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
@@ -1,6 +1,8 @@
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
+from utils.helper import cache_invalidator
+
 from . import models
 
 
@@ -14,9 +16,10 @@ from . import models
 @receiver(pre_delete, sender=models.Endpoint)
 @receiver(post_save, sender=models.EndpointGroup)
 @receiver(pre_delete, sender=models.EndpointGroup)
-def invalidate_endpoint_cache(sender, instance, **kwargs):
+def invalidate_endpoint_cache(sender, instance, signal, **kwargs):
     instance_type = type(instance)
     filters = {}
+    ids = []
     if instance_type is models.Experiment:
         filters["animal_group__experiment"] = instance.id
     elif instance_type is models.AnimalGroup:
@@ -28,12 +31,8 @@ def invalidate_endpoint_cache(sender, instance, **kwargs):
     elif instance_type is models.EndpointGroup:
         ids = [instance.endpoint_id]
 
-    if len(filters) > 0:
-        ids = models.Endpoint.objects\
-            .filter(**filters)\
-            .values_list('id', flat=True)
-
-    models.Endpoint.delete_caches(ids)
+    cache_invalidator.add(
+        models.Endpoint, ids, filters, resolve=signal is pre_delete)
 
 
 @receiver(post_save, sender=models.DosingRegime)
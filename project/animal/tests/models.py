@@ -1,10 +1,15 @@
 from unittest import skip
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
 from assessment.models import Species, DoseUnits
 from animal import models
+from mgmt.models import Task
+from study.models import Study
+from utils.helper import SerializerHelper, cache_invalidator
+from utils.warmup import CacheWarmer, cache_refresher, get_warm_lock_name
 
 from . import utils
 
@@ -232,3 +237,204 @@ class EndpointGroupPercentControl(TestCase):
         self.assertAlmostEqual(egs[0]["percentControlMean"], 1)
         self.assertAlmostEqual(egs[0]["percentControlLow"],  2)
         self.assertAlmostEqual(egs[0]["percentControlHigh"], 3)
+
+
+class EndpointGroupStatisticsBatch(TestCase):
+
+    def _build_endpoints(self):
+        return [
+            ("C", 2, [
+                {"n": 10, "incidence": None, "response": 15.1, "variance": 1.1},
+                {"n": 9, "incidence": None, "response": 25.5, "variance": 2.5},
+            ]),
+            ("D", 0, [
+                {"n": 10, "incidence": 0, "response": None, "variance": None},
+                {"n": 10, "incidence": 4, "response": None, "variance": None},
+            ]),
+        ]
+
+    def test_batch_matches_single(self):
+        singles = self._build_endpoints()
+        for data_type, variance_type, egs in singles:
+            models.EndpointGroup.getStdevs(variance_type, egs)
+            models.EndpointGroup.percentControl(data_type, egs)
+            models.EndpointGroup.getConfidenceIntervals(data_type, egs)
+            models.EndpointGroup.get_incidence_summary(data_type, egs)
+
+        batch = self._build_endpoints()
+        models.EndpointGroup.getStdevsBatch([(vt, egs) for _, vt, egs in batch])
+        datasets = [(dt, egs) for dt, _, egs in batch]
+        models.EndpointGroup.percentControlBatch(datasets)
+        models.EndpointGroup.getConfidenceIntervalsBatch(datasets)
+        models.EndpointGroup.get_incidence_summary_batch(datasets)
+
+        self.assertEqual(singles, batch)
+        self.assertAlmostEqual(batch[0][2][1]["percentControlMean"], 68.8741721854)
+        self.assertEqual(batch[1][2][1]["dichotomous_summary"], "4/10 (40.0%)")
+
+
+class EndpointGroupFlat(TestCase):
+
+    def setUp(self):
+        utils.build_endpoints_for_permission_testing(self)
+
+    def test_refresh_and_invalidate(self):
+        from animal.exports import EndpointGroupFlatDataPivot
+
+        endpoint = self.endpoint_working
+        EndpointGroupFlatDataPivot.refresh_flat_rows([endpoint.id])
+        rows = models.EndpointGroupFlat.objects.filter(endpoint=endpoint)
+        self.assertEqual(rows.count(), 4)
+        self.assertEqual(
+            list(rows.values_list('dose_group_id', flat=True)),
+            [0, 1, 2, 3])
+
+        flat = rows.first()
+        self.assertEqual(flat.assessment_id, endpoint.assessment_id)
+        self.assertEqual(flat.endpoint_data['endpoint_name'], 'endpoint name')
+        self.assertEqual(len(flat.endpoint_data['doses']), 4)
+
+        # existing rows are not rebuilt
+        self.assertEqual(
+            models.EndpointGroupFlat.objects.get_missing_endpoint_ids([endpoint.id]),
+            [])
+
+        # saving the endpoint invalidates its rows, once committed
+        endpoint.name = 'updated name'
+        endpoint.save()
+        cache_invalidator.flush()
+        self.assertEqual(rows.count(), 0)
+
+        EndpointGroupFlatDataPivot.refresh_flat_rows([endpoint.id])
+        self.assertEqual(rows.first().endpoint_data['endpoint_name'], 'updated name')
+
+    def test_endpoint_without_groups(self):
+        from animal.exports import EndpointFlatDataPivot
+
+        empty = models.Endpoint.objects.create(
+            assessment=self.assessment_working,
+            animal_group=self.animal_group_working,
+            name='no groups',
+            response_units='% affected',
+            data_type='C')
+        qs = models.Endpoint.objects.filter(id__in=[self.endpoint_working.id, empty.id])
+        exporter = EndpointFlatDataPivot(qs, export_format='tsv')
+
+        endpoints = list(exporter._get_flat_endpoints())
+        self.assertEqual(
+            [(ep['endpoint_id'], len(groups)) for _, ep, groups in endpoints],
+            [(self.endpoint_working.id, 4), (empty.id, 0)])
+
+    def test_generation_bump(self):
+        from animal.exports import EndpointGroupFlatDataPivot
+
+        endpoint = self.endpoint_working
+        EndpointGroupFlatDataPivot.refresh_flat_rows([endpoint.id, self.endpoint_final.id])
+        SerializerHelper.bump_generation(models.Endpoint, endpoint.assessment_id)
+        self.assertFalse(models.EndpointGroupFlat.objects.filter(endpoint=endpoint).exists())
+        self.assertTrue(
+            models.EndpointGroupFlat.objects.filter(endpoint=self.endpoint_final).exists())
+
+
+class EndpointCacheInvalidation(TestCase):
+
+    def setUp(self):
+        utils.build_endpoints_for_permission_testing(self)
+        cache_invalidator.flush()
+
+    def test_deferred_until_commit(self):
+        endpoint = self.endpoint_working
+        name = SerializerHelper._get_cache_name(models.Endpoint, endpoint.id)
+        SerializerHelper.get_serialized(endpoint)
+        self.assertIsNotNone(cache.get(name))
+
+        # repeated saves are collected and deduplicated; caches are kept
+        # until the transaction is committed
+        endpoint.save()
+        for eg in endpoint.groups.all():
+            eg.save()
+        self.animal_group_working.save()
+        pending = cache_invalidator.pending[models.Endpoint]
+        self.assertEqual(pending['ids'], {endpoint.id})
+        self.assertEqual(pending['filters'], {'animal_group': {self.animal_group_working.id}})
+        self.assertIsNotNone(cache.get(name))
+
+        cache_invalidator.flush()
+        self.assertIsNone(cache.get(name))
+        self.assertEqual(len(cache_invalidator.pending), 0)
+
+    def test_generation(self):
+        endpoint = self.endpoint_working
+        name = SerializerHelper._get_cache_name(models.Endpoint, endpoint.id)
+        SerializerHelper.get_serialized(endpoint)
+        cached = cache.get(name)
+        self.assertEqual(cached['assessment'], endpoint.assessment_id)
+
+        # bumping a different assessment keeps the cache valid
+        SerializerHelper.bump_generation(models.Endpoint, endpoint.assessment_id + 1)
+        self.assertEqual(
+            SerializerHelper._get_valid(models.Endpoint, {name: cached}).keys(), {name})
+
+        # bumping the assessment invalidates without deleting
+        SerializerHelper.bump_generation(models.Endpoint, endpoint.assessment_id)
+        self.assertEqual(SerializerHelper._get_valid(models.Endpoint, {name: cached}), {})
+        SerializerHelper.get_serialized(endpoint)
+        self.assertNotEqual(cache.get(name)['generation'], cached['generation'])
+
+    def test_warm(self):
+        warmer = CacheWarmer(self.assessment_working.id, models=('animal.Endpoint', ),
+                             max_workers=1)
+        SerializerHelper.bump_generation(models.Endpoint, self.assessment_working.id)
+        coverage = warmer.get_coverage()['animal.Endpoint']
+        self.assertEqual(coverage['cached'], 0)
+        self.assertTrue(coverage['total'] > 0)
+
+        coverage = warmer.warm()['animal.Endpoint']
+        self.assertEqual(coverage['cached'], coverage['total'])
+        self.assertEqual(coverage['percent'], 100.)
+
+    def test_refresh_deduplicated(self):
+        # repeated bumps in a transaction are collected once per assessment
+        assessment_id = self.assessment_working.id
+        for i in range(3):
+            cache_refresher.add(models.Endpoint, assessment_id)
+        cache_refresher.add(Study, assessment_id)
+        self.assertEqual(cache_refresher.pending, {assessment_id: {models.Endpoint, Study}})
+        cache_refresher.pending.clear()
+
+        self.assertEqual(
+            get_warm_lock_name(assessment_id, ['study.Study', 'animal.Endpoint']),
+            get_warm_lock_name(assessment_id, ('animal.Endpoint', 'study.Study')))
+
+
+class CopyAcrossAssessments(TestCase):
+
+    def setUp(self):
+        utils.build_endpoints_for_permission_testing(self)
+        self.endpoint_working.effects.create(name='tag', slug='tag')
+
+    def test_copy(self):
+        source = Study.objects.filter(id=self.study_working.id)
+        cw = Study.copy_across_assessment(source, self.assessment_final)
+
+        study = Study.objects.get(id=cw[Study.COPY_NAME][self.study_working.id])
+        self.assertEqual(study.assessment_id, self.assessment_final.id)
+        self.assertEqual(study.short_citation, self.study_working.short_citation)
+
+        # circular animal-group <-> dosing-regime relation is remapped
+        animal_group = models.AnimalGroup.objects.get(experiment__study=study)
+        self.assertNotEqual(animal_group.dosing_regime_id, self.dosing_regime_working.id)
+        self.assertEqual(animal_group.dosing_regime.dosed_animals_id, animal_group.id)
+        self.assertEqual(animal_group.dosing_regime.doses.count(), 4)
+
+        endpoint = models.Endpoint.objects.get(animal_group=animal_group)
+        self.assertEqual(endpoint.assessment_id, self.assessment_final.id)
+        self.assertEqual(endpoint.groups.count(), 4)
+        self.assertEqual(
+            list(endpoint.effects.values_list('id', flat=True)),
+            list(self.endpoint_working.effects.values_list('id', flat=True)))
+
+        # management tasks are created, as for studies created individually
+        self.assertEqual(
+            sorted(study.tasks.values_list('type', flat=True)),
+            [Task.TYPE_PREPARATION, Task.TYPE_EXTRACTION, Task.TYPE_QA, Task.TYPE_ROB])
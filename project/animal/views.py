@@ -340,38 +340,18 @@ class EndpointList(BaseEndpointFilterList):
             query &= Q(animal_group__experiment__study__published=True)
         return query
 
-    # this implementation is a copy of the one in BaseEndpointFilterList, and is
-    # just here to handle the RawSQL handling for sorting on a nested JSON field.
-    # If that goes away (either b/c of upgrading to Django 2.1, or if sorting is
-    # no longer deemed necessary), this method could be deleted.
-    def get_queryset(self):
-        perms = super().get_obj_perms()
-        order_by = None
-
-        query = self.get_query(perms)
-
-        if self.form.is_valid():
-            query &= self.form.get_query()
-            order_by = self.form.get_order_by()
-
-        ids = self.model.objects.filter(query)\
-            .order_by('id')\
-            .distinct('id')\
-            .values_list('id', flat=True)
-
-        qs = self.model.objects.filter(id__in=ids)
-
-        if order_by:
-            if order_by == "customBMD":
-                # the second "order_by" is basically here to force the ORM to
-                # properly add the bmd_model table to the constructed query.
-                qs = qs.order_by(RawSQL("bmd_model.output->>'BMD'", ()), "bmd_model__model")
-            elif order_by == "customBMDLS":
-                qs = qs.order_by(RawSQL("bmd_model.output->>'BMDL'", ()), "bmd_model__model")
-            else:
-                qs = qs.order_by(order_by)
-
-        return qs
+    # BMD/BMDL are sorted on a nested JSON field using RawSQL; these orderings
+    # can't be used as a keyset, and are paginated by offset. If that goes
+    # away (either b/c of upgrading to Django 2.1, or if sorting is no longer
+    # deemed necessary), this method could be deleted.
+    def order_queryset(self, qs, order_by):
+        if order_by == "customBMD":
+            # the second "order_by" is basically here to force the ORM to
+            # properly add the bmd_model table to the constructed query.
+            return qs.order_by(RawSQL("bmd_model.output->>'BMD'", ()), "bmd_model__model")
+        elif order_by == "customBMDLS":
+            return qs.order_by(RawSQL("bmd_model.output->>'BMDL'", ()), "bmd_model__model")
+        return super().order_queryset(qs, order_by)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -385,6 +365,9 @@ class EndpointTags(EndpointList):
     def get_queryset(self):
         return self.model.objects.tag_qs(self.assessment.pk, self.kwargs['tag_slug'])
 
+    def get_count(self, queryset):
+        return queryset.count()
+
 
 class EndpointRead(BaseDetail):
     queryset = models.Endpoint.objects\
@@ -8,11 +8,16 @@ from django.core.management.base import BaseCommand, CommandError, OutputWrapper
 from django.conf import settings
 
 from assessment.models import Assessment
+from utils.pgcopy import ParallelCopyOut
 
 from django.utils.encoding import force_str
 
 
-HELP_TEXT = """Dump database for selected assessment."""
+HELP_TEXT = """Dump database for selected assessment.
+
+By default, a single SQL file is written to stdout. If an output directory
+is specified, tables are copied in parallel from a consistent snapshot to
+compressed files in the directory; load using `assessment_db_restore`."""
 
 
 class NaiveWrapper(OutputWrapper):
@@ -125,6 +130,10 @@ class Command(UnicodeCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('id_list', type=int, nargs='+', help='IDs of the assessments to export, separated by spaces.')
+        parser.add_argument('--output', type=str, dest='output',
+                            help='Directory for a parallel export')
+        parser.add_argument('--workers', type=int, dest='workers', default=4,
+                            help='Number of parallel connections (default 4)')
 
     def write_header(self, assessment):
         header = self.header.format(
@@ -153,86 +162,104 @@ class Command(UnicodeCommand):
         (out, err) = proc.communicate()
         self.stdout.write(out)
 
-    def write_qs_data(self, qs, model, db_table):
-        qry = qs.query.__str__()
+    def get_sql(self, qs):
+        # compile queryset, with parameters correctly quoted
+        sql, params = qs.query.sql_with_params()
+        return self.cursor.cursor.mogrify(sql, params).decode('utf8')
+
+    def get_qs_tables(self, qs, model, db_table):
+        """
+        Yield a (db_table, fields, query) tuple for the queryset, and for
+        each many-to-many table of the model which hasn't been handled.
+        """
+        qry = self.get_sql(qs)
         fields = self.get_select_fields(qs.model)
         select_include = self.generate_select(fields, db_table)
         qry_start = 'SELECT DISTINCT' if 'DISTINCT' in qry else 'SELECT'
         qry = "{} {} {}".format(
             qry_start, select_include, qry[qry.find(' FROM'):])
-        self.convert_copy(db_table, fields, qry)
+        yield db_table, fields, qry
 
         for m2m in model._meta.many_to_many:
-            self.write_m2m_data(m2m, qs)
+            table = self.get_m2m_table(m2m, qs)
+            if table is not None:
+                yield table
 
-    def write_base_data(self):
+    def write_qs_data(self, qs, model, db_table):
+        for i, (table, fields, qry) in enumerate(self.get_qs_tables(qs, model, db_table)):
+            if i > 0:
+                self.stdout.write("\n--- TABLE {}\n".format(table))
+            self.convert_copy(table, fields, qry)
+
+    def get_base_querysets(self):
         """
-        Exports data that would be duplicated when exporting multiple assessments
+        Yield (model, db_table, queryset) for data that would be duplicated
+        when exporting multiple assessments; queryset is None if no content.
         """
-        models = apps.get_models()
         base_exports = BaseHawcDataExports()
-        self.stdout.write('--- HAWC BASE DATA\n')
-        self.stdout.write('------------------------\n')
-        self.cursor = connection.cursor()
-        for model in models:
+        for model in apps.get_models():
             db_table = model._meta.db_table
             if db_table in self.base_tables_handled:
                 continue
 
             if base_exports.lookup(db_table):
                 self.base_tables_handled.append(db_table)
-                self.stdout.write("\n--- TABLE {}\n".format(db_table))
-                qs = None
-
                 qs = base_exports.lookup(db_table)(model, self.id_list)
+                yield model, db_table, qs
 
-                if qs is not None:
-                    self.write_qs_data(qs, model, db_table)
-                else:
-                    self.stdout.write('--- no content added\n')
-
-    def write_data(self, assessment_id):
+    def get_querysets(self, assessment_id):
+        """
+        Yield (model, db_table, queryset) for assessment data; queryset is
+        None if the model is not exported.
+        """
         self.table_handled = list(self.base_tables_handled)
-        self.stdout.write('--- HAWC ASSESSMENT DATA\n')
-        self.stdout.write('------------------------\n')
-        models = apps.get_models()
-        for model in models:
+        for model in apps.get_models():
             db_table = model._meta.db_table
             if db_table in self.table_handled:
                 continue
             self.table_handled.append(db_table)
 
-            self.stdout.write("\n--- TABLE {}\n".format(db_table))
             qs = None
             if hasattr(model.objects, 'assessment_qs'):
                 qs = model.objects.assessment_qs(assessment_id)
             elif hasattr(model, 'assessment_qs'):
                 qs = model.assessment_qs(assessment_id)
-            else:
-                print(f'--- {model} not exported\n')
+            yield model, db_table, qs
 
+    def write_base_data(self):
+        """
+        Exports data that would be duplicated when exporting multiple assessments
+        """
+        self.stdout.write('--- HAWC BASE DATA\n')
+        self.stdout.write('------------------------\n')
+        for model, db_table, qs in self.get_base_querysets():
+            self.stdout.write("\n--- TABLE {}\n".format(db_table))
             if qs is not None:
-                if qs.count() == 0:
-                    continue
                 self.write_qs_data(qs, model, db_table)
-
             else:
                 self.stdout.write('--- no content added\n')
 
-    def write_m2m_data(self, field, qs):
+    def write_data(self, assessment_id):
+        self.stdout.write('--- HAWC ASSESSMENT DATA\n')
+        self.stdout.write('------------------------\n')
+        for model, db_table, qs in self.get_querysets(assessment_id):
+            self.stdout.write("\n--- TABLE {}\n".format(db_table))
+            if qs is not None:
+                self.write_qs_data(qs, model, db_table)
+            else:
+                self.stdout.write('--- {} not exported\n'.format(model))
+
+    def get_m2m_table(self, field, qs):
+        """
+        Return a (db_table, fields, query) tuple for a many-to-many table,
+        filtered using a subquery of the parent queryset.
+        """
         db_table = field.m2m_db_table()
         if db_table in self.table_handled:
-            return
+            return None
         self.table_handled.append(db_table)
 
-        ids = tuple(qs.values_list('id', flat=True))
-        if len(ids) > 0:
-            ids = ', '.join([str(id_) for id_ in ids])
-        else:
-            ids = '-1'
-
         matchfield = field.m2m_column_name()
-        self.stdout.write("\n--- TABLE {}\n".format(db_table))
         model = getattr(field.model, field.name).through
         fields = self.get_select_fields(model)
         select_include = (self.generate_select(fields, db_table))
@@ -241,9 +268,9 @@ class Command(UnicodeCommand):
             db_table,
             db_table,
             matchfield,
-            ids,
+            self.get_sql(qs.order_by().values('id')),
         )
-        self.convert_copy(db_table, fields, qry)
+        return db_table, fields, qry
 
     def convert_copy(self, db_table, fields, qry):
         fields = ['"{}"'.format(fld) for fld in fields]
@@ -267,9 +294,50 @@ class Command(UnicodeCommand):
         select = ['"{}"."{}"'.format(db_table, col) for col in cols]
         return ", ".join(select)
 
+    def get_tables(self):
+        """
+        Return a list of tables to copy for a parallel export; each
+        assessment's rows are written to separate files.
+        """
+        tables = []
+
+        def add(prefix, model, db_table, qs):
+            if qs is None:
+                return
+            for table, fields, qry in self.get_qs_tables(qs, model, db_table):
+                tables.append(dict(
+                    table=table,
+                    columns=fields,
+                    query=qry,
+                    file='{}-{}.copy.gz'.format(prefix, table),
+                ))
+
+        for model, db_table, qs in self.get_base_querysets():
+            add('base', model, db_table, qs)
+        for assessment_id in self.id_list:
+            for model, db_table, qs in self.get_querysets(assessment_id):
+                add(assessment_id, model, db_table, qs)
+        return tables
+
+    def handle_parallel(self, output, workers):
+        for assessment_id in self.id_list:
+            if not Assessment.objects.filter(id=assessment_id).exists():
+                raise CommandError('Assessment {} not found.'.format(assessment_id))
+
+        copier = ParallelCopyOut(output, max_workers=workers)
+        manifest = copier.run(self.get_tables(), assessments=self.id_list)
+        self.stderr.write('Exported {} tables ({} rows) to {}\n'.format(
+            len(manifest['tables']),
+            sum(table['rows'] for table in manifest['tables']),
+            output))
+
     def handle(self, *args, **options):
 
         self.id_list = options.get('id_list', -1)
+        self.cursor = connection.cursor()
+
+        if options.get('output'):
+            return self.handle_parallel(options['output'], options['workers'])
 
         self.write_schema_pre_data()
         self.write_base_data()
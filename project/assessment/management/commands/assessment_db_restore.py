@@ -0,0 +1,43 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+
+from utils.pgcopy import ParallelCopyIn
+
+
+HELP_TEXT = """Restore an assessment export created with `assessment_db_dump --output`.
+
+The database must be empty; schema is created, tables are loaded in
+parallel, and then indexes and constraints are created."""
+
+
+class Command(BaseCommand):
+    help = HELP_TEXT
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=str,
+                            help='Directory created by assessment_db_dump --output')
+        parser.add_argument('--workers', type=int, dest='workers', default=4,
+                            help='Number of parallel connections (default 4)')
+
+    def reset_sequences(self):
+        # sequence values are not included in the schema export
+        statements = connection.ops.sequence_reset_sql(no_style(), apps.get_models())
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def handle(self, directory, workers, **options):
+        loader = ParallelCopyIn(directory, max_workers=workers)
+        try:
+            manifest = loader.get_manifest()
+        except FileNotFoundError:
+            raise CommandError('No manifest found in {}'.format(directory))
+
+        rows = loader.run()
+        self.reset_sequences()
+        self.stdout.write('Restored {} tables ({} rows) for assessments: {}'.format(
+            len(manifest['tables']),
+            rows,
+            ', '.join(str(id_) for id_ in manifest['assessments'])))
@@ -1,25 +1,38 @@
 from datetime import datetime
 
 from django.apps import apps
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand
+
+from utils import counts
 
 
 HELP_TEXT = """Recursively iterate through all custom HAWC modules,
-and print the number of items found in the database by object type."""
+and print the number of items found in the database by object type.
+
+Counts are read from the object-count cache; use --reconcile to recompute
+all counts first. Very large tables are estimated."""
 
 
 class Command(BaseCommand):
     help = HELP_TEXT
 
+    def add_arguments(self, parser):
+        parser.add_argument('--reconcile', action='store_true', dest='reconcile',
+                            help='Recompute all counts before printing')
+
     def handle(self, *args, **options):
+        if options['reconcile']:
+            counts.reconcile()
+
         outputs = []
         outputs.append("HAWC object outputs\t{0}".format(datetime.now()))
 
         models = apps.get_models()
+        model_counts = counts.get_counts(models)
         for model in models:
             module = model.__module__
             name = model.__name__
-            count = model.objects.count()
+            count = model_counts[model]
             outputs.append("{0}\t{1}\t{2}".format(module, name, count))
 
         for output in outputs:
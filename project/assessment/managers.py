@@ -1,7 +1,8 @@
 import json
 
 from django.apps import apps
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
 from django.contrib.contenttypes.models import ContentType
 
 from utils.helper import HAWCDjangoJSONEncoder
@@ -115,3 +116,50 @@ class BaseEndpointManager(BaseManager):
 
 class TimeSpentEditingManager(BaseManager):
     assessment_relation = 'assessment'
+
+    @transaction.atomic
+    def add_seconds(self, deltas, batch_size=500):
+        """
+        Add seconds to time spent for many objects. `deltas` is a dictionary
+        of {(assessment_id, content_type_id, object_id): seconds}; existing
+        rows are updated in batches, and missing rows are created in bulk.
+        Objects in assessments which no longer exist are dropped.
+        """
+        existing = {}
+        rows = self.select_for_update()\
+            .filter(
+                assessment_id__in={key[0] for key in deltas},
+                content_type_id__in={key[1] for key in deltas},
+                object_id__in={key[2] for key in deltas})\
+            .order_by('id')\
+            .values_list('id', 'assessment_id', 'content_type_id', 'object_id')
+        for id_, *key in rows:
+            existing.setdefault(tuple(key), id_)
+
+        updates = [
+            (existing[key], seconds)
+            for key, seconds in deltas.items() if key in existing
+        ]
+        for i in range(0, len(updates), batch_size):
+            batch = updates[i:i + batch_size]
+            whens = [
+                When(id=id_, then=F('seconds') + Value(seconds))
+                for id_, seconds in batch
+            ]
+            self.filter(id__in=[id_ for id_, _ in batch])\
+                .update(seconds=Case(*whens, output_field=FloatField()))
+
+        missing = [key for key in deltas if key not in existing]
+        assessment_ids = set(
+            apps.get_model('assessment', 'Assessment').objects
+                .filter(id__in={key[0] for key in missing})
+                .values_list('id', flat=True))
+        self.bulk_create([
+            self.model(
+                assessment_id=assessment_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+                seconds=deltas[(assessment_id, content_type_id, object_id)])
+            for assessment_id, content_type_id, object_id in missing
+            if assessment_id in assessment_ids
+        ], batch_size=batch_size)
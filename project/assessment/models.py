@@ -1,4 +1,5 @@
 from collections import OrderedDict
+import hashlib
 import json
 import os
 
@@ -14,6 +15,7 @@ from django.utils import timezone
 from django.utils.http import urlquote
 from django.shortcuts import HttpResponse
 
+from django_redis import get_redis_connection
 from reversion import revisions as reversion
 
 from utils.models import get_crumbs
@@ -21,7 +23,6 @@ from utils.helper import HAWCDjangoJSONEncoder
 from myuser.models import HAWCUser
 
 from . import managers
-from .tasks import add_time_spent
 
 
 def get_cas_url(cas):
@@ -140,6 +141,53 @@ class Assessment(models.Model):
     def __str__(self):
         return "%s (%s)" % (self.name, self.year)
 
+    ROLE_PROJECT_MANAGER = 'project_manager'
+    ROLE_TEAM_MEMBER = 'team_member'
+    ROLE_REVIEWER = 'reviewer'
+
+    @classmethod
+    def get_roles_cache_name(cls, assessment_id):
+        return 'assessment-{}-roles'.format(assessment_id)
+
+    def get_member_roles(self):
+        """
+        Return a dictionary of {user_id: set(roles)} for all users in the
+        assessment team; loaded in a single query and cached.
+        """
+        cache_name = self.get_roles_cache_name(self.id)
+        members = cache.get(cache_name)
+        if members is None:
+            qs = None
+            for field, role in (
+                    ('project_manager', self.ROLE_PROJECT_MANAGER),
+                    ('team_members', self.ROLE_TEAM_MEMBER),
+                    ('reviewers', self.ROLE_REVIEWER)):
+                role_qs = getattr(Assessment, field).through.objects\
+                    .filter(assessment_id=self.id)\
+                    .annotate(role=models.Value(role, output_field=models.CharField()))\
+                    .values_list('hawcuser_id', 'role')
+                qs = role_qs if qs is None else qs.union(role_qs, all=True)
+            members = {}
+            for user_id, role in qs:
+                members.setdefault(user_id, set()).add(role)
+            cache.set(cache_name, members)
+        return members
+
+    def get_user_roles(self, user):
+        """
+        Return the set of roles for a user in this assessment. Roles are
+        memoized on the user instance, so they're only resolved once for
+        each assessment in a request.
+        """
+        if user.is_anonymous():
+            return frozenset()
+        roles = getattr(user, '_assessment_roles', None)
+        if roles is None:
+            roles = user._assessment_roles = {}
+        if self.id not in roles:
+            roles[self.id] = frozenset(self.get_member_roles().get(user.id, ()))
+        return roles[self.id]
+
     def user_permissions(self, user):
         return {
             'view': self.user_can_view_object(user),
@@ -162,9 +210,7 @@ class Assessment(models.Model):
         elif user.is_anonymous():
             return False
         else:
-            return ((user in self.project_manager.all()) or
-                    (user in self.team_members.all()) or
-                    (user in self.reviewers.all()))
+            return len(self.get_user_roles(user)) > 0
 
     def user_can_edit_object(self, user):
         """
@@ -176,9 +222,16 @@ class Assessment(models.Model):
         elif user.is_anonymous():
             return False
         else:
-            return (self.editable and
-                    (user in self.project_manager.all() or
-                     user in self.team_members.all()))
+            return self.editable and self.user_is_editor(user)
+
+    def user_is_editor(self, user):
+        """
+        If the user is a project manager or team member, regardless of if the
+        assessment is editable.
+        """
+        roles = self.get_user_roles(user)
+        return (self.ROLE_PROJECT_MANAGER in roles or
+                self.ROLE_TEAM_MEMBER in roles)
 
     def user_can_edit_assessment(self, user):
         """
@@ -190,7 +243,7 @@ class Assessment(models.Model):
         elif user.is_anonymous():
             return False
         else:
-            return (user in self.project_manager.all())
+            return self.ROLE_PROJECT_MANAGER in self.get_user_roles(user)
 
     def user_is_part_of_team(self, user):
         """
@@ -202,9 +255,7 @@ class Assessment(models.Model):
         elif user.is_anonymous():
             return False
         else:
-            return ((user in self.project_manager.all()) or
-                    (user in self.team_members.all()) or
-                    (user in self.reviewers.all()))
+            return len(self.get_user_roles(user)) > 0
 
     def get_crumbs(self):
         return get_crumbs(self)
@@ -405,9 +456,14 @@ class TimeSpentEditing(models.Model):
     def __str__(self):
         return f'{self.content_type.model} {self.object_id}: {self.seconds}'
 
+    # redis hash of buffered seconds, by "assessment:content_type:object"
+    BUFFER_KEY = 'time-spent-buffer'
+
     @classmethod
     def get_cache_name(cls, url, session_key):
-        return hash(f'{url}-{session_key}')
+        # deterministic across processes, unlike hash()
+        digest = hashlib.md5(f'{url}-{session_key}'.encode()).hexdigest()
+        return f'time-spent-{digest}'
 
     @classmethod
     def set_start_time(cls, url, session_key):
@@ -418,27 +474,69 @@ class TimeSpentEditing(models.Model):
         cache.set(cache_name, now, 60 * 60 * 1)
 
     @classmethod
-    def add_time_spent_job(cls, url, session_key, obj, assessment_id):
+    def get_buffer(cls):
+        # returns None if the cache isn't redis-backed
+        try:
+            return get_redis_connection(), cache.make_key(cls.BUFFER_KEY)
+        except NotImplementedError:
+            return None
+
+    @classmethod
+    def add_time_spent(cls, url, session_key, obj, assessment_id):
+        """
+        Record time spent on a page since it was opened; seconds are
+        buffered in redis and written by `flush_time_spent`.
+        """
         cache_name = cls.get_cache_name(url, session_key)
+        start_time = cache.get(cache_name)
+        if start_time is None:
+            return
+        cache.delete(cache_name)
+
+        seconds = (timezone.now() - start_time).total_seconds()
         content_type_id = ContentType.objects.get_for_model(obj).id
-        add_time_spent.delay(cache_name, obj.id,
-                             assessment_id, content_type_id)
+        key = (assessment_id, content_type_id, obj.id)
 
-    @classmethod
-    def add_time_spent(cls, cache_name, object_id, assessment_id, content_type_id):
-        time_spent, created = cls.objects.get_or_create(
-            content_type_id=content_type_id,
-            object_id=object_id,
-            assessment_id=assessment_id,
-            defaults={'seconds': 0})
+        buffer = cls.get_buffer()
+        if buffer is None:
+            cls.objects.add_seconds({key: seconds})
+            return
+        conn, buffer_key = buffer
+        conn.hincrbyfloat(buffer_key, '{}:{}:{}'.format(*key), seconds)
 
-        now = timezone.now()
-        start_time = cache.get(cache_name)
-        if start_time:
-            seconds_spent = now - start_time
-            time_spent.seconds += seconds_spent.total_seconds()
-            time_spent.save()
-            cache.delete(cache_name)
+    @classmethod
+    def flush_time_spent(cls):
+        """
+        Write all buffered seconds to the database in a single batch;
+        returns the number of objects updated. If the write fails, seconds
+        are returned to the buffer for the next flush.
+        """
+        buffer = cls.get_buffer()
+        if buffer is None:
+            return 0
+        conn, buffer_key = buffer
+
+        # read and clear atomically, so concurrent increments aren't lost
+        pipe = conn.pipeline()
+        pipe.hgetall(buffer_key)
+        pipe.delete(buffer_key)
+        buffered, _ = pipe.execute()
+        if not buffered:
+            return 0
+
+        deltas = {
+            tuple(int(v) for v in field.decode().split(':')): float(seconds)
+            for field, seconds in buffered.items()
+        }
+        try:
+            cls.objects.add_seconds(deltas)
+        except Exception:
+            pipe = conn.pipeline()
+            for field, seconds in buffered.items():
+                pipe.hincrbyfloat(buffer_key, field, float(seconds))
+            pipe.execute()
+            raise
+        return len(deltas)
 
 
 reversion.register(Assessment)
@@ -1,9 +1,13 @@
 import logging
 
 from django.apps import apps
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
 from django.dispatch import receiver
 
+from utils import counts
+
 from . import models
 
 
@@ -34,3 +38,64 @@ def default_configuration(sender, instance, created, **kwargs):
         apps.get_model('invitro', 'IVEndpointCategory').create_root(assessment_id=instance.pk)
 
     apps.get_model('mgmt', 'Task').objects.create_assessment_tasks(assessment=instance)
+
+
+@receiver(m2m_changed, sender=models.Assessment.project_manager.through)
+@receiver(m2m_changed, sender=models.Assessment.team_members.through)
+@receiver(m2m_changed, sender=models.Assessment.reviewers.through)
+def invalidate_member_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Clear cached assessment roles when team membership changes.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        assessment_ids = [instance.id]
+    elif action == 'pre_clear':
+        assessment_ids = list(
+            sender.objects
+                .filter(hawcuser=instance)
+                .values_list('assessment_id', flat=True)
+        )
+    else:
+        assessment_ids = list(pk_set)
+
+    cache_names = [
+        models.Assessment.get_roles_cache_name(assessment_id)
+        for assessment_id in assessment_ids
+    ]
+    # clear again on commit, in case roles were re-cached from a concurrent
+    # request before this transaction was committed
+    cache.delete_many(cache_names)
+    transaction.on_commit(lambda: cache.delete_many(cache_names))
+
+
+def increment_object_count(sender, instance, created, **kwargs):
+    """
+    Increment cached object counts when a tracked object is committed; a
+    save is only signaled for the child model, so parents are included.
+    """
+    if created:
+        assessment_id = counts.get_assessment_id(instance)
+        transaction.on_commit(
+            lambda: counts.increment(sender, assessment_id, 1, parents=True))
+
+
+def decrement_object_count(sender, instance, **kwargs):
+    """
+    Decrement cached object counts when a tracked object is deleted; parents
+    are deleted (and signaled) separately. The assessment is resolved before
+    related objects are deleted.
+    """
+    assessment_id = counts.get_assessment_id(instance)
+    transaction.on_commit(
+        lambda: counts.increment(sender, assessment_id, -1))
+
+
+for model in counts.get_counted_models():
+    label = model._meta.label
+    post_save.connect(increment_object_count, sender=model,
+                      dispatch_uid='increment-count-{}'.format(label))
+    pre_delete.connect(decrement_object_count, sender=model,
+                       dispatch_uid='decrement-count-{}'.format(label))
@@ -1,42 +1,30 @@
 from django.apps import apps
+from django.conf import settings
 from django.core.cache import cache
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
+from utils import counts
 from utils.chemspider import fetch_chemspider
 from utils.svg import SVGConverter
+from utils.warmup import WARM_CACHE_MODELS, CacheWarmer, get_warm_lock_name
 
 
 logger = get_task_logger(__name__)
 
 
 @shared_task
-def convert_to_svg(svg, url, width, height):
-    logger.info('Converting svg -> [css]+svg')
+def convert_and_cache(key, extension, svg, url, width, height):
+    logger.info('Converting svg -> {} [{}]'.format(extension, key))
     conv = SVGConverter(svg, url, width, height)
-    return conv.to_svg()
-
-
-@shared_task
-def convert_to_png(svg, url, width, height):
-    logger.info('Converting svg -> html -> png')
-    conv = SVGConverter(svg, url, width, height)
-    return conv.to_png()
-
-
-@shared_task
-def convert_to_pdf(svg, url, width, height):
-    logger.info('Converting svg -> html -> pdf')
-    conv = SVGConverter(svg, url, width, height)
-    return conv.to_pdf()
-
-
-@shared_task
-def convert_to_pptx(svg, url, width, height):
-    logger.info('Converting svg -> html -> png -> pptx')
-    conv = SVGConverter(svg, url, width, height)
-    return conv.to_pptx()
+    content = conv.convert(extension)
+    if content:
+        cache.set(key, {'status': 'done', 'content': content},
+                  settings.RASTERIZE_CACHE_TIMEOUT)
+    else:
+        # cache failures briefly, so a retry can be attempted
+        cache.set(key, {'status': 'error'}, 60)
 
 
 @shared_task
@@ -54,6 +42,26 @@ def get_chemspider_details(cas_number):
 
 
 @shared_task
-def add_time_spent(cache_name, object_id, assessment_id, content_type_id):
-    apps.get_model('assessment', 'TimeSpentEditing')\
-        .add_time_spent(cache_name, object_id, assessment_id, content_type_id)
+def flush_time_spent():
+    n = apps.get_model('assessment', 'TimeSpentEditing').flush_time_spent()
+    if n:
+        logger.info('Flushed time spent for {} objects'.format(n))
+    return n
+
+
+@shared_task
+def warm_cache(assessment_id, models=WARM_CACHE_MODELS):
+    logger.info('Warming cache for assessment {}'.format(assessment_id))
+    # changes made after this point require another warm-up
+    cache.delete(get_warm_lock_name(assessment_id, models))
+    coverage = CacheWarmer(assessment_id, models=models).warm()
+    for label, values in coverage.items():
+        logger.info('{}: {cached}/{total} cached ({percent}%)'.format(label, **values))
+    return coverage
+
+
+@shared_task
+def reconcile_counts():
+    n = counts.reconcile()
+    logger.info('Reconciled {} object counts'.format(n))
+    return n
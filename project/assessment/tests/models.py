@@ -1,7 +1,14 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
 
+from assessment import models
+from myuser.models import HAWCUser
+from utils import counts
+
 from . import utils
 
 
@@ -38,3 +45,84 @@ class AssessmentTests(TestCase):
             })
             self.assertTemplateUsed('assessment/assessment_detail.html')
             self.assertTrue(response.status_code in [200, 302])
+
+    def test_user_roles(self):
+        assessment = self.assessment_working
+        self.assertEqual(
+            assessment.get_user_roles(self.project_manager),
+            {models.Assessment.ROLE_PROJECT_MANAGER})
+        self.assertTrue(assessment.user_can_edit_object(self.team_member))
+        self.assertFalse(assessment.user_can_edit_object(self.reviewer))
+        self.assertTrue(assessment.user_can_view_object(self.reviewer))
+
+        # roles are memoized on the user
+        with self.assertNumQueries(0):
+            assessment.user_permissions(self.team_member)
+
+        # membership changes clear cached roles
+        assessment.reviewers.add(self.team_member)
+        team_member = HAWCUser.objects.get(id=self.team_member.id)
+        self.assertEqual(
+            assessment.get_user_roles(team_member),
+            {models.Assessment.ROLE_TEAM_MEMBER, models.Assessment.ROLE_REVIEWER})
+        self.reviewer.assessment_reviewers.clear()
+        reviewer = HAWCUser.objects.get(id=self.reviewer.id)
+        self.assertFalse(assessment.user_can_view_object(reviewer))
+
+
+class ObjectCountTests(TestCase):
+
+    def test_counted_models(self):
+        counted = counts.get_counted_models()
+        # inheritance parents and children of counted models are signaled
+        self.assertIn(models.BaseEndpoint, counted)
+        self.assertIn(apps.get_model('summary', 'DataPivotQuery'), counted)
+        self.assertNotIn(apps.get_model('lit', 'ReferenceTags'), counted)
+
+    def test_increment(self):
+        Endpoint = apps.get_model('animal', 'Endpoint')
+        keys = [
+            counts.get_key(Endpoint),
+            counts.get_key(models.BaseEndpoint),
+            counts.get_key(Endpoint, 1),
+        ]
+        cache.set_many({key: 5 for key in keys}, None)
+        try:
+            counts.increment(Endpoint, 1, 1, parents=True)
+            self.assertEqual(list(cache.get_many(keys).values()), [6, 6, 6])
+
+            counts.increment(Endpoint, None, -1)
+            self.assertEqual(cache.get_many(keys), {keys[0]: 5, keys[1]: 6, keys[2]: 6})
+
+            # counts which aren't cached are computed on read instead
+            cache.delete(keys[0])
+            counts.increment(Endpoint, None, 1)
+            self.assertIsNone(cache.get(keys[0]))
+        finally:
+            cache.delete_many(keys)
+
+
+class TimeSpentEditingTests(TestCase):
+
+    def setUp(self):
+        utils.build_assessments_for_permissions_testing(self)
+
+    def test_cache_name(self):
+        # cache names must match across web and worker processes
+        self.assertEqual(
+            models.TimeSpentEditing.get_cache_name('/url/', 'session'),
+            'time-spent-e11d52f065c206522b9184e712eb4f19')
+
+    def test_add_seconds(self):
+        assessment = self.assessment_working
+        content_type_id = ContentType.objects.get_for_model(assessment).id
+        key = (assessment.id, content_type_id, assessment.id)
+
+        models.TimeSpentEditing.objects.add_seconds({key: 5.})
+        models.TimeSpentEditing.objects.add_seconds({
+            key: 2.5,
+            (0, content_type_id, assessment.id): 1.,  # assessment doesn't exist
+        })
+        self.assertEqual(
+            list(models.TimeSpentEditing.objects.values_list('assessment_id', 'seconds')),
+            [(assessment.id, 7.5)])
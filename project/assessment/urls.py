@@ -89,6 +89,12 @@ urlpatterns = [
     url(r'^download-plot/$',
         views.DownloadPlot.as_view(),
         name='download_plot'),
+    url(r'^download-plot/(?P<job_id>[\w\-]+\.\w+)/$',
+        views.DownloadPlotStatus.as_view(),
+        name='download_plot_status'),
+    url(r'^download-plot/(?P<job_id>[\w\-]+\.\w+)/file/$',
+        views.DownloadPlotFile.as_view(),
+        name='download_plot_file'),
     url(r'^close-window/$',
         views.CloseWindow.as_view(),
         name='close_window'),
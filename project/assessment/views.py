@@ -1,14 +1,13 @@
 import json
-import logging
 
 from django.core.exceptions import PermissionDenied
-from django.db.models import Count
 from django.apps import apps
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.cache import cache
 from django.core.urlresolvers import reverse, reverse_lazy
 from django.conf import settings
-from django.http import HttpResponseRedirect, HttpResponseNotAllowed
+from django.http import (Http404, HttpResponseBadRequest,
+                         HttpResponseRedirect, HttpResponseNotAllowed)
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
@@ -20,6 +19,8 @@ from utils.views import (MessageMixin, LoginRequiredMixin, BaseCreate,
                          CloseIfSuccessMixin, BaseDetail, BaseUpdate,
                          BaseDelete, BaseList, TeamMemberOrHigherMixin,
                          ProjectManagerOrHigherMixin, TimeSpentOnPageMixin)
+from utils import counts
+from utils.svg import get_export_key
 
 from . import forms, models, tasks
 
@@ -37,108 +38,62 @@ class Home(TemplateView):
 class About(TemplateView):
     template_name = 'hawc/about.html'
 
+    COUNTED_MODELS = dict(
+        users='myuser.HAWCUser',
+        assessments='assessment.Assessment',
+        references='lit.Reference',
+        studies='study.Study',
+        endpoints='animal.Endpoint',
+        outcomes='epi.Outcome',
+        results='epi.Result',
+        visuals='summary.Visual',
+        datapivots='summary.DataPivot',
+    )
+
+    @staticmethod
+    def percent(numerator, denominator):
+        return numerator / float(denominator) if denominator else 0
+
     def get_object_counts(self):
-        key = 'about-counts'
-        counts = cache.get(key)
-        if counts is None:
-
-            updated = timezone.now()
-
-            users = apps.get_model('myuser', 'HAWCUser')\
-                .objects.count()
-
-            assessments = models.Assessment\
-                .objects.count()
-
-            references = apps.get_model('lit', 'Reference')\
-                .objects.count()
-
-            tags = apps.get_model('lit', 'ReferenceTags')\
-                .objects.count()
-
-            references_tagged = apps.get_model('lit', 'ReferenceTags')\
-                .objects.distinct('content_object_id').count()
-
-            assessments_with_studies = apps.get_model('study', 'Study')\
-                .objects.values_list('assessment_id', flat=True)\
-                .distinct().count()
-
-            studies = apps.get_model('study', 'Study')\
-                .objects.count()
-
-            rob_scores = apps.get_model('riskofbias', 'RiskOfBiasScore')\
-                .objects.count()
-
-            studies_with_rob = apps.get_model('study', 'Study')\
-                .objects.annotate(robc=Count('riskofbiases'))\
-                .filter(robc__gt=0).count()
-
-            endpoints = apps.get_model('animal', 'Endpoint')\
-                .objects.count()
-
-            endpoints_with_data = apps.get_model('animal', 'EndpointGroup')\
-                .objects.distinct('endpoint_id').count()
-
-            outcomes = apps.get_model('epi', 'Outcome')\
-                .objects.count()
-
-            results = apps.get_model('epi', 'Result')\
-                .objects.count()
-
-            results_with_data = apps.get_model('epi', 'GroupResult')\
-                .objects.distinct('result_id').count()
-
-            iv_endpoints = apps.get_model('invitro', 'IVEndpoint')\
-                .objects.count()
-
-            iv_endpoints_with_data = apps.get_model('invitro', 'IVEndpointGroup')\
-                .objects.distinct('endpoint_id').count()
-
-            visuals = apps.get_model('summary', 'Visual').objects.count() + \
-                apps.get_model('summary', 'DataPivot').objects.count()
-
-            assessments_with_visuals = len(set(
-                models.Assessment.objects\
-                .annotate(vc=Count('visuals'))
-                .filter(vc__gt=0)
-                .values_list('id', flat=True))
-                .union(set(models.Assessment.objects
-                       .annotate(dp=Count('datapivot'))
-                       .filter(dp__gt=0)
-                       .values_list('id', flat=True))))
-
-            counts = dict(
-                updated=updated,
-                users=users,
-                assessments=assessments,
-                references=references,
-                tags=tags,
-                references_tagged=references_tagged,
-                references_tagged_percent=references_tagged / float(references),
-                studies=studies,
-                assessments_with_studies=assessments_with_studies,
-                assessments_with_studies_percent=assessments_with_studies / float(assessments),
-                rob_scores=rob_scores,
-                studies_with_rob=studies_with_rob,
-                studies_with_rob_percent=studies_with_rob / float(studies),
-                endpoints=endpoints,
-                endpoints_with_data=endpoints_with_data,
-                endpoints_with_data_percent=endpoints_with_data / float(endpoints),
-                outcomes=outcomes,
-                results=results,
-                results_with_data=results_with_data,
-                results_with_data_percent=results_with_data / float(results),
-                iv_endpoints=0,
-                iv_endpoints_with_data=0,
-                iv_endpoints_with_data_percent=0,
-                visuals=visuals,
-                assessments_with_visuals=assessments_with_visuals,
-                assessments_with_visuals_percent=assessments_with_visuals / float(assessments),
-            )
-            cache_duration = 60 * 60 * 24  # one day
-            cache.set(key, counts, cache_duration)  # cache for one day
-            logging.info('Setting about-page cache')
-        return counts
+        models = {
+            name: apps.get_model(label)
+            for name, label in self.COUNTED_MODELS.items()
+        }
+        model_counts = counts.get_counts(models.values())
+        c = {name: model_counts[model] for name, model in models.items()}
+        c.update(counts.get_coverage())
+        c['visuals'] += c.pop('datapivots')
+
+        return dict(
+            updated=timezone.now(),
+            users=c['users'],
+            assessments=c['assessments'],
+            references=c['references'],
+            tags=c['tags'],
+            references_tagged=c['references_tagged'],
+            references_tagged_percent=self.percent(c['references_tagged'], c['references']),
+            studies=c['studies'],
+            assessments_with_studies=c['assessments_with_studies'],
+            assessments_with_studies_percent=self.percent(
+                c['assessments_with_studies'], c['assessments']),
+            rob_scores=c['rob_scores'],
+            studies_with_rob=c['studies_with_rob'],
+            studies_with_rob_percent=self.percent(c['studies_with_rob'], c['studies']),
+            endpoints=c['endpoints'],
+            endpoints_with_data=c['endpoints_with_data'],
+            endpoints_with_data_percent=self.percent(c['endpoints_with_data'], c['endpoints']),
+            outcomes=c['outcomes'],
+            results=c['results'],
+            results_with_data=c['results_with_data'],
+            results_with_data_percent=self.percent(c['results_with_data'], c['results']),
+            iv_endpoints=0,
+            iv_endpoints_with_data=0,
+            iv_endpoints_with_data_percent=0,
+            visuals=c['visuals'],
+            assessments_with_visuals=c['assessments_with_visuals'],
+            assessments_with_visuals_percent=self.percent(
+                c['assessments_with_visuals'], c['assessments']),
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -369,25 +324,14 @@ class BaseEndpointList(BaseList):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        eps = self.model.endpoint\
-            .related.related_model.objects\
-            .get_qs(self.assessment.id)\
-            .count()
-
-        os = self.model.outcome\
-            .related.related_model.objects\
-            .get_qs(self.assessment.id)\
-            .count()
-
-        mrs = apps.get_model('epimeta', 'metaresult')\
-            .objects\
-            .get_qs(self.assessment.id)\
-            .count()
-
-        iveps = self.model.ivendpoint\
-            .related.related_model.objects\
-            .get_qs(self.assessment.id)\
-            .count()
+        models = [
+            self.model.endpoint.related.related_model,
+            self.model.outcome.related.related_model,
+            apps.get_model('epimeta', 'metaresult'),
+            self.model.ivendpoint.related.related_model,
+        ]
+        c = counts.get_counts(models, self.assessment.id)
+        eps, os, mrs, iveps = [c[model] for model in models]
 
         alleps = eps + os + mrs + iveps
 
@@ -454,6 +398,10 @@ class UpdateSession(View):
 
 
 class DownloadPlot(FormView):
+    """
+    Queue a figure export and return a job id; the same figure exported
+    again shares the job (and its cached output) instead of re-rendering.
+    """
 
     http_method_names = ['post', ]
 
@@ -462,45 +410,74 @@ class DownloadPlot(FormView):
         return super().dispatch(*args, **kwargs)
 
     EXPORT_CROSSWALK = {
-        'svg': {
-            'fn': tasks.convert_to_svg,
-            'ct': 'image/svg+xml',
-        },
-        'png': {
-            'fn': tasks.convert_to_png,
-            'ct': 'application/png',
-        },
-        'pdf': {
-            'fn': tasks.convert_to_pdf,
-            'ct': 'application/pdf',
-        },
-        'pptx': {
-            'fn': tasks.convert_to_pptx,
-            'ct': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',  # noqa
-        },
+        'svg': 'image/svg+xml',
+        'png': 'application/png',
+        'pdf': 'application/pdf',
+        'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',  # noqa
     }
 
     def post(self, request, *args, **kwargs):
 
-        # default response
-        response = HttpResponse('<p>An error in processing occurred.</p>')
-
-        # grab input values and create converter object
+        # grab input values
         extension = request.POST.get('output', None)
+        if extension not in self.EXPORT_CROSSWALK:
+            return HttpResponseBadRequest('Unknown output format')
+
         svg = request.POST['svg']
         url = request.META['HTTP_REFERER']
         width = int(float(request.POST['width']) * 5)
         height = int(float(request.POST['height']) * 5)
 
-        handler = self.EXPORT_CROSSWALK.get(extension, None)
-        if handler:
-            task = handler['fn'].delay(svg, url, width, height)
-            output = task.get(timeout=90)
-            if output:
-                response = HttpResponse(output, content_type=handler['ct'])
-                response['Content-Disposition'] = \
-                    'attachment; filename="download.{}"'.format(extension)
+        key = get_export_key(svg, url, width, height, extension)
+
+        # only queue a conversion if no output (or in-progress job) exists
+        if cache.add(key, {'status': 'pending'}, settings.RASTERIZE_TIMEOUT * 2):
+            tasks.convert_and_cache.delay(key, extension, svg, url, width, height)
+
+        job_id = '{}.{}'.format(key, extension)
+        v = {
+            'job_id': job_id,
+            'url': reverse('assessment:download_plot_status', args=(job_id, )),
+        }
+        return HttpResponse(json.dumps(v), content_type="application/json")
 
+
+class DownloadPlotMixin(object):
+
+    def get_export(self, job_id):
+        key, _, extension = job_id.rpartition('.')
+        if extension not in DownloadPlot.EXPORT_CROSSWALK:
+            raise Http404()
+        value = cache.get(key)
+        if value is None:
+            raise Http404()
+        return extension, value
+
+
+class DownloadPlotStatus(DownloadPlotMixin, View):
+    http_method_names = ['get', ]
+
+    def get(self, request, *args, **kwargs):
+        _, value = self.get_export(kwargs['job_id'])
+        v = {'status': value['status']}
+        if value['status'] == 'done':
+            v['url'] = reverse(
+                'assessment:download_plot_file', args=(kwargs['job_id'], ))
+        return HttpResponse(json.dumps(v), content_type="application/json")
+
+
+class DownloadPlotFile(DownloadPlotMixin, View):
+    http_method_names = ['get', ]
+
+    def get(self, request, *args, **kwargs):
+        extension, value = self.get_export(kwargs['job_id'])
+        if value['status'] != 'done':
+            raise Http404()
+        response = HttpResponse(
+            value['content'],
+            content_type=DownloadPlot.EXPORT_CROSSWALK[extension])
+        response['Content-Disposition'] = \
+            'attachment; filename="download.{}"'.format(extension)
         return response
 
 
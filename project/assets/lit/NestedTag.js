@@ -2,8 +2,6 @@ import $ from '$';
 
 import Observee from 'utils/Observee';
 
-import Reference from './Reference';
-
 
 class NestedTag extends Observee {
 
@@ -86,15 +84,7 @@ class NestedTag extends Observee {
             .printf(window.assessment_pk, this.data.pk);
         if (window.search_id) url += '?search_id={0}'.printf(window.search_id);
 
-        $.get(url, function(results){
-            if(results.status=='success'){
-                var refs = [];
-                results.refs.forEach(function(datum){refs.push(new Reference(datum, window.tagtree));});
-                reference_viewer.set_references(refs);
-            } else {
-                reference_viewer.set_error();
-            }
-        });
+        reference_viewer.load_references(url);
     }
 
     get_option_item(lst){
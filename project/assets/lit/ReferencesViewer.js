@@ -21,6 +21,33 @@ class ReferencesViewer {
         this._build_reference_table();
     }
 
+    load_references(url, page=1){
+        // fetch a page of references; additional pages are appended on request
+        $.get(url, {page}, (results) => {
+            if(results.status !== 'success') return this.set_error();
+            let refs = results.refs.map((d) => new Reference(d, window.tagtree));
+            if(page === 1){
+                this.set_references(refs);
+            } else {
+                this.refs.push(...refs.sort(Reference.sortCompare));
+                this.$table_div.append(refs.map((d) => d.print_div_row()));
+            }
+            this._set_more_button(url, results);
+        }).fail(() => this.set_error());
+    }
+
+    _set_more_button(url, results){
+        this.$div.find('.load_more').remove();
+        if(results.page >= results.num_pages) return;
+        $('<button type="button" class="btn btn-small load_more">')
+            .text('Show more references ({0} of {1} shown)'.printf(this.refs.length, results.count))
+            .on('click', (e) => {
+                $(e.target).prop('disabled', true);
+                this.load_references(url, results.page + 1);
+            })
+            .insertAfter(this.$table_div);
+    }
+
     set_error(){
         this.$table_div.html('<p>An error has occurred</p>');
     }
@@ -5,7 +5,6 @@ import d3 from 'd3';
 import Observee from 'utils/Observee';
 
 import NestedTag from './NestedTag';
-import Reference from './Reference';
 
 
 class TagTree extends Observee {
@@ -117,17 +116,7 @@ class TagTree extends Observee {
         var url = '/lit/assessment/{0}/references/untagged/json/'.printf(window.assessment_pk);
         if (window.search_id) url += '?search_id={0}'.printf(window.search_id);
 
-        $.get(url, function(results){
-            if(results.status=='success'){
-                var refs = [];
-                results.refs.forEach(function(datum){
-                    refs.push(new Reference(datum, window.tagtree));
-                });
-                reference_viewer.set_references(refs);
-            } else {
-                reference_viewer.set_error();
-            }
-        });
+        reference_viewer.load_references(url);
     }
 
     get_tag(pk){
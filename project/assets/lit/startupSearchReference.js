@@ -16,6 +16,10 @@ let startupSearchReference = function(assessment_id, tags, canEdit){
                 let refs = results.refs
                     .map((d) => new Reference(d, window.tagtree));
                 refviewer.set_references(refs);
+                if(results.count > refs.length){
+                    $('#search_context').append(
+                        `<p class="help-block">Showing the first ${refs.length} of ${results.count} matching references; refine the search to narrow the results.</p>`);
+                }
             } else {
                 refviewer.set_error();
             }
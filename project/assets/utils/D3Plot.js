@@ -494,15 +494,35 @@ class D3Plot {
     }
 
     _download_image(options){
+        // queue an export, then poll until the file is ready to download
         var svg_blob = this._save_to_svg(),
-            form = $('<form style="display: none;" action="/assessment/download-plot/" method="post"></form>')
-                .html([
-                    '<input name="height" value="{0}">'.printf(svg_blob.height),
-                    '<input name="width" value="{0}">'.printf(svg_blob.width),
-                    '<input name="svg" value="{0}">'.printf(btoa(escape(svg_blob.source[0]))),
-                    '<input name="output" value="{0}">'.printf(options.format),
-                ]);
-        form.appendTo('body').submit();
+            data = {
+                height: svg_blob.height,
+                width: svg_blob.width,
+                svg: btoa(escape(svg_blob.source[0])),
+                output: options.format,
+            },
+            maxTries = 90,
+            onError = function(){
+                alert('An error occurred exporting this visualization.');
+            },
+            poll = function(url, tries){
+                $.get(url)
+                    .done(function(d){
+                        if (d.status === 'done'){
+                            window.location = d.url;
+                        } else if (d.status === 'pending' && tries < maxTries){
+                            window.setTimeout(function(){poll(url, tries + 1);}, 1000);
+                        } else {
+                            onError();
+                        }
+                    })
+                    .fail(onError);
+            };
+
+        $.post('/assessment/download-plot/', data)
+            .done(function(d){poll(d.url, 0);})
+            .fail(onError);
     }
 
     _save_to_svg(){
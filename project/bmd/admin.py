@@ -24,8 +24,14 @@ class SelectedModelAdmin(AllListFieldAdmin):
     pass
 
 
+class ResultCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'bmds_version', 'model_name', 'hits', 'created', 'last_used')
+    list_filter = ('bmds_version', 'model_name')
+
+
 admin.site.register(models.AssessmentSettings, AssessmentSettingsAdmin)
 admin.site.register(models.LogicField, LogicFieldAdmin)
 admin.site.register(models.Session, SessionAdmin)
 admin.site.register(models.Model, ModelAdmin)
-admin.site.register(models.SelectedModel, SelectedModelAdmin)
\ No newline at end of file
+admin.site.register(models.SelectedModel, SelectedModelAdmin)
+admin.site.register(models.ResultCache, ResultCacheAdmin)
\ No newline at end of file
@@ -1,7 +1,9 @@
+from django.db import transaction
+from rest_framework import exceptions
 from rest_framework.decorators import detail_route
 from rest_framework.response import Response
 
-from assessment.api import AssessmentViewset
+from assessment.api import AssessmentViewset, get_assessment_from_query
 from . import models, serializers, tasks
 
 
@@ -39,3 +41,25 @@ class Session(AssessmentViewset):
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response({'status': True})
+
+
+class BatchExecution(AssessmentViewset):
+    """
+    Execute BMD sessions with default settings for many endpoints; the
+    batch status is polled until execution is finished.
+    """
+    assessment_filter_args = "assessment"
+    model = models.BatchExecution
+    serializer_class = serializers.BatchExecutionSerializer
+
+    def create(self, request):
+        self.assessment = get_assessment_from_query(request)
+        if self.assessment is None or \
+                not self.assessment.user_can_edit_object(request.user):
+            raise exceptions.PermissionDenied()
+        serializer = serializers.BatchExecutionCreateSerializer(
+            data=request.data, context={'assessment': self.assessment})
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            batch = serializer.save()
+        return Response(self.get_serializer(batch).data)
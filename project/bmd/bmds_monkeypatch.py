@@ -6,7 +6,9 @@ have a different workaround for execution.
 """
 from bmds.monkeypatch import _get_payload, _set_results
 from bmds import BMDS
+import collections
 from datetime import datetime
+from django.apps import apps
 from django.conf import settings
 import time
 import requests
@@ -16,23 +18,32 @@ class JobException(Exception):
     pass
 
 
+def _get_requests_session(api_token):
+    s = requests.Session()
+    s.headers.update({
+        "Authorization": f"Token {api_token}",
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    })
+    return s
+
+
+def _submit_job(s, url, data):
+    response = s.post(url, data=data)
+    if response.status_code in [400, 403]:
+        raise JobException(response.json()['detail'])
+    return response.json()['url']
+
+
 def run_job(url, data, api_token, interval=3, timeout=60):
     # https://gist.github.com/shapiromatron/0f04fa1f2626229cce28b06b02b7af4f
-    with requests.Session() as s:
-        s.headers.update({
-            "Authorization": f"Token {api_token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        })
+    with _get_requests_session(api_token) as s:
 
         # initial job request
-        response = s.post(url, data=data)
-        if response.status_code in [400, 403]:
-            raise JobException(response.json()['detail'])
+        job_url = _submit_job(s, url, data)
 
         # poll response until job is complete or client-timeout
         wait_time = 0
-        job_url = response.json()['url']
         while True:
             time.sleep(interval)
             response = s.get(job_url).json()
@@ -48,29 +59,116 @@ def run_job(url, data, api_token, interval=3, timeout=60):
                 raise JobException('Client timeout')
 
 
-def execute(self):
+def run_jobs(url, payloads, api_token, max_jobs=8, interval=3, timeout=600):
+    """
+    Run many jobs, with at most `max_jobs` submitted to the job-runner at
+    once; all running jobs are polled from a single loop.
+
+    `payloads` is an iterable of (key, data) tuples. Yields a tuple of
+    (key, outputs, error) as each job finishes, where either the outputs or
+    the JobException is None.
+    """
+    payloads = iter(payloads)
+    running = collections.OrderedDict()  # key -> [job_url, wait_time]
+    with _get_requests_session(api_token) as s:
+        while True:
+
+            # submit jobs until the limit is reached
+            while len(running) < max_jobs:
+                item = next(payloads, None)
+                if item is None:
+                    break
+                key, data = item
+                try:
+                    running[key] = [_submit_job(s, url, data), 0]
+                except (JobException, requests.RequestException, ValueError) as err:
+                    yield key, None, JobException(str(err))
+
+            if len(running) == 0:
+                return
+
+            # poll all running jobs
+            time.sleep(interval)
+            for key in list(running.keys()):
+                job_url, wait_time = running[key]
+                try:
+                    response = s.get(job_url).json()
+                except (requests.RequestException, ValueError):
+                    # retry on next poll; transient job-runner errors
+                    response = {'is_finished': False}
+
+                if response['is_finished']:
+                    del running[key]
+                    if response['has_errors']:
+                        yield key, None, JobException(response['errors'])
+                    else:
+                        yield key, response['outputs'], None
+                elif wait_time + interval > timeout:
+                    del running[key]
+                    yield key, None, JobException('Client timeout')
+                else:
+                    running[key][1] = wait_time + interval
+
+
+def _get_cache_key(model):
+    ResultCache = apps.get_model('bmd', 'ResultCache')
+    return ResultCache.get_key(model.bmds_version_dir, model.model_name, model.as_dfile())
+
+
+def prepare(self):
+    """
+    Return the models which must be executed, and the job payload for those
+    models (None if no models need to be executed). Models with cached
+    results are set without execution.
+    """
     start_time = datetime.now()
-    executable_models = []
+    candidates = []
     for model in self.models:
         model.execution_start = start_time
         if model.can_be_executed:
-            executable_models.append(model)
+            model._cache_key = _get_cache_key(model)
+            candidates.append(model)
         else:
             _set_results(model)
 
+    cached = apps.get_model('bmd', 'ResultCache').objects\
+        .get_results([model._cache_key for model in candidates])
+    executable_models = []
+    for model in candidates:
+        if model._cache_key in cached:
+            _set_results(model, cached[model._cache_key])
+        else:
+            executable_models.append(model)
+
     if len(executable_models) == 0:
+        return executable_models, None
+
+    return executable_models, _get_payload(executable_models)
+
+
+def set_results(executable_models, response):
+    apps.get_model('bmd', 'ResultCache').objects.set_results([
+        (model._cache_key, model.bmds_version_dir, model.model_name, results)
+        for model, results in zip(executable_models, response)
+    ])
+
+    # parse results for each model
+    for model, results in zip(executable_models, response):
+        _set_results(model, results)
+
+
+def execute(self):
+    executable_models, payload = prepare(self)
+    if payload is None:
         return
 
     response = run_job(
         settings.BMDS_SUBMISSION_URL,
-        _get_payload(executable_models),
+        payload,
         settings.BMDS_TOKEN,
         interval=3, timeout=120
     )
-
-    # parse results for each model
-    for model, results in zip(executable_models, response):
-        _set_results(model, results)
+    set_results(executable_models, response)
 
 
-BMDS.execute = execute
\ No newline at end of file
+BMDS.execute = execute
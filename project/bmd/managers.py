@@ -1,3 +1,11 @@
+from copy import deepcopy
+
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.utils.timezone import now
+
+from bmds.models.base import RunStatus
+
 from utils.models import BaseManager
 
 
@@ -13,8 +21,80 @@ class SessionManager(BaseManager):
     assessment_relation = 'endpoint__assessment'
 
 
+class BatchExecutionManager(BaseManager):
+    assessment_relation = 'assessment'
+
+
 class ModelManager(BaseManager):
     assessment_relation = 'session__endpoint__assessment'
 
 class SelectedModelManager(BaseManager):
     assessment_relation = 'endpoint__assessment'
+
+
+class ResultCacheManager(models.Manager):
+    MISSES_CACHE_NAME = 'bmd-result-cache-misses'
+
+    def get_results(self, keys):
+        """
+        Return a dictionary of {key: results} for cached keys; hits are
+        recorded for each key found, and misses for each key not found.
+        """
+        results = dict(
+            self.filter(key__in=keys).values_list('key', 'results')
+        )
+        if results:
+            self.filter(key__in=results.keys())\
+                .update(hits=models.F('hits') + 1, last_used=now())
+        misses = len(set(keys) - set(results))
+        if misses:
+            self._record_misses(misses)
+        return {key: deepcopy(value) for key, value in results.items()}
+
+    def _record_misses(self, count):
+        name = self.MISSES_CACHE_NAME
+        if not cache.add(name, count, timeout=None):
+            try:
+                cache.incr(name, count)
+            except ValueError:
+                # evicted since add
+                cache.set(name, count, timeout=None)
+
+    def set_results(self, items):
+        """
+        Cache results, given a list of (key, bmds_version, model_name, results)
+        tuples; keys which are already cached are unchanged. Only successful
+        executions are cached; failures may be transient and are retried.
+        """
+        existing = set(
+            self.filter(key__in=[item[0] for item in items])
+                .values_list('key', flat=True)
+        )
+        objects = {
+            key: self.model(
+                key=key,
+                bmds_version=bmds_version,
+                model_name=model_name,
+                results=deepcopy(results))
+            for key, bmds_version, model_name, results in items
+            if key not in existing and results is not None and
+            results.get('status') == RunStatus.SUCCESS
+        }
+        try:
+            with transaction.atomic():
+                self.bulk_create(objects.values())
+        except IntegrityError:
+            # cached concurrently by another execution
+            pass
+
+    def get_stats(self):
+        """
+        Return the number of cached results, and the number of cache hits
+        and misses.
+        """
+        stats = self.aggregate(entries=models.Count('id'), hits=models.Sum('hits'))
+        return {
+            'entries': stats['entries'],
+            'hits': stats['hits'] or 0,
+            'misses': cache.get(self.MISSES_CACHE_NAME, 0),
+        }
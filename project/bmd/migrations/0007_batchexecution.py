@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessment', '0001_initial'),
+        ('bmd', '0006_auto_20180403_1044'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchExecution',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Queued'), (1, 'Running'), (2, 'Done'), (3, 'Failed')], default=0)),
+                ('total', models.PositiveIntegerField(default=0, help_text='Number of sessions to be executed')),
+                ('completed', models.PositiveIntegerField(default=0, help_text='Number of sessions successfully executed')),
+                ('failed', models.PositiveIntegerField(default=0, help_text='Number of sessions which could not be executed')),
+                ('message', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bmd_batches', to='assessment.Assessment')),
+                ('sessions', models.ManyToManyField(related_name='batches', to='bmd.Session')),
+            ],
+            options={
+                'ordering': ('-created',),
+                'get_latest_by': 'created',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bmd', '0007_batchexecution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('bmds_version', models.CharField(max_length=16)),
+                ('model_name', models.CharField(max_length=25)),
+                ('results', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('-last_used',),
+            },
+        ),
+    ]
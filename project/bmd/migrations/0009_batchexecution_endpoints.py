@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animal', '0029_endpointgroupflat'),
+        ('bmd', '0008_resultcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchexecution',
+            name='endpoints',
+            field=models.ManyToManyField(related_name='bmd_batches', to='animal.Endpoint'),
+        ),
+    ]
@@ -1,16 +1,19 @@
 import base64
 import collections
+from copy import deepcopy
+import hashlib
 import json
+import logging
 import os
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
 from django.core.urlresolvers import reverse_lazy
 from django.utils.timezone import now
 
 from utils.models import get_crumbs
-from . import managers
+from . import bmds_monkeypatch, managers, tasks
 
 import bmds
 
@@ -197,18 +200,61 @@ class Session(models.Model):
             dose_units_id=dose_units,
             version=version)
 
+    @classmethod
+    def create_default(cls, endpoint):
+        """
+        Create a new session with the default BMR and all available models,
+        using default model settings.
+        """
+        instance = cls.create_new(endpoint)
+        session = instance.get_session()
+        instance.bmrs = deepcopy(session.get_bmr_options()[:1])
+        instance.save()
+        instance.set_models([
+            {'name': option['name'], 'overrides': {}}
+            for option in session.get_model_options()
+        ])
+        return instance
+
+    def set_models(self, model_settings):
+        """
+        Replace models in this session; one model is created for each BMR and
+        model-setting.
+        """
+        self.models.all().delete()
+        objects = []
+        for i, bmr in enumerate(self.bmrs):
+            bmr_overrides = self.get_bmr_overrides(self.get_session(), i)
+            for j, setting in enumerate(model_settings):
+                overrides = deepcopy(setting['overrides'])
+                overrides.update(bmr_overrides)
+                obj = Model(
+                    session=self,
+                    bmr_id=i,
+                    model_id=j,
+                    name=setting['name'],
+                    overrides=overrides,
+                )
+                objects.append(obj)
+        Model.objects.bulk_create(objects)
+
     @property
     def is_finished(self):
         return self.date_executed is not None
 
     def execute(self):
+        self.reset_execution()
+        session = self.get_session(with_models=True)
+        session.execute()
+        self.save_execution(session)
+
+    def reset_execution(self):
         # reset execution datestamp if needed
         if self.date_executed is not None:
             self.date_executed = None
             self.save()
 
-        session = self.get_session(with_models=True)
-        session.execute()
+    def save_execution(self, session):
         self.date_executed = now()
         for model, resp in zip(self.models.all(), session.models):
             assert model.id == resp.id
@@ -315,6 +361,178 @@ class Session(models.Model):
         if self.endpoint is not None:
             return self.endpoint.get_study()
 
+
+class BatchExecution(models.Model):
+    """
+    Background execution of BMD sessions for many endpoints; sessions are
+    run concurrently on the job-runner, and progress is aggregated.
+    """
+    objects = managers.BatchExecutionManager()
+
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    assessment = models.ForeignKey(
+        'assessment.Assessment',
+        related_name='bmd_batches')
+    endpoints = models.ManyToManyField(
+        'animal.Endpoint',
+        related_name='bmd_batches')
+    sessions = models.ManyToManyField(
+        Session,
+        related_name='batches')
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES,
+        default=QUEUED)
+    total = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of sessions to be executed")
+    completed = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of sessions successfully executed")
+    failed = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of sessions which could not be executed")
+    message = models.TextField(
+        blank=True)
+    created = models.DateTimeField(
+        auto_now_add=True)
+    last_updated = models.DateTimeField(
+        auto_now=True)
+
+    class Meta:
+        ordering = ('-created', )
+        get_latest_by = 'created'
+
+    def __str__(self):
+        return 'BMD batch ({})'.format(self.get_status_display())
+
+    def get_assessment(self):
+        return self.assessment
+
+    @property
+    def is_finished(self):
+        return self.status in [self.DONE, self.FAILED]
+
+    @classmethod
+    def create_for_endpoints(cls, assessment, endpoints):
+        """
+        Create a batch for the endpoints, and queue execution once the
+        current transaction is committed; sessions are created by the task.
+        """
+        batch = cls.objects.create(assessment=assessment, total=len(endpoints))
+        batch.endpoints.add(*endpoints)
+        transaction.on_commit(lambda: tasks.execute_batch.delay(batch.id))
+        return batch
+
+    def create_sessions(self):
+        """
+        Create a new session with default settings for each endpoint.
+        """
+        sessions = [
+            Session.create_default(endpoint)
+            for endpoint in self.endpoints.select_related('assessment__bmd_settings')
+        ]
+        self.sessions.add(*sessions)
+
+    def update_progress(self, completed, failed):
+        self.completed = completed
+        self.failed = failed
+        self.save(update_fields=['completed', 'failed', 'last_updated'])
+
+    def get_payloads(self, sessions):
+        # yields (session_id, payload) and saves sessions without executable models
+        for session in sessions.values():
+            session.reset_execution()
+            bmds_session = session.get_session(with_models=True)
+            executable_models, payload = bmds_monkeypatch.prepare(bmds_session)
+            if payload is None:
+                session.save_execution(bmds_session)
+                self.update_progress(self.completed + 1, self.failed)
+                continue
+            session._executable_models = executable_models
+            yield session.id, payload
+
+    def run(self):
+        self.status = self.RUNNING
+        self.save()
+
+        try:
+            with transaction.atomic():
+                self.create_sessions()
+            sessions = collections.OrderedDict(
+                (session.id, session)
+                for session in self.sessions
+                    .select_related('endpoint__assessment__bmd_settings')
+                    .prefetch_related('models')
+            )
+            jobs = bmds_monkeypatch.run_jobs(
+                settings.BMDS_SUBMISSION_URL,
+                self.get_payloads(sessions),
+                settings.BMDS_TOKEN,
+                max_jobs=settings.BMDS_MAX_JOBS)
+            for session_id, outputs, error in jobs:
+                session = sessions[session_id]
+                if error is None:
+                    bmds_monkeypatch.set_results(session._executable_models, outputs)
+                    session.save_execution(session.get_session())
+                    self.update_progress(self.completed + 1, self.failed)
+                else:
+                    logging.warning('BMD session {} failed: {}'.format(session_id, error))
+                    self.update_progress(self.completed, self.failed + 1)
+            self.status = self.DONE
+        except Exception as err:
+            logging.exception('BMD batch execution failed: {}'.format(self.id))
+            self.status = self.FAILED
+            self.message = str(err)
+
+        self.save()
+
+
+class ResultCache(models.Model):
+    """
+    Results from the BMDS job-runner, addressed by a hash of the BMDS version,
+    model name, and model input file; the input file includes the dataset,
+    model settings, and BMR. Unchanged models are never executed twice.
+    """
+    objects = managers.ResultCacheManager()
+
+    key = models.CharField(
+        max_length=64,
+        unique=True)
+    bmds_version = models.CharField(
+        max_length=16)
+    model_name = models.CharField(
+        max_length=25)
+    results = JSONField(
+        default=dict)
+    hits = models.PositiveIntegerField(
+        default=0)
+    created = models.DateTimeField(
+        auto_now_add=True)
+    last_used = models.DateTimeField(
+        auto_now_add=True)
+
+    class Meta:
+        ordering = ('-last_used', )
+
+    def __str__(self):
+        return '{} {}'.format(self.bmds_version, self.model_name)
+
+    @staticmethod
+    def get_key(bmds_version, model_name, dfile):
+        content = json.dumps([bmds_version, model_name, dfile])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
 class Model(models.Model):
     objects = managers.ModelManager()
 
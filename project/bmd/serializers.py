@@ -1,4 +1,4 @@
-from copy import deepcopy
+from django.apps import apps
 from jsonschema import validate, ValidationError
 from rest_framework import serializers
 
@@ -59,6 +59,46 @@ class SessionSerializer(serializers.ModelSerializer):
         )
 
 
+class BatchExecutionSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source='get_status_display', read_only=True)
+    is_finished = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = models.BatchExecution
+        fields = (
+            'id', 'assessment', 'endpoints', 'sessions', 'status', 'is_finished',
+            'total', 'completed', 'failed', 'message',
+            'created', 'last_updated',
+        )
+
+
+class BatchExecutionCreateSerializer(serializers.Serializer):
+    endpoint_ids = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1)
+
+    def validate_endpoint_ids(self, value):
+        if not self.context['assessment'].enable_bmd:
+            raise serializers.ValidationError('BMD modeling is not enabled for this assessment.')
+        Endpoint = apps.get_model('animal', 'Endpoint')
+        endpoints = list(
+            Endpoint.objects
+                .filter(id__in=value, assessment=self.context['assessment'])
+                .prefetch_related('groups')
+        )
+        if len(endpoints) != len(set(value)):
+            raise serializers.ValidationError('Endpoints must be in the same assessment.')
+        invalid = [endpoint.id for endpoint in endpoints if not endpoint.bmd_modeling_possible]
+        if invalid:
+            raise serializers.ValidationError(
+                'BMD modeling is not possible for endpoints: {}.'.format(
+                    ', '.join(str(id_) for id_ in sorted(invalid))))
+        return endpoints
+
+    def save(self):
+        return models.BatchExecution.create_for_endpoints(
+            self.context['assessment'], self.validated_data['endpoint_ids'])
+
+
 class SessionUpdateSerializer(serializers.Serializer):
     bmrs = serializers.JSONField()
     modelSettings = serializers.JSONField()
@@ -111,24 +151,7 @@ class SessionUpdateSerializer(serializers.Serializer):
         self.instance.date_executed = None
         self.instance.dose_units_id = self.validated_data['dose_units']
         self.instance.save()
-
-        self.instance.models.all().delete()
-        objects = []
-        for i, bmr in enumerate(self.validated_data['bmrs']):
-            bmr_overrides = self.instance.get_bmr_overrides(
-                self.instance.get_session(), i)
-            for j, settings in enumerate(self.validated_data['modelSettings']):
-                overrides = deepcopy(settings['overrides'])
-                overrides.update(bmr_overrides)
-                obj = models.Model(
-                    session=self.instance,
-                    bmr_id=i,
-                    model_id=j,
-                    name=settings['name'],
-                    overrides=overrides,
-                )
-                objects.append(obj)
-        models.Model.objects.bulk_create(objects)
+        self.instance.set_models(self.validated_data['modelSettings'])
 
 
 class SelectedModelUpdateSerializer(serializers.ModelSerializer):
@@ -10,3 +10,9 @@ def execute(session_id):
     logger.info('BMD execution -> {}'.format(session_id))
     session = apps.get_model('bmd', 'Session').objects.get(id=session_id)
     session.execute()
+
+
+@shared_task
+def execute_batch(batch_id):
+    logger.info('BMD batch execution -> {}'.format(batch_id))
+    apps.get_model('bmd', 'BatchExecution').objects.get(id=batch_id).run()
@@ -0,0 +1,151 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+
+from bmds.models.base import RunStatus
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from animal.tests.utils import build_endpoints_for_permission_testing
+from bmd import bmds_monkeypatch, models, serializers
+
+
+class JobRunnerStandIn(BaseHTTPRequestHandler):
+    # local stand-in for the BMDS job-runner; each job finishes after being
+    # polled twice, and jobs with "error" in their payload fail
+    jobs = {}
+    max_running = 0
+    lock = threading.Lock()
+
+    def _respond(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode('utf-8'))
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        data = json.loads(self.rfile.read(length).decode('utf-8'))
+        with self.lock:
+            job_id = str(len(self.jobs))
+            self.jobs[job_id] = {'data': data, 'polls': 0}
+            running = sum(1 for job in self.jobs.values() if job['polls'] < 2)
+            JobRunnerStandIn.max_running = max(self.max_running, running)
+        self._respond({'url': 'http://{}:{}/job/{}/'.format(
+            *self.server.server_address, job_id)})
+
+    def do_GET(self):
+        job_id = self.path.strip('/').split('/')[-1]
+        with self.lock:
+            job = self.jobs[job_id]
+            job['polls'] += 1
+            finished = job['polls'] >= 2
+        has_errors = finished and job['data'].get('error', False)
+        self._respond({
+            'is_finished': finished,
+            'has_errors': has_errors,
+            'errors': 'failed' if has_errors else None,
+            'outputs': [job['data']['value'] * 2] if finished else None,
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+class RunJobsTest(SimpleTestCase):
+
+    def setUp(self):
+        JobRunnerStandIn.jobs = {}
+        JobRunnerStandIn.max_running = 0
+        self.server = HTTPServer(('127.0.0.1', 0), JobRunnerStandIn)
+        self.url = 'http://127.0.0.1:{}/job/'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_run_jobs(self):
+        payloads = [
+            (i, json.dumps({'value': i, 'error': i == 3}))
+            for i in range(10)
+        ]
+        results = {
+            key: (outputs, error)
+            for key, outputs, error in bmds_monkeypatch.run_jobs(
+                self.url, payloads, 'token', max_jobs=3, interval=0.01)
+        }
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[5], ([10], None))
+        self.assertIsNone(results[3][0])
+        self.assertIsInstance(results[3][1], bmds_monkeypatch.JobException)
+        self.assertEqual(JobRunnerStandIn.max_running, 3)
+
+    def test_timeout(self):
+        results = list(bmds_monkeypatch.run_jobs(
+            self.url, [(0, json.dumps({'value': 0}))], 'token',
+            interval=0.01, timeout=0))
+        self.assertEqual(results[0][0], 0)
+        self.assertEqual(str(results[0][2]), 'Client timeout')
+
+
+class ResultCacheTest(TestCase):
+
+    def test_get_set(self):
+        cache.delete(models.ResultCache.objects.MISSES_CACHE_NAME)
+        key = models.ResultCache.get_key('BMDS270', 'Logistic', 'dfile')
+        self.assertNotEqual(key, models.ResultCache.get_key('BMDS270', 'Logistic', 'dfile2'))
+        self.assertEqual(models.ResultCache.objects.get_results([key]), {})
+
+        # failed executions aren't cached
+        failed = {'status': RunStatus.FAILURE}
+        models.ResultCache.objects.set_results([(key, 'BMDS270', 'Logistic', failed)])
+        self.assertEqual(models.ResultCache.objects.get_results([key]), {})
+
+        results = {'status': RunStatus.SUCCESS, 'output': 'out'}
+        models.ResultCache.objects.set_results([(key, 'BMDS270', 'Logistic', results)])
+        models.ResultCache.objects.set_results([(key, 'BMDS270', 'Logistic', failed)])
+        self.assertEqual(models.ResultCache.objects.get_results([key]), {key: results})
+        self.assertEqual(
+            models.ResultCache.objects.get_stats(),
+            {'entries': 1, 'hits': 1, 'misses': 2})
+
+
+class BatchExecutionCreateTest(TestCase):
+
+    def setUp(self):
+        build_endpoints_for_permission_testing(self)
+
+    def get_serializer(self, endpoint_ids):
+        return serializers.BatchExecutionCreateSerializer(
+            data={'endpoint_ids': endpoint_ids},
+            context={'assessment': self.assessment_working})
+
+    def test_create(self):
+        serializer = self.get_serializer([self.endpoint_working.id])
+        self.assertTrue(serializer.is_valid())
+        batch = serializer.save()
+        self.assertEqual(batch.total, 1)
+        self.assertEqual(list(batch.endpoints.all()), [self.endpoint_working])
+
+        # sessions are created when the batch is run
+        self.assertEqual(batch.sessions.count(), 0)
+
+    def test_ineligible(self):
+        # endpoints in other assessments
+        serializer = self.get_serializer([self.endpoint_final.id])
+        self.assertFalse(serializer.is_valid())
+
+        # endpoints without dose-response data
+        self.endpoint_working.data_extracted = False
+        self.endpoint_working.save()
+        serializer = self.get_serializer([self.endpoint_working.id])
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('endpoint_ids', serializer.errors)
+
+    def test_bmd_disabled(self):
+        self.assessment_working.enable_bmd = False
+        self.assessment_working.save()
+        serializer = self.get_serializer([self.endpoint_working.id])
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(models.BatchExecution.objects.count(), 0)
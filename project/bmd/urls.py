@@ -7,6 +7,7 @@ from . import api, views
 
 router = DefaultRouter()
 router.register(r'session', api.Session, base_name="session")
+router.register(r'batch', api.BatchExecution, base_name="batch")
 
 
 urlpatterns = [
@@ -39,6 +39,30 @@ class OutcomeManager(BaseManager):
         return self.get_qs(assessment_id)\
                     .filter(study_population__study__published=True)
 
+    def optimized_qs(self, **filters):
+        return self.filter(**filters)\
+                    .select_related(
+                        'study_population',
+                        'study_population__study',
+                        'study_population__country',
+                    ).prefetch_related(
+                        'effects',
+                        'comparison_sets',
+                        'study_population__spcriteria__criteria',
+                        'study_population__outcomes',
+                        'study_population__exposures',
+                        'study_population__comparison_sets',
+                        'study_population__study__identifiers',
+                        'study_population__study__searches',
+                        'results__metric',
+                        'results__resfactors__adjustment_factor',
+                        'results__resulttags',
+                        'results__comparison_set__exposure__metric_units',
+                        'results__comparison_set__exposure__central_tendencies',
+                        'results__results__group__descriptions',
+                        'results__results__group__ethnicities',
+                    )
+
     def get_system_choices(self, assessment_id):
         return get_distinct_charfield_opts(self, assessment_id, 'system')
 
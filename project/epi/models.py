@@ -9,13 +9,14 @@ from django.db import models
 from django.core.urlresolvers import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+import numpy as np
 from reversion import revisions as reversion
-from scipy.stats import t
 
 from assessment.models import Assessment, BaseEndpoint, EffectTag
 from study.models import Study
 from utils.models import get_crumbs, get_distinct_charfield_opts
 from utils.helper import SerializerHelper, HAWCDjangoJSONEncoder
+from utils import statistics
 
 from . import managers
 
@@ -49,11 +50,14 @@ class Criteria(models.Model):
     def __str__(self):
         return self.description
 
-    def copy_across_assessments(self, cw):
-        new_obj, _ = self._meta.model.objects.get_or_create(
-            assessment_id=cw[Assessment.COPY_NAME][self.assessment_id],
-            description=self.description)
-        cw[self.COPY_NAME][self.id] = new_obj.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, ids):
+        # reuse an existing object with the same description, if one exists
+        cloner.clone_unique(
+            cls.objects.filter(id__in=ids),
+            cls.COPY_NAME,
+            key=('description', ),
+            remaps={'assessment_id': Assessment.COPY_NAME})
 
 
 class Country(models.Model):
@@ -94,11 +98,14 @@ class AdjustmentFactor(models.Model):
     def __str__(self):
         return self.description
 
-    def copy_across_assessments(self, cw):
-        new_obj, _ = self._meta.model.objects.get_or_create(
-            assessment_id=cw[Assessment.COPY_NAME][self.assessment_id],
-            description=self.description)
-        cw[self.COPY_NAME][self.id] = new_obj.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, ids):
+        # reuse an existing object with the same description, if one exists
+        cloner.clone_unique(
+            cls.objects.filter(id__in=ids),
+            cls.COPY_NAME,
+            key=('description', ),
+            remaps={'assessment_id': Assessment.COPY_NAME})
 
 
 class Ethnicity(models.Model):
@@ -139,13 +146,15 @@ class StudyPopulationCriteria(models.Model):
 
     COPY_NAME = "spcriterias"
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.criteria_id = cw[Criteria.COPY_NAME][self.criteria_id]
-        self.study_population_id = cw[StudyPopulation.COPY_NAME][self.study_population_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_population_ids):
+        cloner.clone(
+            cls.objects.filter(study_population_id__in=study_population_ids),
+            cls.COPY_NAME,
+            remaps={
+                'criteria_id': Criteria.COPY_NAME,
+                'study_population_id': StudyPopulation.COPY_NAME,
+            })
 
 
 class StudyPopulation(models.Model):
@@ -353,20 +362,22 @@ class StudyPopulation(models.Model):
     def can_create_sets(self):
         return self.design not in self.OUTCOME_GROUP_DESIGNS
 
-    def copy_across_assessments(self, cw):
-        children = list(itertools.chain(
-            self.criteria.all(),
-            self.spcriteria.all(),
-            self.exposures.all(),
-            self.comparison_sets.all(),
-            self.outcomes.all()))
-        old_id = self.id
-        self.id = None
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_ids):
+        ids = cloner.clone(
+            cls.objects.filter(study_id__in=study_ids),
+            cls.COPY_NAME,
+            remaps={'study_id': Study.COPY_NAME})
+        Criteria.copy_across_assessments(
+            cloner,
+            StudyPopulationCriteria.objects
+                .filter(study_population_id__in=ids)
+                .values_list('criteria_id', flat=True))
+        StudyPopulationCriteria.copy_across_assessments(cloner, ids)
+        Exposure.copy_across_assessments(cloner, ids)
+        outcome_ids = Outcome.copy_across_assessments(cloner, ids)
+        ComparisonSet.copy_across_assessments(cloner, ids, outcome_ids)
+        Result.copy_across_assessments(cloner, outcome_ids)
 
     def get_study(self):
         return self.study
@@ -462,7 +473,7 @@ class Outcome(BaseEndpoint):
 
     @staticmethod
     def get_qs_json(queryset, json_encode=True):
-        outcomes = [outcome.get_json(json_encode=False) for outcome in queryset]
+        outcomes = SerializerHelper.get_serialized_many(queryset)
         if json_encode:
             return json.dumps(outcomes, cls=HAWCDjangoJSONEncoder)
         else:
@@ -519,37 +530,17 @@ class Outcome(BaseEndpoint):
             ser['last_updated'],
         )
 
-    def copy_across_assessments(self, cw):
-        children = list(itertools.chain(
-            self.comparison_sets.all(),
-            self.results.all()))
-
-        old_id = self.id
-        new_assessment_id = cw[Assessment.COPY_NAME][self.assessment_id]
-
-        # copy base endpoint
-        base = self.baseendpoint_ptr
-        base.id = None
-        base.assessment_id = new_assessment_id
-        base.save()
-
-        # copy outcome
-        self.id = None
-        self.baseendpoint_ptr = base
-        self.assessment_id = new_assessment_id
-        self.study_population_id = cw[StudyPopulation.COPY_NAME][self.study_population_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-
-        # copy tags
-        for tag in self.effects.through.objects.filter(baseendpoint_id=old_id):
-            tag.id = None
-            tag.baseendpoint_id = self.id
-            tag.save()
-
-        # copy other children
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_population_ids):
+        ids = cloner.clone(
+            cls.objects.filter(study_population_id__in=study_population_ids),
+            cls.COPY_NAME,
+            remaps={
+                'assessment_id': Assessment.COPY_NAME,
+                'study_population_id': StudyPopulation.COPY_NAME,
+            })
+        cloner.clone_m2m(cls, 'effects', cls.COPY_NAME, ids)
+        return ids
 
     def get_study(self):
         if self.study_population is not None:
@@ -642,20 +633,20 @@ class ComparisonSet(models.Model):
             ser["last_updated"],
         )
 
-    def copy_across_assessments(self, cw):
-        children = list(self.groups.all())
-        old_id = self.id
-        self.id = None
-        if self.study_population_id:
-            self.study_population_id = cw[StudyPopulation.COPY_NAME][self.study_population_id]
-        if self.outcome_id:
-            self.outcome_id = cw[Outcome.COPY_NAME][self.outcome_id]
-        if self.exposure_id:
-            self.exposure_id = cw[Exposure.COPY_NAME][self.exposure_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_population_ids, outcome_ids):
+        # comparison-sets belong to a study-population and/or an outcome
+        ids = cloner.clone(
+            cls.objects.filter(
+                models.Q(study_population_id__in=study_population_ids) |
+                models.Q(outcome_id__in=outcome_ids)),
+            cls.COPY_NAME,
+            remaps={
+                'study_population_id': StudyPopulation.COPY_NAME,
+                'outcome_id': Outcome.COPY_NAME,
+                'exposure_id': Exposure.COPY_NAME,
+            })
+        Group.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         if self.study_population is not None:
@@ -792,15 +783,13 @@ class Group(models.Model):
             ser['last_updated'],
         )
 
-    def copy_across_assessments(self, cw):
-        children = list(self.descriptions.all())
-        old_id = self.id
-        self.id = None
-        self.comparison_set_id = cw[ComparisonSet.COPY_NAME][self.comparison_set_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, comparison_set_ids):
+        ids = cloner.clone(
+            cls.objects.filter(comparison_set_id__in=comparison_set_ids),
+            cls.COPY_NAME,
+            remaps={'comparison_set_id': ComparisonSet.COPY_NAME})
+        GroupNumericalDescriptions.copy_across_assessments(cloner, ids)
 
 
 class Exposure(models.Model):
@@ -990,12 +979,12 @@ class Exposure(models.Model):
             ser.get("last_updated"),
         )
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.study_population_id = cw[StudyPopulation.COPY_NAME][self.study_population_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_population_ids):
+        cloner.clone(
+            cls.objects.filter(study_population_id__in=study_population_ids),
+            cls.COPY_NAME,
+            remaps={'study_population_id': StudyPopulation.COPY_NAME})
 
     def get_study(self):
         if self.study_population is not None:
@@ -1197,12 +1186,12 @@ class GroupNumericalDescriptions(models.Model):
     def __str__(self):
         return self.description
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.group_id = cw[Group.COPY_NAME][self.group_id]
-        self.save()
-        cw[GroupNumericalDescriptions.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, group_ids):
+        cloner.clone(
+            cls.objects.filter(group_id__in=group_ids),
+            cls.COPY_NAME,
+            remaps={'group_id': Group.COPY_NAME})
 
 
 class ResultMetric(models.Model):
@@ -1247,13 +1236,15 @@ class ResultAdjustmentFactor(models.Model):
 
     COPY_NAME = "rfactors"
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.adjustment_factor_id = cw[AdjustmentFactor.COPY_NAME][self.adjustment_factor_id]
-        self.result_id = cw[Result.COPY_NAME][self.result_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, result_ids):
+        cloner.clone(
+            cls.objects.filter(result_id__in=result_ids),
+            cls.COPY_NAME,
+            remaps={
+                'adjustment_factor_id': AdjustmentFactor.COPY_NAME,
+                'result_id': Result.COPY_NAME,
+            })
 
 
 """
@@ -1455,6 +1446,19 @@ class Result(models.Model):
 
     COPY_NAME = "results"
 
+    @staticmethod
+    def add_group_statistics(results):
+        """
+        Calculate result-group statistics for a list of serialized results,
+        in a single batch.
+        """
+        GroupResult.getStdevsBatch([
+            (res['variance_type'], res['results']) for res in results])
+        GroupResult.percentControlBatch([
+            (res['estimate_type'], res['variance_type'], res['results']) for res in results])
+        GroupResult.getConfidenceIntervalsBatch([
+            (res['variance_type'], res['results']) for res in results])
+
     @property
     def factors_applied(self):
         return self.adjustment_factors\
@@ -1542,19 +1546,22 @@ class Result(models.Model):
             ser['last_updated'],
         )
 
-    def copy_across_assessments(self, cw):
-        children = list(itertools.chain(
-            self.adjustment_factors.all(),
-            self.resfactors.all(),
-            self.results.all()))
-        old_id = self.id
-        self.id = None
-        self.outcome_id = cw[Outcome.COPY_NAME][self.outcome_id]
-        self.comparison_set_id = cw[ComparisonSet.COPY_NAME][self.comparison_set_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, outcome_ids):
+        ids = cloner.clone(
+            cls.objects.filter(outcome_id__in=outcome_ids),
+            cls.COPY_NAME,
+            remaps={
+                'outcome_id': Outcome.COPY_NAME,
+                'comparison_set_id': ComparisonSet.COPY_NAME,
+            })
+        AdjustmentFactor.copy_across_assessments(
+            cloner,
+            ResultAdjustmentFactor.objects
+                .filter(result_id__in=ids)
+                .values_list('adjustment_factor_id', flat=True))
+        ResultAdjustmentFactor.copy_across_assessments(cloner, ids)
+        GroupResult.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         if self.outcome is not None:
@@ -1735,53 +1742,70 @@ class GroupResult(models.Model):
 
     @classmethod
     def getStdevs(cls, variance_type, rgs):
-        for rg in rgs:
-            rg['stdev'] = cls.stdev(variance_type, rg['variance'], rg['n'])
+        cls.getStdevsBatch([(variance_type, rgs)])
 
     @staticmethod
-    def getConfidenceIntervals(variance_type, groups):
+    def getStdevsBatch(datasets):
         """
-        Expects a dictionary of endpoint groups and the endpoint variance-type.
-        Appends results to the dictionary for each endpoint-group.
+        Expects a list of (variance_type, result-groups) tuples, for one or
+        more results. Appends stdev to the dictionary for each result-group.
+        """
+        rgs, variance_types, _ = statistics.flatten(datasets)
+        if len(rgs) == 0:
+            return
+        values = statistics.stdevs(
+            statistics.get_array(rgs, 'variance'),
+            statistics.get_array(rgs, 'n'),
+            variance_types == 'SD',
+            (variance_types == 'SE') | (variance_types == 'SEM'))
+        statistics.update_groups(rgs, stdev=values)
+
+    @classmethod
+    def getConfidenceIntervals(cls, variance_type, groups):
+        cls.getConfidenceIntervalsBatch([(variance_type, groups)])
+
+    @staticmethod
+    def getConfidenceIntervalsBatch(datasets):
+        """
+        Expects a list of (variance_type, result-groups) tuples, for one or
+        more results. Appends results to the dictionary for each result-group.
 
         Confidence interval calculated using a two-tailed t-test,
         assuming 95% confidence interval.
         """
+        groups, variance_types, _ = statistics.flatten(datasets)
+        if len(groups) == 0:
+            return
+
+        n = statistics.get_array(groups, 'n')
+        estimate = statistics.get_array(groups, 'estimate')
+        variance = statistics.get_array(groups, 'variance')
+        mask = ~np.isnan(n) & ~np.isnan(estimate) & ~np.isnan(variance)
+        for key in ['lower_ci', 'upper_ci', 'lower_range', 'upper_range']:
+            mask &= np.isnan(statistics.get_array(groups, key))
+
+        is_sd = variance_types == 'SD'
+        is_se = (variance_types == 'SE') | (variance_types == 'SEM')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            se = np.where(
+                is_sd, np.where(n > 0, variance / np.sqrt(n), np.nan),
+                np.where(is_se, variance, np.nan))
+        lower, upper = statistics.t_confidence_intervals(estimate, se, n, mask)
+        statistics.update_groups(
+            groups, mask=mask, ndigits=2, lower_ci=lower, upper_ci=upper)
+        for grp in itertools.compress(groups, mask):
+            grp['ci_calc'] = True
 
-        for grp in groups:
-            lower_ci = grp.get('lower_ci')
-            upper_ci = grp.get('upper_ci')
-            n = grp.get('n')
-            if (
-                    lower_ci is None and
-                    upper_ci is None and
-                    n is not None and
-                    grp['lower_range'] is None and
-                    grp['upper_range'] is None and
-                    grp['estimate'] is not None and
-                    grp['variance'] is not None
-               ):
-                    est = grp['estimate']
-                    var = grp['variance']
-                    z = t.ppf(0.975, max(n-1, 1))
-                    change = None
-
-                    if variance_type == 'SD':
-                        change = z * var / math.sqrt(n)
-                    elif variance_type in ('SE', 'SEM'):
-                        change = z * var
-
-                    if change is not None:
-                        lower_ci = round(est - change, 2)
-                        upper_ci = round(est + change, 2)
-
-                    grp.update(lower_ci=lower_ci, upper_ci=upper_ci, ci_calc=True)
+    @classmethod
+    def percentControl(cls, estimate_type, variance_type, rgs):
+        cls.percentControlBatch([(estimate_type, variance_type, rgs)])
 
     @staticmethod
-    def percentControl(estimate_type, variance_type, rgs):
+    def percentControlBatch(datasets):
         """
-        Expects a dictionary of result groups, the result estimate_type, and
-        result variance_type. Appends results to the dictionary for each result-group.
+        Expects a list of (estimate_type, variance_type, result-groups) tuples,
+        for one or more results. Appends results to the dictionary for each
+        result-group.
 
         Calculates a 95% confidence interval for the percent-difference from
         control, taking into account variance from both groups using a
@@ -1789,69 +1813,52 @@ class GroupResult(models.Model):
 
         Only calculates if estimate_type is 'median' or 'mean' and variance_type
         is 'SD', 'SE', or 'SEM', all cases are true with a normal distribution.
-        """
-        def get_control_group(rgs):
-            """
-            - If 0 groups are control=true, the first group will be chosen as control
-            - If 1 group is control=true, it will be used as control
-            - If ≥2 groups is control=true, a random control group will be chosen as control
-            """
-            control = None
-
-            for i, rg in enumerate(rgs):
-                if rg['group']['isControl']:
-                    control = rg
-                    break
-
-            if control is None:
-                control = rgs[0]
 
-            return control['n'], control['estimate'], control.get('stdev')
+        The control group for each result is selected as follows:
 
+        - If 0 groups are control=true, the first group will be chosen as control
+        - If 1 group is control=true, it will be used as control
+        - If ≥2 groups is control=true, the first control group will be chosen
+        """
+        rgs, is_normal, _ = statistics.flatten([
+            (
+                estimate_type in ['median', 'mean'] and
+                variance_type in ['SD', 'SE', 'SEM'],
+                grps
+            ) for estimate_type, variance_type, grps in datasets
+        ])
         if len(rgs) == 0:
             return
 
-        n_1, mu_1, sd_1 = get_control_group(rgs)
-
-        for i, rg in enumerate(rgs):
-
-            mean = low = high = None
-
-            if estimate_type in ['median', 'mean'] and \
-               variance_type in ['SD', 'SE', 'SEM']:
-
-                n_2 = rg['n']
-                mu_2 = rg['estimate']
-                sd_2 = rg.get('stdev')
-
-                if mu_1 and mu_2 and mu_1 != 0:
-                    mean = (mu_2 - mu_1) / mu_1 * 100.
-                    if sd_1 and sd_2 and n_1 and n_2:
-                        sd = math.sqrt(
-                            pow(mu_1, -2) * (
-                                (pow(sd_2, 2) / n_2) +
-                                (pow(mu_2, 2) * pow(sd_1, 2)) /
-                                (n_1 * pow(mu_1, 2))
-                            )
-                        )
-                        ci = (1.96 * sd) * 100
-                        rng = sorted([mean - ci, mean + ci])
-                        low = rng[0]
-                        high = rng[1]
-
-            rg.update(
-                percentControlMean=mean,
-                percentControlLow=low,
-                percentControlHigh=high
-            )
-
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.result_id = cw[Result.COPY_NAME][self.result_id]
-        self.group_id = cw[Group.COPY_NAME][self.group_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+        controls = []
+        for _, _, grps in datasets:
+            control = next(
+                (i for i, rg in enumerate(grps) if rg['group']['isControl']), 0)
+            controls.extend([len(controls) + control] * len(grps))
+
+        mean, low, high = statistics.percent_control(
+            statistics.get_array(rgs, 'n'),
+            statistics.get_array(rgs, 'estimate'),
+            statistics.get_array(rgs, 'stdev'),
+            np.array(controls, dtype=int))
+
+        is_normal = is_normal.astype(bool)
+        statistics.update_groups(
+            rgs,
+            percentControlMean=np.where(is_normal, mean, np.nan),
+            percentControlLow=np.where(is_normal, low, np.nan),
+            percentControlHigh=np.where(is_normal, high, np.nan),
+        )
+
+    @classmethod
+    def copy_across_assessments(cls, cloner, result_ids):
+        cloner.clone(
+            cls.objects.filter(result_id__in=result_ids),
+            cls.COPY_NAME,
+            remaps={
+                'result_id': Result.COPY_NAME,
+                'group_id': Group.COPY_NAME,
+            })
 
 
 reversion.register(Country)
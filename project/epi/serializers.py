@@ -161,6 +161,24 @@ class SimpleComparisonSetSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ResultListSerializer(serializers.ListSerializer):
+    """
+    Calculate result-group statistics for all results in a single batch,
+    unless an outer serializer is already batching these calculations.
+    """
+
+    def to_representation(self, data):
+        if self.context.get('defer_group_statistics'):
+            return super().to_representation(data)
+        self.context['defer_group_statistics'] = True
+        try:
+            ret = super().to_representation(data)
+        finally:
+            self.context.pop('defer_group_statistics')
+        models.Result.add_group_statistics(ret)
+        return ret
+
+
 class ResultSerializer(serializers.ModelSerializer):
     metric = ResultMetricSerializer()
     factors = ResultAdjustmentFactorSerializer(source='resfactors', many=True)
@@ -175,16 +193,30 @@ class ResultSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
-        models.GroupResult.getStdevs(ret['variance_type'], ret['results'])
-        models.GroupResult.percentControl(
-            ret['estimate_type'], ret['variance_type'], ret['results'])
-        models.GroupResult.getConfidenceIntervals(
-            ret['variance_type'], ret['results'])
+        if not self.context.get('defer_group_statistics'):
+            models.Result.add_group_statistics([ret])
         return ret
 
     class Meta:
         model = models.Result
         exclude = ('adjustment_factors', )
+        list_serializer_class = ResultListSerializer
+
+
+class OutcomeListSerializer(serializers.ListSerializer):
+    """
+    Calculate result-group statistics for all outcomes in a single batch.
+    """
+
+    def to_representation(self, data):
+        self.context['defer_group_statistics'] = True
+        try:
+            ret = super().to_representation(data)
+        finally:
+            self.context.pop('defer_group_statistics')
+        models.Result.add_group_statistics([
+            res for outcome in ret for res in outcome['results']])
+        return ret
 
 
 class OutcomeSerializer(serializers.ModelSerializer):
@@ -199,6 +231,7 @@ class OutcomeSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Outcome
         fields = '__all__'
+        list_serializer_class = OutcomeListSerializer
 
 
 class ComparisonSetSerializer(serializers.ModelSerializer):
@@ -2,6 +2,8 @@ import logging
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
+from utils.helper import cache_invalidator
+
 from . import models
 
 
@@ -19,7 +21,7 @@ from . import models
 @receiver(pre_delete, sender=models.Result)
 @receiver(post_save, sender=models.GroupResult)
 @receiver(pre_delete, sender=models.GroupResult)
-def invalidate_outcome_cache(sender, instance, **kwargs):
+def invalidate_outcome_cache(sender, instance, signal, **kwargs):
     ids = []
     instance_type = type(instance)
     filters = {}
@@ -38,10 +40,8 @@ def invalidate_outcome_cache(sender, instance, **kwargs):
     elif instance_type is models.GroupResult:
         ids = [instance.result.outcome_id]
 
-    if len(filters) > 0:
-        ids = models.Outcome.objects.filter(**filters).values_list('id', flat=True)
-
-    models.Outcome.delete_caches(ids)
+    cache_invalidator.add(
+        models.Outcome, ids, filters, resolve=signal is pre_delete)
 
 
 @receiver(post_save, sender=models.Group)
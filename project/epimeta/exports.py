@@ -1,6 +1,5 @@
 from study.models import Study
-from riskofbias.models import RiskOfBiasScore
-from utils.helper import FlatFileExporter
+from utils.helper import FlatFileExporter, SerializerHelper
 
 from . import models
 
@@ -20,9 +19,7 @@ class MetaResultFlatComplete(FlatFileExporter):
         return header
 
     def _get_data_rows(self):
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
             row = []
             row.extend(Study.flat_complete_data_row(ser['protocol']['study']))
             row.extend(models.MetaProtocol.flat_complete_data_row(ser['protocol']))
@@ -30,14 +27,13 @@ class MetaResultFlatComplete(FlatFileExporter):
 
             if len(ser['single_results']) == 0:
                 # print one-row with no single-results
-                rows.append(row)
+                yield row
             else:
                 # print each single-result as a new row
                 for sr in ser['single_results']:
                     row_copy = list(row)  # clone
                     row_copy.extend(models.SingleResult.flat_complete_data_row(sr))
-                    rows.append(row_copy)
-        return rows
+                    yield row_copy
 
 
 class MetaResultFlatDataPivot(FlatFileExporter):
@@ -76,18 +72,8 @@ class MetaResultFlatDataPivot(FlatFileExporter):
         ]
 
     def _get_data_rows(self):
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
-            study_id = ser['protocol']['study']['id']
-            fROB = Study.objects.get(pk=study_id).get_overall_confidence()
-            if fROB == -1:
-                finalROB = 'N/A'
-            else:
-                fROB = (fROB+10)%11
-                for cnt, text in RiskOfBiasScore.RISK_OF_BIAS_SCORE_CHOICES:
-                    if cnt == fROB:
-                        finalROB = text
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
+            finalROB = self._get_overall_confidence_text(ser['protocol']['study'])
 
             row = [
                 ser['protocol']['study']['id'],
@@ -117,6 +103,4 @@ class MetaResultFlatDataPivot(FlatFileExporter):
             ]
             row.append(finalROB)
 
-            rows.append(row)
-
-        return rows
+            yield row
@@ -12,6 +12,21 @@ class MetaResultManager(BaseManager):
         return self.assessment_qs(assessment_id)\
                     .filter(protocol__study__published=True)
 
+    def optimized_qs(self, **filters):
+        return self.filter(**filters)\
+                    .select_related(
+                        'protocol',
+                        'protocol__study',
+                        'metric',
+                    ).prefetch_related(
+                        'adjustment_factors',
+                        'single_results__study',
+                        'protocol__inclusion_criteria',
+                        'protocol__exclusion_criteria',
+                        'protocol__study__identifiers',
+                        'protocol__study__searches',
+                    )
+
 
 class SingleResultManager(BaseManager):
     assessment_relation = 'meta_result__protocol__study__assessment'
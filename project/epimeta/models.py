@@ -92,16 +92,13 @@ class MetaProtocol(models.Model):
     def get_json(self, json_encode=True):
         return SerializerHelper.get_serialized(self, json=json_encode, from_cache=False)
 
-    def copy_across_assessments(self, cw):
-        children = list(self.results.all())
-        old_id = self.id
-        self.id = None
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
-
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_ids):
+        ids = cloner.clone(
+            cls.objects.filter(study_id__in=study_ids),
+            cls.COPY_NAME,
+            remaps={'study_id': Study.COPY_NAME})
+        MetaResult.copy_across_assessments(cloner, ids)
 
     @staticmethod
     def flat_complete_header_row():
@@ -230,7 +227,7 @@ class MetaResult(models.Model):
 
     @staticmethod
     def get_qs_json(queryset, json_encode=True):
-        results = [result.get_json(json_encode=False) for result in queryset]
+        results = SerializerHelper.get_serialized_many(queryset)
         if json_encode:
             return json.dumps(results, cls=HAWCDjangoJSONEncoder)
         else:
@@ -300,10 +297,7 @@ class MetaResult(models.Model):
             )
             return key, mr
 
-        results = [
-            SerializerHelper.get_serialized(obj, json=False)
-            for obj in queryset
-        ]
+        results = SerializerHelper.get_serialized_many(queryset)
         studies = {}
 
         # flip dictionary nesting
@@ -365,12 +359,13 @@ class MetaResult(models.Model):
             "studies": studies
         }
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.protocol_id = cw[MetaProtocol.COPY_NAME][self.protocol_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, protocol_ids):
+        ids = cloner.clone(
+            cls.objects.filter(protocol_id__in=protocol_ids),
+            cls.COPY_NAME,
+            remaps={'protocol_id': MetaProtocol.COPY_NAME})
+        SingleResult.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         if self.protocol is not None:
@@ -479,13 +474,17 @@ class SingleResult(models.Model):
             ser['notes'],
         )
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.meta_result_id = cw[MetaResult.COPY_NAME][self.meta_result_id]
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, meta_result_ids):
+        # all studies are copied before their children, so single-results
+        # referring to another copied study can be remapped
+        cloner.clone(
+            cls.objects.filter(meta_result_id__in=meta_result_ids),
+            cls.COPY_NAME,
+            remaps={
+                'meta_result_id': MetaResult.COPY_NAME,
+                'study_id': Study.COPY_NAME,
+            })
 
     def get_study(self):
         if self.meta_result is not None:
@@ -1,6 +1,8 @@
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
+from utils.helper import cache_invalidator
+
 from . import models
 
 
@@ -10,9 +12,10 @@ from . import models
 @receiver(pre_delete, sender=models.MetaResult)
 @receiver(post_save, sender=models.SingleResult)
 @receiver(pre_delete, sender=models.SingleResult)
-def invalidate_meta_result_cache(sender, instance, **kwargs):
+def invalidate_meta_result_cache(sender, instance, signal, **kwargs):
     instance_type = type(instance)
     filters = {}
+    ids = []
     if instance_type is models.MetaProtocol:
         filters["protocol"] = instance.id
     elif instance_type is models.MetaResult:
@@ -20,9 +23,5 @@ def invalidate_meta_result_cache(sender, instance, **kwargs):
     elif instance_type is models.SingleResult:
         ids = [instance.meta_result_id]
 
-    if len(filters) > 0:
-        ids = models.MetaResult.objects\
-            .filter(**filters)\
-            .values_list('id', flat=True)
-
-    models.MetaResult.delete_caches(ids)
+    cache_invalidator.add(
+        models.MetaResult, ids, filters, resolve=signal is pre_delete)
@@ -131,7 +131,18 @@ CELERY_IMPORTS = (
     'assessment.tasks',
     'bmd.tasks',
     'lit.tasks',
+    'summary.tasks',
 )
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-counts': {
+        'task': 'assessment.tasks.reconcile_counts',
+        'schedule': 60 * 60,  # hourly
+    },
+    'flush-time-spent': {
+        'task': 'assessment.tasks.flush_time_spent',
+        'schedule': 60,
+    },
+}
 
 
 # Cache settings
@@ -145,6 +156,11 @@ CACHES = {
         'TIMEOUT': None
     }
 }
+# serialized objects are invalidated by generation; stale objects expire
+SERIALIZER_CACHE_TIMEOUT = int(os.getenv('SERIALIZER_CACHE_TIMEOUT', 60 * 60 * 24 * 14))
+CACHE_WARM_MAX_WORKERS = int(os.getenv('CACHE_WARM_MAX_WORKERS', 2))
+# tables with more rows (per planner statistics) are estimated instead of counted
+COUNTS_ESTIMATE_THRESHOLD = int(os.getenv('COUNTS_ESTIMATE_THRESHOLD', 1000000))
 
 
 # Email settings
@@ -186,6 +202,10 @@ MEDIA_ROOT = os.path.join(PROJECT_ROOT, 'public', 'media')
 
 # Filesystem settings
 PHANTOMJS_PATH = os.getenv('PHANTOMJS_PATH')
+RASTERIZE_POOL_SIZE = int(os.getenv('RASTERIZE_POOL_SIZE', 2))
+RASTERIZE_MAX_JOBS = int(os.getenv('RASTERIZE_MAX_JOBS', 50))
+RASTERIZE_TIMEOUT = 60
+RASTERIZE_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
 
 # Logging configuration
 LOGGING = {
@@ -266,11 +286,19 @@ if GIT_COMMIT:
 # PubMed settings
 PUBMED_TOOL = os.getenv('PUBMED_TOOL', 'hawc')
 PUBMED_EMAIL = os.getenv('PUBMED_EMAIL', DEFAULT_FROM_EMAIL)
+PUBMED_EFETCH_URL = os.getenv(
+    'PUBMED_EFETCH_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi')
+# NCBI E-utilities allow 3 requests/second without an API key
+PUBMED_MAX_WORKERS = int(os.getenv('PUBMED_MAX_WORKERS', 3))
+PUBMED_REQUESTS_PER_SECOND = float(os.getenv('PUBMED_REQUESTS_PER_SECOND', 3))
+PUBMED_MAX_RETRIES = int(os.getenv('PUBMED_MAX_RETRIES', 3))
 
 
 # BMD modeling settings
 BMDS_SUBMISSION_URL = os.getenv('BMDS_SUBMISSION_URL', 'https://sandbox.ntp.niehs.nih.gov/job-runner/api/v1/bmds-dfile/')
 BMDS_TOKEN = os.getenv('BMDS_TOKEN', '3bc3637734cf88e6df57f113d36f26f547554ada')
+# maximum number of jobs submitted concurrently in a batch execution
+BMDS_MAX_JOBS = int(os.getenv('BMDS_MAX_JOBS', 8))
 
 # increase allowable fields in POST for updating reviewers
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
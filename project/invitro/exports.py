@@ -1,9 +1,7 @@
 from copy import copy
 from django.apps import apps
 
-from study.models import Study
-from riskofbias.models import RiskOfBiasScore
-from utils.helper import FlatFileExporter
+from utils.helper import FlatFileExporter, SerializerHelper
 
 
 def getDose(ser, tag):
@@ -99,19 +97,9 @@ class DataPivotEndpoint(FlatFileExporter):
         return header
 
     def _get_data_rows(self):
-        rows = []
-
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
-            study_id = ser['experiment']['study']['id']
-            fROB = Study.objects.get(pk=study_id).get_overall_confidence()
-            if fROB == -1:
-                finalROB = 'N/A'
-            else:
-                fROB = (fROB+10)%11
-                for cnt, text in RiskOfBiasScore.RISK_OF_BIAS_SCORE_CHOICES:
-                    if cnt == fROB:
-                        finalROB = text
+
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
+            finalROB = self._get_overall_confidence_text(ser['experiment']['study'])
 
             doseRange = getDoseRange(ser)
 
@@ -193,9 +181,7 @@ class DataPivotEndpoint(FlatFileExporter):
             row.extend(bm_types)
             row.extend(bm_values)
 
-            rows.append(row)
-
-        return rows
+            yield row
 
 
 class DataPivotEndpointGroup(FlatFileExporter):
@@ -257,10 +243,8 @@ class DataPivotEndpointGroup(FlatFileExporter):
         return header
 
     def _get_data_rows(self):
-        rows = []
 
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
 
             doseRange = getDoseRange(ser)
 
@@ -322,6 +306,4 @@ class DataPivotEndpointGroup(FlatFileExporter):
                     eg['cytotoxicity_observed'],
                     eg['precipitation_observed'],
                 ])
-                rows.append(row_copy)
-
-        return rows
+                yield row_copy
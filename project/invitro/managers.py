@@ -26,6 +26,23 @@ class IVEndpointManager(BaseManager):
         return self.get_qs(assessment_id)\
                     .filter(experiment__study__published=True)
 
+    def optimized_qs(self, **filters):
+        return self.filter(**filters)\
+                    .select_related(
+                        'experiment',
+                        'experiment__study',
+                        'experiment__cell_type',
+                        'experiment__dose_units',
+                        'chemical',
+                        'category',
+                    ).prefetch_related(
+                        'groups',
+                        'benchmarks',
+                        'effects',
+                        'experiment__study__identifiers',
+                        'experiment__study__searches',
+                    )
+
 
 class IVEndpointGroupManager(BaseManager):
     assessment_relation = 'endpoint__assessment'
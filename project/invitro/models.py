@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
-import itertools
 import json
 
 from django.core.validators import MinValueValidator
@@ -87,12 +86,12 @@ class IVChemical(models.Model):
             .values_list('id', flat=True)
         )
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_ids):
+        cloner.clone(
+            cls.objects.filter(study_id__in=study_ids),
+            cls.COPY_NAME,
+            remaps={'study_id': Study.COPY_NAME})
 
     def get_study(self):
         return self.study
@@ -169,12 +168,12 @@ class IVCellType(models.Model):
     def get_assessment(self):
         return self.study.assessment
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_ids):
+        cloner.clone(
+            cls.objects.filter(study_id__in=study_ids),
+            cls.COPY_NAME,
+            remaps={'study_id': Study.COPY_NAME})
 
     def get_study(self):
         return self.study
@@ -268,16 +267,16 @@ class IVExperiment(models.Model):
     def get_crumbs(self):
         return get_crumbs(self, self.study)
 
-    def copy_across_assessments(self, cw):
-        children = list(self.endpoints.all())
-        old_id = self.id
-        self.id = None
-        self.study_id = cw[Study.COPY_NAME][self.study_id]
-        self.cell_type_id = cw[IVCellType.COPY_NAME][self.cell_type_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, study_ids):
+        ids = cloner.clone(
+            cls.objects.filter(study_id__in=study_ids),
+            cls.COPY_NAME,
+            remaps={
+                'study_id': Study.COPY_NAME,
+                'cell_type_id': IVCellType.COPY_NAME,
+            })
+        IVEndpoint.copy_across_assessments(cloner, ids)
 
     def get_study(self):
         return self.study
@@ -312,13 +311,6 @@ class IVEndpointCategory(AssessmentRootedTagTree):
 
     COPY_NAME = 'ivendpoint_category'
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.endpoint_id = cw[IVEndpoint.COPY_NAME][self.endpoint_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-
 
 class IVEndpoint(BaseEndpoint):
     objects = managers.IVEndpointManager()
@@ -464,7 +456,7 @@ class IVEndpoint(BaseEndpoint):
 
     @staticmethod
     def get_qs_json(queryset, json_encode=True):
-        endpoints = [endpoint.get_json(json_encode=False) for endpoint in queryset]
+        endpoints = SerializerHelper.get_serialized_many(queryset)
         if json_encode:
             return json.dumps(endpoints, cls=HAWCDjangoJSONEncoder)
         else:
@@ -514,40 +506,21 @@ class IVEndpoint(BaseEndpoint):
             "field3": "c",
         }
 
-    def copy_across_assessments(self, cw):
-        children = list(itertools.chain(
-            self.groups.all(),
-            self.benchmarks.all(),
-        ))
-        old_id = self.id
-        new_assessment_id = cw[Assessment.COPY_NAME][self.assessment_id]
-
-        # copy base endpoint
-        base = self.baseendpoint_ptr
-        base.id = None
-        base.assessment_id = new_assessment_id
-        base.save()
-
-        # copy endpoint
-        self.id = None
-        self.baseendpoint_ptr = base
-        self.assessment_id = new_assessment_id
-
-        self.experiment_id = cw[IVExperiment.COPY_NAME][self.experiment_id]
-        self.chemical_id = cw[IVChemical.COPY_NAME][self.chemical_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
-
-        # copy tags
-        for tag in self.effects.through.objects.filter(baseendpoint_id=old_id):
-            tag.id = None
-            tag.baseendpoint_id = self.id
-            tag.save()
-
-        if self.category:
-            self.category.copy_across_assessments(cw)
-        for child in children:
-            child.copy_across_assessments(cw)
+    @classmethod
+    def copy_across_assessments(cls, cloner, experiment_ids):
+        # categories are an assessment-specific tree, and are not copied
+        ids = cloner.clone(
+            cls.objects.filter(experiment_id__in=experiment_ids),
+            cls.COPY_NAME,
+            remaps={
+                'assessment_id': Assessment.COPY_NAME,
+                'experiment_id': IVExperiment.COPY_NAME,
+                'chemical_id': IVChemical.COPY_NAME,
+            },
+            updates={'category_id': None})
+        cloner.clone_m2m(cls, 'effects', cls.COPY_NAME, ids)
+        IVEndpointGroup.copy_across_assessments(cloner, ids)
+        IVBenchmark.copy_across_assessments(cloner, ids)
 
 
 class IVEndpointGroup(ConfidenceIntervalsMixin, models.Model):
@@ -621,12 +594,12 @@ class IVEndpointGroup(ConfidenceIntervalsMixin, models.Model):
     class Meta:
         ordering = ('endpoint', 'dose_group_id')
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.endpoint_id = cw[IVEndpoint.COPY_NAME][self.endpoint_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, endpoint_ids):
+        cloner.clone(
+            cls.objects.filter(endpoint_id__in=endpoint_ids),
+            cls.COPY_NAME,
+            remaps={'endpoint_id': IVEndpoint.COPY_NAME})
 
 
 class IVBenchmark(models.Model):
@@ -641,12 +614,12 @@ class IVBenchmark(models.Model):
 
     COPY_NAME = 'benchmarks'
 
-    def copy_across_assessments(self, cw):
-        old_id = self.id
-        self.id = None
-        self.endpoint_id = cw[IVEndpoint.COPY_NAME][self.endpoint_id]
-        self.save()
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def copy_across_assessments(cls, cloner, endpoint_ids):
+        cloner.clone(
+            cls.objects.filter(endpoint_id__in=endpoint_ids),
+            cls.COPY_NAME,
+            remaps={'endpoint_id': IVEndpoint.COPY_NAME})
 
 
 reversion.register(IVChemical)
@@ -1,6 +1,8 @@
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
+from utils.helper import cache_invalidator
+
 from . import models
 
 
@@ -16,9 +18,10 @@ from . import models
 @receiver(pre_delete, sender=models.IVEndpointGroup)
 @receiver(post_save, sender=models.IVBenchmark)
 @receiver(pre_delete, sender=models.IVBenchmark)
-def invalidate_endpoint_cache(sender, instance, **kwargs):
+def invalidate_endpoint_cache(sender, instance, signal, **kwargs):
     instance_type = type(instance)
     filters = {}
+    ids = []
 
     if instance_type is models.IVChemical:
         filters['chemical_id'] = instance.id
@@ -33,12 +36,8 @@ def invalidate_endpoint_cache(sender, instance, **kwargs):
     elif instance_type is models.IVBenchmark:
         ids = [instance.endpoint_id]
 
-    if len(filters) > 0:
-        ids = models.IVEndpoint.objects\
-            .filter(**filters)\
-            .values_list('id', flat=True)
-
-    models.IVEndpoint.delete_caches(ids)
+    cache_invalidator.add(
+        models.IVEndpoint, ids, filters, resolve=signal is pre_delete)
 
 
 @receiver(post_save, sender=models.IVEndpointCategory)
@@ -1,16 +1,100 @@
-from assessment.api import AssessmentRootedTagTreeViewset
+from rest_framework import decorators, exceptions, viewsets
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from assessment.api import AssessmentLevelPermissions, AssessmentRootedTagTreeViewset, \
+    AssessmentViewset, InAssessmentFilter, get_assessment_from_query
 
 from . import models, serializers
 
 from utils.api import CleanupFieldsBaseViewSet
+from utils.helper import tryParseInt
+
+
+class ReferencePagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
 
 
 class ReferenceFilterTag(AssessmentRootedTagTreeViewset):
     model = models.ReferenceFilterTag
     serializer_class = serializers.ReferenceFilterTagSerializer
+    pagination_class = ReferencePagination
+
+    @decorators.list_route()
+    def counts(self, request):
+        """
+        Number of references with each tag applied, directly and including
+        descendant tags.
+        """
+        self.assessment = get_assessment_from_query(request)
+        if self.assessment is None or \
+                not self.assessment.user_can_view_object(request.user):
+            raise exceptions.PermissionDenied()
+        return Response(self.model.get_reference_counts(self.assessment.id))
+
+    @decorators.detail_route()
+    def references(self, request, pk=None):
+        """
+        Paginated references with this tag or any descendant tag applied;
+        optionally filtered to a single search with `search_id`.
+        """
+        tag = self.get_object()
+        refs = models.Reference.objects.get_references_with_tag(
+            tag, descendants=True, assessment_id=self.assessment.id)
+        search_id = tryParseInt(request.query_params.get('search_id'))
+        if search_id is not None:
+            refs = refs.filter(searches=search_id)
+        refs = refs\
+            .order_by('id')\
+            .prefetch_related('searches', 'identifiers', 'tags')
+        page = self.paginate_queryset(refs)
+        return self.get_paginated_response([
+            ref.get_json(json_encode=False, searches=True)
+            for ref in page
+        ])
+
+
+class ReferenceSearch(viewsets.GenericViewSet):
+    """
+    Ranked full-text search of references in an assessment, using the `q`
+    query parameter; see `ReferenceManager.full_text_search` for syntax.
+    """
+    model = models.Reference
+    assessment_filter_args = "assessment"
+    permission_classes = (AssessmentLevelPermissions, )
+    filter_backends = (InAssessmentFilter, )
+    pagination_class = ReferencePagination
+
+    def get_queryset(self):
+        return self.model.objects.full_text_search(
+            self.request.query_params.get('q', ''))
+
+    def list(self, request):
+        refs = self.filter_queryset(self.get_queryset())\
+            .prefetch_related('searches', 'identifiers', 'tags')
+        page = self.paginate_queryset(refs)
+        return self.get_paginated_response([
+            ref.get_json(json_encode=False, searches=True)
+            for ref in page
+        ])
 
 
 class ReferenceCleanup(CleanupFieldsBaseViewSet):
     serializer_class = serializers.ReferenceCleanupFieldsSerializer
     model = models.Reference
     assessment_filter_args = "assessment"
+
+
+class SearchJob(AssessmentViewset):
+    """
+    Status and progress of background literature searches and imports;
+    polled from the search detail page until the job is finished.
+    """
+    model = models.SearchJob
+    serializer_class = serializers.SearchJobSerializer
+    assessment_filter_args = "search__assessment"
+
+    def get_queryset(self):
+        return self.model.objects.select_related('search__assessment')
@@ -1,9 +1,62 @@
-from copy import copy, deepcopy
+import numpy as np
 
 from django.utils.html import strip_tags
 
 from utils.helper import FlatFileExporter
-from . import models
+from . import constants, models
+
+
+class TagMatrix(object):
+    """
+    Boolean matrix of references by tags, where a reference is also tagged
+    with all ancestors of an applied tag.
+
+    The tag tree (in `dump_bulk` format) is flattened once into ordered
+    columns, in the same order as `ReferenceFilterTag.get_flattened_taglist`.
+    """
+
+    def __init__(self, tags, include_parent_tag=False):
+        self.columns = {}   # tag id -> column index
+        self.parents = []   # column index -> parent column index, or -1
+
+        def flatten(tag, parent):
+            column = len(self.parents)
+            self.columns[tag['id']] = column
+            self.parents.append(parent)
+            for child in tag.get('children', []):
+                flatten(child, column)
+
+        root = tags[0]
+        if include_parent_tag:
+            flatten(root, -1)
+        else:
+            for child in root.get('children', []):
+                flatten(child, -1)
+
+    def build(self, reference_ids, pairs):
+        """
+        Return a dictionary of {reference_id: row-index}, and the matrix,
+        given an iterable of (reference_id, tag_id) pairs.
+        """
+        rows = {ref_id: i for i, ref_id in enumerate(reference_ids)}
+        matrix = np.zeros((len(rows), len(self.parents)), dtype=bool, order='F')
+
+        indexes = [
+            (rows[ref_id], self.columns[tag_id])
+            for ref_id, tag_id in pairs
+            if ref_id in rows and tag_id in self.columns
+        ]
+        if indexes:
+            row_idx, col_idx = zip(*indexes)
+            matrix[list(row_idx), list(col_idx)] = True
+
+        # children follow their parents; propagate from the deepest tags up
+        for column in range(len(self.parents) - 1, -1, -1):
+            parent = self.parents[column]
+            if parent >= 0:
+                matrix[:, parent] |= matrix[:, column]
+
+        return rows, matrix
 
 
 class ReferenceFlatComplete(FlatFileExporter):
@@ -22,66 +75,32 @@ class ReferenceFlatComplete(FlatFileExporter):
             headers.extend(models.ReferenceFilterTag.get_flattened_taglist(tags, include_parent_tag))
         return headers
 
-    def _get_data_rows(self):
-        rows = []
-
-        def resetTags(tags):
-            def setFalse(obj):
-                obj['isTagged'] = False
-                for child in obj.get('children', []):
-                    setFalse(child)
-
-            tagsCopy = deepcopy(tags)
-            setFalse(tagsCopy)
-            return tagsCopy
-
-        tags_base = resetTags(self.kwargs.get('tags')[0])
-        include_parent_tag = self.kwargs.get('include_parent_tag', False)
-
-        def getTagRow(tags):
-            row = []
+    def _get_pubmed_ids(self):
+        pubmed_ids = {}
+        qs = models.Reference.identifiers.through.objects\
+            .filter(reference__in=self.queryset,
+                    identifiers__database=constants.PUBMED)\
+            .order_by('identifiers_id')\
+            .values_list('reference_id', 'identifiers__unique_id')
+        for ref_id, unique_id in qs:
+            pubmed_ids.setdefault(ref_id, unique_id)
+        return pubmed_ids
 
-            def printStatus(obj):
-                row.append(obj['isTagged'])
-                for child in obj.get('children', []):
-                    printStatus(child)
-
-            if include_parent_tag:
-                printStatus(tags)
-            else:
-                for child in tags['children']:
-                    printStatus(child)
-            return row
-
-        def applyTags(tagslist, ref):
-
-            def applyTag(tagged, tagslist):
-
-                def checkMatch(tagged, tag, parents):
-                    parents = copy(parents)
-                    if tagged.id == tag['id']:
-                        tag['isTagged'] = True
-                        for parent in parents:
-                            parent['isTagged'] = True
-
-                    parents.append(tag)
-                    for child in tag.get('children', []):
-                        checkMatch(tagged, child, parents)
-
-                if include_parent_tag:
-                    checkMatch(tagged, tagslist, [])
-                else:
-                    for child in tagslist['children']:
-                        checkMatch(tagged, child, [])
-
-            for tag in ref.tags.all():
-                applyTag(tag, tagslist)
-
-        row = []
-        for ref in self.queryset:
+    def _get_data_rows(self):
+        tag_matrix = TagMatrix(
+            self.kwargs.get('tags'),
+            self.kwargs.get('include_parent_tag', False))
+        pairs = models.ReferenceTags.objects\
+            .filter(content_object__in=self.queryset)\
+            .values_list('content_object_id', 'tag_id')
+        rows, matrix = tag_matrix.build(
+            self.queryset.values_list('id', flat=True), pairs.iterator())
+        pubmed_ids = self._get_pubmed_ids()
+
+        for ref in self.queryset.iterator():
             row = [
                 ref.pk,
-                ref.getPubMedID(),
+                pubmed_ids.get(ref.pk),
                 ref.get_short_citation_estimate(),
                 ref.reference_citation,
                 ref.title,
@@ -93,14 +112,8 @@ class ReferenceFlatComplete(FlatFileExporter):
                 ref.created,
                 ref.last_updated
             ]
-
-            tagsCopy = deepcopy(tags_base)
-            applyTags(tagsCopy, ref)
-            row.extend(getTagRow(tagsCopy))
-
-            rows.append(row)
-
-        return rows
+            row.extend(matrix[rows[ref.pk]].tolist())
+            yield row
 
 
 class TableBuilderFormat(FlatFileExporter):
@@ -113,7 +126,7 @@ class TableBuilderFormat(FlatFileExporter):
         ]
 
     def _get_data_rows(self):
-        return [
+        return (
             [
                 ref.getPubMedID(),
                 ref.get_short_citation_estimate(),
@@ -121,4 +134,4 @@ class TableBuilderFormat(FlatFileExporter):
                 None,
                 ref.full_text_url,
             ] for ref in self.queryset
-        ]
+        )
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from litter_getter import pubmed
+
+
+class RateLimiter(object):
+    """
+    Thread-safe limiter which spaces calls evenly to stay within a
+    requests-per-second budget; a rate of zero or None is unlimited.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate else 0.
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BlockFetcher(object):
+    """
+    Fetch content for a list of ids in blocks, using a bounded thread pool.
+    Each request is rate-limited, and failed blocks are retried with a
+    linear backoff. Results are yielded as each block completes, in no
+    particular order.
+
+    `fetch` is a callable which accepts a list of ids and returns a list of
+    results; it is called from worker threads and should not use the
+    database.
+    """
+
+    def __init__(self, fetch, block_size=1000, max_workers=3,
+                 requests_per_second=3, max_retries=3, backoff=1.):
+        self.fetch = fetch
+        self.block_size = block_size
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def get_blocks(self, ids):
+        for i in range(0, len(ids), self.block_size):
+            yield ids[i:i + self.block_size]
+
+    def _fetch_block(self, block):
+        attempt = 0
+        while True:
+            self.limiter.wait()
+            try:
+                return self.fetch(block)
+            except Exception:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logging.warning('Fetch failed for block starting with {}; retry {} of {}'.format(
+                    block[0], attempt, self.max_retries))
+                time.sleep(self.backoff * attempt)
+
+    def iter_results(self, ids):
+        blocks = self.get_blocks(ids)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # only keep a limited number of blocks in-flight so that results
+            # aren't held in memory faster than they can be consumed
+            pending = set()
+            for block in blocks:
+                pending.add(executor.submit(self._fetch_block, block))
+                if len(pending) >= self.max_workers * 2:
+                    break
+
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                        block = next(blocks, None)
+                        if block is not None:
+                            pending.add(executor.submit(self._fetch_block, block))
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+
+def pubmed_fetch(ids):
+    fetcher = pubmed.PubMedFetch(id_list=ids, retmax=len(ids))
+    # override the endpoint for this fetch only, leaving the library default
+    fetcher.base_url = settings.PUBMED_EFETCH_URL
+    return fetcher.get_content()
+
+
+def get_pubmed_fetcher(fetch=pubmed_fetch):
+    return BlockFetcher(
+        fetch,
+        block_size=1000,
+        max_workers=settings.PUBMED_MAX_WORKERS,
+        requests_per_second=settings.PUBMED_REQUESTS_PER_SECOND,
+        max_retries=settings.PUBMED_MAX_RETRIES,
+    )
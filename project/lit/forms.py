@@ -1,4 +1,3 @@
-from io import StringIO
 import logging
 import numpy as np
 import pandas as pd
@@ -6,7 +5,6 @@ import pandas as pd
 from crispy_forms import layout as cfl
 from django.core.urlresolvers import reverse_lazy
 
-from django.db.models import Q
 from django import forms
 
 from assessment.models import Assessment
@@ -186,10 +184,7 @@ class RISForm(SearchForm):
 
         try:
             # convert BytesIO file to StringIO file
-            with StringIO() as f:
-                f.write(fileObj.read().decode('utf-8-sig'))
-                f.seek(0)
-                fileObj.seek(0)
+            with models.Search.decode_import_file(fileObj) as f:
                 readable = ris.RisImporter.file_readable(f)
 
         except KeyError as err:
@@ -216,10 +211,7 @@ class RISForm(SearchForm):
         if 'import_file' in cleaned_data and not self._errors:
 
             # convert BytesIO file to StringIO file
-            with StringIO() as f:
-                f.write(cleaned_data['import_file'].read().decode('utf-8-sig'))
-                f.seek(0)
-                cleaned_data['import_file'].seek(0)
+            with models.Search.decode_import_file(cleaned_data['import_file']) as f:
                 importer = ris.RisImporter(f)
 
             self.instance._references = importer.references
@@ -329,26 +321,24 @@ class ReferenceSearchForm(forms.Form):
 
     def search(self):
         """
-        Returns a queryset of reference-search results.
+        Returns a queryset of reference-search results; text fields use
+        full-text search, ordered by relevance.
         """
-        query = Q(assessment=self.assessment)
+        fields = {
+            field: self.cleaned_data[field]
+            for field in ('title', 'authors', 'journal', 'abstract')
+            if self.cleaned_data[field]
+        }
+        if fields:
+            refs = models.Reference.objects.full_text_search(**fields)
+        else:
+            refs = models.Reference.objects.order_by('id')
+
+        refs = refs.filter(assessment=self.assessment)
         if self.cleaned_data['id']:
-            query &= Q(id=self.cleaned_data['id'])
-        if self.cleaned_data['title']:
-            query &= Q(title__icontains=self.cleaned_data['title'])
-        if self.cleaned_data['authors']:
-            query &= Q(authors__icontains=self.cleaned_data['authors'])
-        if self.cleaned_data['journal']:
-            query &= Q(journal__icontains=self.cleaned_data['journal'])
+            refs = refs.filter(id=self.cleaned_data['id'])
         if self.cleaned_data['db_id']:
-            query &= Q(identifiers__unique_id=self.cleaned_data['db_id'])
-        if self.cleaned_data['abstract']:
-            query &= Q(abstract__icontains=self.cleaned_data['abstract'])
-
-        refs = [
-            r.get_json(json_encode=False, searches=True)
-            for r in models.Reference.objects.filter(query)
-        ]
+            refs = refs.filter(identifiers__unique_id=self.cleaned_data['db_id'])
 
         return refs
 
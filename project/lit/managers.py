@@ -1,7 +1,10 @@
+import collections
 import json
 import logging
+import re
 
 from django.apps import apps
+from django.contrib.postgres.search import SearchQueryField, SearchRank
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db import models
@@ -67,73 +70,101 @@ class PubMedQueryManager(BaseManager):
     assessment_relation = 'search__assessment'
 
 
+class SearchJobManager(BaseManager):
+    assessment_relation = 'search__assessment'
+
+
 class IdentifiersManager(BaseManager):
     assessment_relation = 'references__assessment'
 
+    RIS_ACCESSION_DATABASES = {
+        'wos': constants.WOS,
+        'scopus': constants.SCOPUS,
+        'emb': constants.EMBASE,
+    }
+
+    def _get_ris_keys(self, search_id, ref):
+        # Return a list of (database, unique_id, content) tuples for each
+        # identifier in a single RIS reference; the RIS identifier is first.
+        keys = []
+
+        db = ref.get('accession_db')
+        if db:
+            db = db.lower()
+
+        # create id based on search_id and id from RIS file.
+        keys.append((
+            constants.RIS,
+            "s{}-id{}".format(search_id, ref['id']),
+            json.dumps(ref)))
+
+        # unique_ids are compared with values loaded from the database, so
+        # numeric ids (eg., PMIDs) from the RIS parser are stored as strings
+        if ref["doi"] is not None:
+            keys.append((constants.DOI, str(ref['doi']), "None"))
+
+        # (some may include both an accession number and PMID)
+        if ref["PMID"] is not None or db == "nlm":
+            id_ = ref['PMID'] or ref['accession_number']
+            if id_ is not None:
+                keys.append((constants.PUBMED, str(id_), "None"))
+
+        if db is not None and ref['accession_number']:
+            db_id = self.RIS_ACCESSION_DATABASES.get(db)
+            if db_id:
+                keys.append((db_id, str(ref['accession_number']), "None"))
+
+        return keys
+
     def get_from_ris(self, search_id, references):
-        # Return a queryset of identifiers for each object in RIS file.
-        # Expensive; requires a maximum of ~5N queries
-        pimdsFetch = []
-        refs = []
+        """
+        Return a list of identifiers for each object in RIS file, creating
+        identifiers where required. Existing identifiers are fetched with one
+        query per database and missing identifiers are bulk-created.
+        """
         Identifiers = apps.get_model('lit', 'Identifiers')
-        for ref in references:
-            ids = []
-
-            db = ref.get('accession_db')
-            if db:
-                db = db.lower()
-
-            # Create Endnote identifier
-            # create id based on search_id and id from RIS file.
-            id_ = "s{}-id{}".format(search_id, ref['id'])
-            content = json.dumps(ref)
-            ident = self.filter(database=constants.RIS, unique_id=id_).first()
-            if ident:
-                ident.update(content=content)
-            else:
-                ident = self.create(database=constants.RIS, unique_id=id_, content=content)
-            ids.append(ident)
-
-            # create DOI identifier
-            if ref["doi"] is not None:
-                ident, _ = self.get_or_create(database=constants.DOI, unique_id=ref['doi'], content="None")
-                ids.append(ident)
-
-            # create PMID identifier
-            # (some may include both an accession number and PMID)
-            if ref["PMID"] is not None or db == "nlm":
-                id_ = ref['PMID'] or ref['accession_number']
-                if id_ is not None:
-                    ident = self.filter(
-                        database=constants.PUBMED,
-                        unique_id=id_).first()
-                    if not ident:
-                        ident = self.create(
-                            database=constants.PUBMED,
-                            unique_id=id_,
-                            content='None')
-                        pimdsFetch.append(ident)
-                    ids.append(ident)
-
-            # create other accession identifiers
-            if db is not None and ref['accession_number'] is not None and ref['accession_number'] is not '':
-                db_id = None
-                if db == "wos":
-                    db_id = constants.WOS
-                elif db == "scopus":
-                    db_id = constants.SCOPUS
-                elif db == "emb":
-                    db_id = constants.EMBASE
-
-                if db_id:
-                    id_ = ref['accession_number']
-                    ident, _ = self.get_or_create(database=db_id, unique_id=id_, content="None")
-                    ids.append(ident)
-
-            refs.append(ids)
-
-        Identifiers.update_pubmed_content(pimdsFetch)
-        return refs
+        ref_keys = [self._get_ris_keys(search_id, ref) for ref in references]
+
+        # content for each unique key; RIS content is always updated
+        contents = collections.OrderedDict()
+        for keys in ref_keys:
+            for db, unique_id, content in keys:
+                if db == constants.RIS or (db, unique_id) not in contents:
+                    contents[(db, unique_id)] = content
+
+        unique_ids = collections.defaultdict(set)
+        for db, unique_id in contents.keys():
+            unique_ids[db].add(unique_id)
+
+        idents = {}
+        for db, ids in unique_ids.items():
+            for ident in self.filter(database=db, unique_id__in=ids):
+                idents[(ident.database, ident.unique_id)] = ident
+
+        # update content of existing RIS identifiers, if changed
+        for key, ident in idents.items():
+            if key[0] == constants.RIS and ident.content != contents[key]:
+                ident.content = contents[key]
+                self.filter(id=ident.id).update(content=ident.content)
+
+        # bulk-create missing identifiers
+        created = self.bulk_create([
+            Identifiers(database=db, unique_id=unique_id, content=content)
+            for (db, unique_id), content in contents.items()
+            if (db, unique_id) not in idents
+        ], batch_size=1000)
+        for ident in created:
+            idents[(ident.database, ident.unique_id)] = ident
+
+        Identifiers.update_pubmed_content([
+            ident for ident in created
+            if ident.database == constants.PUBMED
+        ])
+
+        return [
+            [idents[(db, unique_id)] for db, unique_id, _ in keys]
+            for keys in ref_keys
+        ]
 
     def get_hero_identifiers(self, hero_ids):
         # Return a queryset of identifiers, one for each hero ID. Either get or
@@ -185,9 +216,69 @@ class IdentifiersManager(BaseManager):
         return self.filter(database=constants.PUBMED, unique_id__in=idents)
 
 
+# weight of each field in `Reference.search_vector`; see lit migration 0014
+SEARCH_WEIGHTS = {
+    'title': 'A',
+    'authors': 'B',
+    'journal': 'C',
+    'abstract': 'D',
+}
+
+
+def get_tsquery(text, weight=''):
+    """
+    Convert search text into a `to_tsquery` expression where all terms are
+    required. "Quoted phrases" and hyphenated terms must be adjacent, and a
+    term ending in * matches any word with the prefix. If a weight is given,
+    words only match text in fields with that weight.
+    """
+    clauses = []
+    for phrase, term in re.findall(r'"([^"]*)"|(\S+)', text):
+        words = re.findall(r'\w+', phrase or term)
+        if len(words) == 0:
+            continue
+        labels = [weight] * len(words)
+        if term.endswith('*'):
+            labels[-1] = '*' + weight
+        words = [
+            '{}:{}'.format(word, label) if label else word
+            for word, label in zip(words, labels)
+        ]
+        clause = ' <-> '.join(words)
+        clauses.append('({})'.format(clause) if len(words) > 1 else clause)
+    return ' & '.join(clauses)
+
+
+class TsQuery(models.Func):
+    function = 'to_tsquery'
+
+    def __init__(self, query, config='pg_catalog.english'):
+        super().__init__(
+            models.Value(config), models.Value(query),
+            output_field=SearchQueryField())
+
+
 class ReferenceManager(BaseManager):
     assessment_relation = 'assessment'
 
+    def full_text_search(self, text='', **fields):
+        """
+        Return references matching the search text, ordered by relevance;
+        see `get_tsquery` for query syntax. Keyword arguments are search text
+        matched only in the named field (title, authors, journal or abstract).
+        """
+        clauses = [get_tsquery(text)] + [
+            get_tsquery(value, SEARCH_WEIGHTS[field])
+            for field, value in fields.items()
+        ]
+        query = ' & '.join(clause for clause in clauses if clause)
+        if not query:
+            return self.none()
+        tsquery = TsQuery(query)
+        return self.filter(search_vector=tsquery)\
+            .annotate(rank=SearchRank(models.F('search_vector'), tsquery))\
+            .order_by('-rank', 'id')
+
     def build_ref_ident_m2m(self, objs):
         # Bulk-create reference-search relationships
         logging.debug("Starting bulk creation of reference-identifer values")
@@ -227,51 +318,92 @@ class ReferenceManager(BaseManager):
         else:
             return ref_objs
 
-    def get_hero_references(self, search, identifiers):
+    def bulk_create_from_identifiers(self, search, identifiers):
         """
-        Given a list of Identifiers, return a list of references associated
-        with each of these identifiers.
+        Create a new reference for each identifier, and associate each with
+        the search and identifier. References are bulk-created; Postgres
+        returns primary keys, so m2m rows can be bulk-created as well.
         """
-        # Get references which already existing and are tied to this identifier
-        # but are not associated with the current search and save this search
-        # as well to this Reference.
-        refs = self.get_qs(search.assessment).filter(identifiers__in=identifiers)\
-            .exclude(searches=search)
+        refs = [ident.create_reference(search.assessment) for ident in identifiers]
+        self.bulk_create(refs, batch_size=1000)
         self.build_ref_search_m2m(refs, search)
+        self.build_ref_ident_m2m([
+            (ref.id, ident.id) for ref, ident in zip(refs, identifiers)
+        ])
+        return refs
 
-        # get references associated with these identifiers, and get a subset of
-        # identifiers which have no reference associated with them
-        refs = list(
-            self.get_qs(search.assessment).filter(identifiers__in=identifiers)
+    def _get_existing_references(self, search, identifiers):
+        # Get references which already exist and are tied to these
+        # identifiers; associate any which aren't already with this search.
+        qs = self.get_qs(search.assessment)\
+            .filter(identifiers__in=identifiers)\
+            .distinct()
+        self.build_ref_search_m2m(qs.exclude(searches=search), search)
+        refs = list(qs)
+
+        # Only process identifiers which have no reference
+        linked = set(
+            self.model.identifiers.through.objects
+                .filter(reference__in=refs, identifiers__in=identifiers)
+                .values_list('identifiers_id', flat=True)
         )
-        if refs:
-            identifiers = identifiers.exclude(references__in=refs)
+        identifiers = [
+            ident for ident in identifiers
+            if ident.id not in linked
+        ]
+        return refs, identifiers
 
+    def get_hero_references(self, search, identifiers):
+        """
+        Given a list of Identifiers, return a list of references associated
+        with each of these identifiers.
+        """
+        refs, identifiers = self._get_existing_references(search, identifiers)
+
+        # check if any identifiers have a pubmed ID that already exists
+        # in database, using a single lookup for all identifiers.
+        pmids = {}
         for identifier in identifiers:
-            # check if any identifiers have a pubmed ID that already exists
-            # in database. If not, save a new reference.
             content = json.loads(identifier.content, encoding='utf-8')
             pmid = content.get('PMID', None)
-
             if pmid:
-                ref = self.get_qs(search.assessment)\
-                    .filter(identifiers__unique_id=pmid,
-                            identifiers__database=constants.PUBMED)
-            else:
-                ref = self.none()
-
-            if ref.count() == 1:
-                ref = ref[0]
-            elif ref.count() > 1:
+                pmids[identifier.id] = str(pmid)
+
+        refs_by_pmid = collections.defaultdict(set)
+        for pmid, ref_id in self.model.identifiers.through.objects\
+                .filter(reference__assessment=search.assessment,
+                        identifiers__database=constants.PUBMED,
+                        identifiers__unique_id__in=set(pmids.values()))\
+                .values_list('identifiers__unique_id', 'reference_id'):
+            refs_by_pmid[pmid].add(ref_id)
+
+        matches = []
+        new_identifiers = []
+        for identifier in identifiers:
+            ref_ids = refs_by_pmid.get(pmids.get(identifier.id), ())
+            if len(ref_ids) > 1:
                 raise Exception("Duplicate HERO reference found")
+            elif len(ref_ids) == 1:
+                matches.append((next(iter(ref_ids)), identifier.id))
             else:
-                ref = identifier.create_reference(search.assessment)
-                ref.save()
-
-            ref.searches.add(search)
-            ref.identifiers.add(identifier)
-            refs.append(ref)
-
+                new_identifiers.append(identifier)
+
+        # associate existing PubMed references with search and identifier
+        if matches:
+            matched = self.in_bulk(set(ref_id for ref_id, _ in matches))
+            searched = set(
+                self.model.searches.through.objects
+                    .filter(search_id=search.id, reference_id__in=matched.keys())
+                    .values_list('reference_id', flat=True)
+            )
+            self.build_ref_search_m2m([
+                ref for ref in matched.values()
+                if ref.id not in searched
+            ], search)
+            self.build_ref_ident_m2m(matches)
+            refs.extend(matched[ref_id] for ref_id, _ in matches)
+
+        refs.extend(self.bulk_create_from_identifiers(search, new_identifiers))
         return refs
 
     def get_overview_details(self, assessment):
@@ -299,32 +431,8 @@ class ReferenceManager(BaseManager):
         Given a list of Identifiers, return a list of references associated
         with each of these identifiers.
         """
-        # Get references which already existing and are tied to this identifier
-        # but are not associated with the current search and save this search
-        # as well to this Reference.
-        refs = self.get_qs(search.assessment)\
-            .filter(identifiers__in=identifiers)\
-            .exclude(searches=search)
-        self.build_ref_search_m2m(refs, search)
-
-        # Get any references already are associated with these identifiers
-        refs = list(
-            self.get_qs(search.assessment)\
-                .filter(identifiers__in=identifiers)
-        )
-
-        # Only process identifiers which have no reference
-        if refs:
-            identifiers = identifiers.exclude(references__in=refs)
-
-        # don't bulkcreate because we need the pks
-        for identifier in identifiers:
-            ref = identifier.create_reference(search.assessment)
-            ref.save()
-            ref.searches.add(search)
-            ref.identifiers.add(identifier)
-            refs.append(ref)
-
+        refs, identifiers = self._get_existing_references(search, identifiers)
+        refs.extend(self.bulk_create_from_identifiers(search, identifiers))
         return refs
 
     def get_references_ready_for_import(self, assessment):
@@ -346,11 +454,27 @@ class ReferenceManager(BaseManager):
                     .values_list('pk', flat=True)
             ).distinct()
 
-    def get_references_with_tag(self, tag, descendants=False):
+    def get_tag_filter(self, tag, descendants=False, assessment_id=None):
+        """
+        Return a subquery of reference ids with the tag applied; using the
+        cached tag closure if descendant tags are included.
+        """
+        ReferenceFilterTag = apps.get_model('lit', 'ReferenceFilterTag')
+        ReferenceTags = apps.get_model('lit', 'ReferenceTags')
         tag_ids = [tag.id]
         if descendants:
-            tag_ids.extend(list(tag.get_descendants().values_list('pk', flat=True)))
-        return self.filter(tags__in=tag_ids).distinct('pk')
+            if assessment_id is None:
+                assessment_id = tag.get_assessment_id()
+            # tags missing from the closure (eg., cached before the tag was
+            # committed, or in another assessment) are resolved directly
+            tag_ids = ReferenceFilterTag.get_closure(assessment_id).get(tag.id) or \
+                [tag.id, *tag.get_descendants().values_list('id', flat=True)]
+        return ReferenceTags.objects\
+            .filter(tag_id__in=tag_ids)\
+            .values('content_object_id')
+
+    def get_references_with_tag(self, tag, descendants=False, assessment_id=None):
+        return self.filter(id__in=self.get_tag_filter(tag, descendants, assessment_id))
 
     def get_untagged_references(self, assessment):
         return self.get_qs(assessment)\
@@ -386,41 +510,91 @@ class ReferenceManager(BaseManager):
     def update_from_ris_identifiers(self, search, identifiers):
         """
         Create or update Reference from list of lists of identifiers.
-        Expensive; each reference requires 4N queries.
+        Existing references are found with a single query; new references
+        and m2m relationships are bulk-created.
         """
         assessment_id = search.assessment_id
-        for idents in identifiers:
+        RefIdM2M = self.model.identifiers.through
+        RefSearchM2M = self.model.searches.through
+
+        # map identifiers to existing references in this assessment
+        ident_ids = set(ident.id for idents in identifiers for ident in idents)
+        pairs = RefIdM2M.objects\
+            .filter(identifiers_id__in=ident_ids,
+                    reference__assessment_id=assessment_id)\
+            .order_by('reference_id')\
+            .values_list('identifiers_id', 'reference_id')
+        pairs = list(pairs)
+        existing = self.in_bulk(set(ref_id for _, ref_id in pairs))
+        ref_by_ident = {}
+        for ident_id, ref_id in pairs:
+            ref_by_ident.setdefault(ident_id, existing[ref_id])
+
+        fields = ('title', 'authors', 'year', 'journal', 'abstract')
+        originals = {
+            ref.id: tuple(getattr(ref, field) for field in fields)
+            for ref in existing.values()
+        }
 
-            # check if existing reference is found
-            ref = self.get_qs(assessment_id)\
-                .filter(identifiers__in=idents)\
-                .first()
+        # resolve each RIS record to a reference; records which share an
+        # identifier resolve to the same reference
+        refs = []
+        new_refs = []
+        for idents in identifiers:
+            ref = next(
+                (ref_by_ident[ident.id] for ident in idents
+                 if ident.id in ref_by_ident),
+                None)
+            if ref is None:
+                ref = self.model(assessment_id=assessment_id)
+                new_refs.append(ref)
+            for ident in idents:
+                ref_by_ident.setdefault(ident.id, ref)
 
-            # find ref if exists and update content
             # first identifier is from RIS file; use this content
             content = json.loads(idents[0].content)
-            if ref:
-                ref.__dict__.update(
-                    title=content['title'],
-                    authors=content['authors_short'],
-                    year=content['year'],
-                    journal=content['citation'],
-                    abstract=content['abstract'],
-                )
+            ref.__dict__.update(
+                title=content['title'],
+                authors=content['authors_short'],
+                year=content['year'],
+                journal=content['citation'],
+                abstract=content['abstract'],
+            )
+            refs.append((ref, idents))
+
+        # save changed references, and bulk-create new references
+        for ref in existing.values():
+            if tuple(getattr(ref, field) for field in fields) != originals[ref.id]:
                 ref.save()
-            else:
-                ref = self.create(
-                    assessment_id=assessment_id,
-                    title=content['title'],
-                    authors=content['authors_short'],
-                    year=content['year'],
-                    journal=content['citation'],
-                    abstract=content['abstract'],
-                )
-
-            # add all identifiers and searches
-            ref.identifiers.add(*idents)
-            ref.searches.add(search)
+        self.bulk_create(new_refs, batch_size=1000)
+
+        # add all identifiers and searches
+        ref_ids = set(ref.id for ref, _ in refs)
+        existing_idents = set(
+            RefIdM2M.objects
+                .filter(reference_id__in=existing.keys())
+                .values_list('reference_id', 'identifiers_id')
+        )
+        ref_idents = []
+        for ref, idents in refs:
+            for ident in idents:
+                pair = (ref.id, ident.id)
+                if pair not in existing_idents:
+                    existing_idents.add(pair)
+                    ref_idents.append(pair)
+        self.build_ref_ident_m2m(ref_idents)
+
+        searched = set(
+            RefSearchM2M.objects
+                .filter(search_id=search.id, reference_id__in=ref_ids)
+                .values_list('reference_id', flat=True)
+        )
+        self.build_ref_search_m2m(
+            new_refs + [
+                ref for ref in existing.values()
+                if ref.id not in searched
+            ],
+            search)
 
 
 class ReferenceTagsManager(BaseManager):
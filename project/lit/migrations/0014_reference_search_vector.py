@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# references are created in bulk, so the search vector is maintained in the
+# database instead of on model save
+VECTOR = """
+    setweight(to_tsvector('pg_catalog.english', coalesce({0}.title, '')), 'A') ||
+    setweight(to_tsvector('pg_catalog.english', coalesce({0}.authors, '')), 'B') ||
+    setweight(to_tsvector('pg_catalog.english', coalesce({0}.journal, '')), 'C') ||
+    setweight(to_tsvector('pg_catalog.english', coalesce({0}.abstract, '')), 'D')
+"""
+
+FORWARD = """
+CREATE FUNCTION lit_reference_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {new};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER lit_reference_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, authors, journal, abstract
+    ON lit_reference
+    FOR EACH ROW EXECUTE PROCEDURE lit_reference_search_vector_update();
+
+UPDATE lit_reference SET search_vector = {existing};
+""".format(new=VECTOR.format('NEW'), existing=VECTOR.format('lit_reference'))
+
+REVERSE = """
+DROP TRIGGER IF EXISTS lit_reference_search_vector_trigger ON lit_reference;
+DROP FUNCTION IF EXISTS lit_reference_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lit', '0013_searchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reference',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Weighted full-text search vector of the title, authors, journal, and abstract; set by a database trigger', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reference',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='lit_reference_search_gin'),
+        ),
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
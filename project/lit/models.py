@@ -1,11 +1,14 @@
+import collections
 from datetime import datetime
 import html.parser
-from math import ceil
+from io import StringIO
 import json
 import logging
 import re
 from urllib import parse
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
@@ -19,7 +22,7 @@ from utils.models import NonUniqueTagBase, get_crumbs, CustomURLField, Assessmen
 
 from litter_getter import ris, pubmed
 
-from . import constants, managers, tasks
+from . import constants, fetch, managers, tasks
 
 
 class TooManyPubMedResults(Exception):
@@ -124,8 +127,22 @@ class Search(models.Model):
         html_parser = html.parser.HTMLParser()
         return html_parser.unescape(strip_tags(self.search_string))
 
-    @transaction.atomic
-    def run_new_query(self):
+    def queue_job(self):
+        """
+        Create a job to run this search or import in the background; the
+        task is sent once the current transaction is committed.
+        """
+        job = SearchJob.objects.create(search=self)
+        transaction.on_commit(lambda: tasks.run_search_job.delay(job.id))
+        return job
+
+    def get_latest_job(self):
+        return self.jobs.first()
+
+    def run_new_query(self, progress=None):
+        # network requests are made outside of a transaction; the query is
+        # saved with its references, so a failed search isn't recorded as
+        # the prior query for the next run
         if self.source == constants.PUBMED:
             prior_query = None
             try:
@@ -133,36 +150,63 @@ class Search(models.Model):
             except:
                 pass
             pubmed = PubMedQuery(search=self)
-            results_dictionary = pubmed.run_new_query(prior_query)
-            self.create_new_references(results_dictionary)
+            results_dictionary = pubmed.run_new_query(prior_query, progress=progress)
+            with transaction.atomic():
+                pubmed.save()
+                self.create_new_references(results_dictionary)
         else:
             raise Exception("Search functionality disabled")
 
+    @staticmethod
+    def decode_import_file(file_obj):
+        """
+        Return the contents of a binary RIS file as a text stream; a utf-8
+        byte-order mark (added by Endnote exports) is removed.
+        """
+        contents = file_obj.read().decode('utf-8-sig')
+        file_obj.seek(0)
+        return StringIO(contents)
+
     @property
     def import_ids(self):
         return [v.strip() for v in self.search_string_text.split(',')]
 
-    @transaction.atomic
-    def run_new_import(self):
+    def run_new_import(self, progress=None):
+        # network requests are made outside of a transaction; only reference
+        # creation is atomic
         if self.source == constants.EXTERNAL_LINK:
             raise Exception("Import functionality disabled for manual import")
-        elif self.source == constants.PUBMED:
-            identifiers = Identifiers.objects.get_pubmed_identifiers(self.import_ids)
-            Reference.objects.get_pubmed_references(self, identifiers)
-        elif self.source == constants.HERO:
-            identifiers = Identifiers.objects.get_hero_identifiers(self.import_ids)
-            Reference.objects.get_hero_references(self, identifiers)
+        elif self.source in [constants.PUBMED, constants.HERO]:
+            ids = self.import_ids
+            total = len(ids)
+            if progress:
+                progress(0, total)
+            if self.source == constants.PUBMED:
+                identifiers = Identifiers.objects.get_pubmed_identifiers(ids)
+                with transaction.atomic():
+                    Reference.objects.get_pubmed_references(self, identifiers)
+            else:
+                identifiers = Identifiers.objects.get_hero_identifiers(ids)
+                with transaction.atomic():
+                    Reference.objects.get_hero_references(self, identifiers)
         elif self.source == constants.RIS:
             # check if importer references are cached on object
             refs = getattr(self, '_references', None)
             if refs is None:
-                importer = ris.RisImporter(self.import_file.path)
-                refs = importer.references
-            identifiers = Identifiers.objects.get_from_ris(self.id, refs)
-            Reference.objects.update_from_ris_identifiers(self, identifiers)
+                with open(self.import_file.path, 'rb') as f:
+                    refs = ris.RisImporter(self.decode_import_file(f)).references
+            total = len(refs)
+            if progress:
+                progress(0, total)
+            with transaction.atomic():
+                identifiers = Identifiers.objects.get_from_ris(self.id, refs)
+                Reference.objects.update_from_ris_identifiers(self, identifiers)
         else:
             raise ValueError("Unknown import type")
 
+        if progress:
+            progress(total, total)
+
     def create_new_references(self, results):
         # Create assessment-specific references for each value which return
         # result which was added, based on the new results query values, where
@@ -286,10 +330,8 @@ class Search(models.Model):
         if tag is None:
             return self.references_untagged
         else:
-            tag_ids = [tag.id]
-            if descendants:
-                tag_ids.extend(list(tag.get_descendants().values_list('pk', flat=True)))
-            return self.references.filter(tags__in=tag_ids).distinct('pk')
+            return self.references.filter(id__in=Reference.objects.get_tag_filter(
+                tag, descendants, self.assessment_id))
 
     @property
     def references_count(self):
@@ -341,7 +383,7 @@ class PubMedQuery(models.Model):
         ordering = ['-query_date']
         get_latest_by = 'query_date'
 
-    def run_new_query(self, prior_query):
+    def run_new_query(self, prior_query, progress=None):
         # Create a new search
         search = pubmed.PubMedSearch(term=self.search.search_string_text)
         search.get_ids_count()
@@ -362,12 +404,13 @@ class PubMedQuery(models.Model):
             results['added'] = list(changes['added'])
             results['removed'] = list(changes['removed'])
 
+        # identifiers are shared across searches; the query itself is saved
+        # by the caller once references are created
         self.results = json.dumps(results)
-        self.save()
-        self.create_identifiers()
+        self.create_identifiers(progress=progress)
         return results
 
-    def create_identifiers(self):
+    def create_identifiers(self, progress=None):
         # Create new PubMed identifiers for any PMIDs which are not already in
         # our database.
         new_ids = json.loads(self.results)['added']
@@ -375,22 +418,26 @@ class PubMedQuery(models.Model):
             .filter(database=constants.PUBMED, unique_id__in=new_ids)
             .values_list('unique_id', flat=True))
         ids_to_add = list(set(new_ids) - set(existing_pmids))
-        ids_to_add_len = len(ids_to_add)
-
-        block_size = 1000.
-        logging.debug("{0} IDs to be added".format(ids_to_add_len))
-        for i in range(int(ceil(ids_to_add_len/block_size))):
-            start_index = int(i*block_size)
-            end_index = min(int(i*block_size+block_size), ids_to_add_len)
-            logging.debug("Building from {0} to {1}".format(start_index, end_index))
-            fetch = pubmed.PubMedFetch(id_list=ids_to_add[start_index:end_index],
-                                retmax=int(block_size))
+        logging.debug("{0} IDs to be added".format(len(ids_to_add)))
+
+        total = len(ids_to_add)
+        processed = 0
+        if progress:
+            progress(processed, total)
+
+        # blocks are fetched concurrently; identifiers are saved from this
+        # thread as each block is returned
+        fetcher = fetch.get_pubmed_fetcher()
+        for items in fetcher.iter_results(ids_to_add):
             identifiers = []
-            for item in fetch.get_content():
+            for item in items:
                 identifiers.append(Identifiers(unique_id=item['PMID'],
                                                database=constants.PUBMED,
                                                content=json.dumps(item)))
             Identifiers.objects.bulk_create(identifiers)
+            processed += len(items)
+            if progress:
+                progress(processed, total)
 
     def get_json(self, json_encode=True):
 
@@ -411,6 +458,85 @@ class PubMedQuery(models.Model):
             return d
 
 
+class SearchJob(models.Model):
+    """
+    A background execution of a literature search or import, with progress
+    which is polled from the search detail page.
+    """
+    objects = managers.SearchJobManager()
+
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    search = models.ForeignKey(
+        Search,
+        related_name='jobs')
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES,
+        default=QUEUED)
+    total = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of identifiers to be processed")
+    processed = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of identifiers processed")
+    references_count = models.PositiveIntegerField(
+        null=True,
+        help_text="Number of references in search after completion")
+    message = models.TextField(
+        blank=True)
+    created = models.DateTimeField(
+        auto_now_add=True)
+    last_updated = models.DateTimeField(
+        auto_now=True)
+
+    class Meta:
+        ordering = ('-created', )
+        get_latest_by = 'created'
+
+    def __str__(self):
+        return '{} ({})'.format(self.search, self.get_status_display())
+
+    def get_assessment(self):
+        return self.search.get_assessment()
+
+    @property
+    def is_finished(self):
+        return self.status in [self.DONE, self.FAILED]
+
+    def update_progress(self, processed, total):
+        self.processed = processed
+        self.total = total
+        self.save(update_fields=['processed', 'total', 'last_updated'])
+
+    def run(self):
+        self.status = self.RUNNING
+        self.save()
+
+        search = self.search
+        try:
+            if search.search_type == 's':
+                search.run_new_query(progress=self.update_progress)
+            else:
+                search.run_new_import(progress=self.update_progress)
+            self.status = self.DONE
+        except Exception as err:
+            logging.exception('Literature search job failed: {}'.format(self.id))
+            self.status = self.FAILED
+            self.message = str(err)
+
+        self.references_count = search.references.count()
+        self.save()
+
+
 class Identifiers(models.Model):
     objects = managers.IdentifiersManager()
 
@@ -503,6 +629,32 @@ class ReferenceFilterTag(NonUniqueTagBase, AssessmentRootMixin, MP_Node):
         assert tag.get_root().name == cls.get_assessment_root_name(assessment_pk)
         return tag
 
+    @classmethod
+    def get_reference_counts(cls, assessment_id):
+        """
+        Return the number of references with each tag applied directly, and
+        with the tag or any descendant tag applied, for all tags in the
+        assessment.
+        """
+        pairs = ReferenceTags.objects\
+            .filter(content_object__assessment_id=assessment_id)\
+            .values_list('tag_id', 'content_object_id')
+        refs = collections.defaultdict(set)
+        for tag_id, ref_id in pairs:
+            refs[tag_id].add(ref_id)
+
+        counts = []
+        for tag_id, tag_ids in cls.get_closure(assessment_id).items():
+            descendant_refs = set()
+            for descendant_id in tag_ids:
+                descendant_refs.update(refs.get(descendant_id, ()))
+            counts.append({
+                'id': tag_id,
+                'direct': len(refs.get(tag_id, ())),
+                'total': len(descendant_refs),
+            })
+        return counts
+
     @classmethod
     def build_default(cls, assessment):
         """
@@ -621,6 +773,16 @@ class Reference(models.Model):
         null=True,
         help_text="Used internally for determining when reference was "
                   "originally added")
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text="Weighted full-text search vector of the title, authors, "
+                  "journal, and abstract; set by a database trigger")
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lit_reference_search_gin'),
+        ]
 
     def get_absolute_url(self):
         return reverse('lit:ref_detail', kwargs={'pk': self.pk})
@@ -642,8 +804,9 @@ class Reference(models.Model):
         if searches:
             d['searches'] = [ref.get_json() for ref in self.searches.all()]
 
-        d['tags'] = list(self.tags.all().values_list('pk', flat=True))
-        d['tags_text'] = list(self.tags.all().values_list('name', flat=True))
+        tags = list(self.tags.all())
+        d['tags'] = [tag.pk for tag in tags]
+        d['tags_text'] = [tag.name for tag in tags]
         if json_encode:
             return json.dumps(d, cls=HAWCDjangoJSONEncoder)
         else:
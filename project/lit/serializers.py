@@ -21,6 +21,19 @@ class IdentifiersSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class SearchJobSerializer(serializers.ModelSerializer):
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        ret['status_display'] = instance.get_status_display()
+        ret['finished'] = instance.is_finished
+        return ret
+
+    class Meta:
+        model = models.SearchJob
+        fields = '__all__'
+
+
 class ReferenceTagsSerializer(serializers.ModelSerializer):
 
     def to_internal_value(self, data):
@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.apps import apps
@@ -18,6 +19,9 @@ def invalidate_tag_cache(sender, instance, **kwargs):
     try:
         # may be root-node
         assessment_id = instance.get_assessment_id()
-        instance.clear_cache(assessment_id)
     except IndexError:
-        pass
+        return
+    instance.clear_cache(assessment_id)
+    # clear again on commit; requests made before the commit may have
+    # re-cached tags without this change
+    transaction.on_commit(lambda: instance.clear_cache(assessment_id))
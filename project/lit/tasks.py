@@ -32,6 +32,14 @@ def update_pubmed_content(ids):
             .update(content=content)
 
 
+@shared_task
+def run_search_job(job_id):
+    """Run a literature search or import in the background."""
+    logger.info('Literature search job -> {}'.format(job_id))
+    SearchJob = apps.get_model('lit', 'SearchJob')
+    SearchJob.objects.get(id=job_id).run()
+
+
 @periodic_task(run_every=timedelta(hours=1))
 def fix_pubmed_without_content():
     # Try getting pubmed data without content
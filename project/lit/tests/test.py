@@ -1,12 +1,24 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
 import os
+import tempfile
+import threading
+from urllib import parse, request
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.test.client import Client
 
 from assessment.tests.utils import build_assessments_for_permissions_testing
 
-from lit import constants, models
+from lit import constants, exports, fetch, managers, models
+
+
+def run_latest_job():
+    # jobs are queued on transaction commit, which never occurs in a
+    # TestCase; run the job synchronously instead
+    models.SearchJob.objects.latest().run()
 
 
 class ImportFormTest(TestCase):
@@ -89,6 +101,7 @@ class PubMedTest(TestCase):
         url = reverse('lit:search_query',
                       kwargs={"pk": self.assessment_pk, "slug": search.slug})
         response = self.client.get(url, self.data)
+        run_latest_job()
         self.assertTrue(response.status_code in [200, 302])
 
         self.assertEqual(models.Search.objects.count(), 3)
@@ -117,6 +130,7 @@ class PubMedTest(TestCase):
         # check successful post
         url = reverse('lit:import_new', kwargs={"pk": self.assessment_pk})
         response = self.client.post(url, self.data)
+        run_latest_job()
         self.assertTrue(response.status_code in [200, 302])
 
         # check initially blank
@@ -170,6 +184,7 @@ class HEROTest(TestCase):
         # check successful post
         url = reverse('lit:import_new', kwargs={"pk": self.assessment_pk})
         response = self.client.post(url, self.data)
+        run_latest_job()
         self.assertTrue(response.status_code in [200, 302])
 
         # check expected results
@@ -197,6 +212,7 @@ class HEROTest(TestCase):
         self.data['search_string'] = '9999999'
         url = reverse('lit:import_new', kwargs={"pk": self.assessment_pk})
         response = self.client.post(url, self.data)
+        run_latest_job()
 
         # check completion as as expected
         self.assertTrue(response.status_code in [200, 302])
@@ -223,6 +239,7 @@ class HEROTest(TestCase):
             'lit:search_query',
             kwargs={"pk": self.assessment_pk, "slug": self.pm_data['slug']})
         response = self.client.get(url_run_query)
+        run_latest_job()
         self.assertTrue(response.status_code in [200, 302])
 
         # assert that one object was created
@@ -234,6 +251,7 @@ class HEROTest(TestCase):
         self.data['search_string'] = '1200'
         url = reverse('lit:import_new', kwargs={"pk": self.assessment_pk})
         response = self.client.post(url, self.data)
+        run_latest_job()
         self.assertTrue(response.status_code in [200, 302])
 
         # assert that search & identifier created but not new reference
@@ -307,3 +325,341 @@ class RISImportTest(TestCase):
         self.assertEqual(models.Identifiers.objects.filter(database=constants.PUBMED).count(), 1)
         self.assertEqual(models.Identifiers.objects.filter(database=constants.RIS).count(), 1)
         self.assertEqual(models.Identifiers.objects.filter(database=constants.DOI).count(), 1)
+
+    def test_import_with_existing_pmid(self):
+        # a PubMed identifier created by an earlier search is reused
+        existing = models.Identifiers.objects.create(
+            database=constants.PUBMED, unique_id="19425233", content="None")
+
+        self.search.run_new_import()
+        self.assertEqual(models.Identifiers.objects.filter(database=constants.PUBMED).count(), 1)
+        ref = models.Reference.objects.get()
+        self.assertIn(existing, ref.identifiers.all())
+
+    def test_ris_keys_are_strings(self):
+        ref = {
+            'id': 1, 'doi': None, 'PMID': 19425233,
+            'accession_db': 'NLM', 'accession_number': 19425233,
+        }
+        keys = models.Identifiers.objects._get_ris_keys(self.search.id, ref)
+        self.assertEqual(
+            [(db, unique_id) for db, unique_id, _ in keys],
+            [(constants.RIS, 's{}-id1'.format(self.search.id)),
+             (constants.PUBMED, '19425233')])
+
+    def test_import_with_bom(self):
+        # Endnote exports begin with a utf-8 byte-order mark
+        with open(self.search.import_file.path, 'rb') as f:
+            contents = f.read()
+        with tempfile.NamedTemporaryFile(suffix='.ris') as f:
+            f.write(b'\xef\xbb\xbf' + contents)
+            f.flush()
+            self.search.import_file = TestFile(f.name)
+            self.search.run_new_import()
+        self.assertEqual(models.Reference.objects.count(), 1)
+        self.assertEqual(models.Identifiers.objects.filter(database=constants.RIS).count(), 1)
+
+    def test_reimport(self):
+        # importing the same file twice updates, rather than duplicates
+        self.search.run_new_import()
+        self.search.run_new_import()
+        self.assertEqual(models.Reference.objects.count(), 1)
+        self.assertEqual(models.Identifiers.objects.count(), 3)
+
+        ref = models.Reference.objects.first()
+        self.assertEqual(ref.identifiers.count(), 3)
+        self.assertEqual(ref.searches.count(), 1)
+
+    def test_job(self):
+        job = self.search.queue_job()
+        self.assertEqual(job.status, models.SearchJob.QUEUED)
+
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.SearchJob.DONE)
+        self.assertEqual(job.total, 1)
+        self.assertEqual(job.processed, 1)
+        self.assertEqual(job.references_count, 1)
+        self.assertEqual(self.search.get_latest_job(), job)
+
+
+class EFetchStandIn(BaseHTTPRequestHandler):
+    # local stand-in for E-utilities efetch; fails the first request for
+    # each block so that retries are exercised
+    failed = set()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        data = parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        ids = data['id'][0].split(',')
+        with self.lock:
+            fail = ids[0] not in self.failed
+            self.failed.add(ids[0])
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps([{'PMID': id_} for id_ in ids]).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class BlockFetcherTest(SimpleTestCase):
+
+    def setUp(self):
+        EFetchStandIn.failed = set()
+        self.server = HTTPServer(('127.0.0.1', 0), EFetchStandIn)
+        self.url = 'http://127.0.0.1:{}/efetch.fcgi'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _fetch(self, ids):
+        data = parse.urlencode({'id': ','.join(ids)}).encode('utf-8')
+        with request.urlopen(self.url, data=data) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+    def test_fetch(self):
+        ids = [str(i) for i in range(25)]
+        fetcher = fetch.BlockFetcher(
+            self._fetch, block_size=10, max_workers=2,
+            requests_per_second=0, max_retries=1, backoff=0)
+        results = list(fetcher.iter_results(ids))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(
+            sorted(item['PMID'] for items in results for item in items),
+            sorted(ids))
+
+    def test_retries_exhausted(self):
+        fetcher = fetch.BlockFetcher(
+            self._fetch, block_size=10, max_workers=2,
+            requests_per_second=0, max_retries=0, backoff=0)
+        with self.assertRaises(Exception):
+            list(fetcher.iter_results(['1', '2']))
+
+    def test_rate_limiter(self):
+        limiter = fetch.RateLimiter(100)
+        start = limiter.next_time
+        for i in range(5):
+            limiter.wait()
+        self.assertAlmostEqual(limiter.next_time - start, 0.05, delta=0.02)
+
+
+class EFetchXMLStandIn(BaseHTTPRequestHandler):
+    # local stand-in for E-utilities efetch, returning a PubmedArticleSet
+    article = """
+    <PubmedArticle>
+        <MedlineCitation Status="MEDLINE" Owner="NLM">
+            <PMID Version="1">{id}</PMID>
+            <Article PubModel="Print">
+                <Journal>
+                    <JournalIssue CitedMedium="Internet">
+                        <Volume>1</Volume>
+                        <PubDate><Year>2010</Year></PubDate>
+                    </JournalIssue>
+                    <Title>Journal of Testing</Title>
+                    <ISOAbbreviation>J Test</ISOAbbreviation>
+                </Journal>
+                <ArticleTitle>Article {id}</ArticleTitle>
+                <Pagination><MedlinePgn>1-10</MedlinePgn></Pagination>
+                <Abstract><AbstractText>Abstract {id}</AbstractText></Abstract>
+                <AuthorList CompleteYN="Y">
+                    <Author ValidYN="Y">
+                        <LastName>Smith</LastName>
+                        <ForeName>Jane</ForeName>
+                        <Initials>J</Initials>
+                    </Author>
+                </AuthorList>
+            </Article>
+        </MedlineCitation>
+        <PubmedData>
+            <ArticleIdList>
+                <ArticleId IdType="pubmed">{id}</ArticleId>
+            </ArticleIdList>
+        </PubmedData>
+    </PubmedArticle>"""
+
+    requests = []
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        data = parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        ids = ','.join(data['id']).split(',')
+        EFetchXMLStandIn.requests.append(data)
+        content = '<?xml version="1.0"?><PubmedArticleSet>{}</PubmedArticleSet>'.format(
+            ''.join(self.article.format(id=id_) for id_ in ids))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.end_headers()
+        self.wfile.write(content.encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class CreateIdentifiersTest(TestCase):
+
+    def setUp(self):
+        EFetchXMLStandIn.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), EFetchXMLStandIn)
+        self.url = 'http://127.0.0.1:{}/efetch.fcgi'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_create_identifiers(self):
+        models.Identifiers.objects.create(
+            database=constants.PUBMED, unique_id='1001', content='None')
+        ids = ['1001', '1002', '1003']
+        query = models.PubMedQuery(results=json.dumps({'ids': ids, 'added': ids, 'removed': []}))
+        with override_settings(PUBMED_EFETCH_URL=self.url, PUBMED_REQUESTS_PER_SECOND=0):
+            query.create_identifiers()
+
+        # only identifiers which don't exist are fetched
+        self.assertEqual(len(EFetchXMLStandIn.requests), 1)
+        self.assertEqual(
+            sorted(','.join(EFetchXMLStandIn.requests[0]['id']).split(',')),
+            ['1002', '1003'])
+
+        idents = models.Identifiers.objects\
+            .filter(database=constants.PUBMED)\
+            .order_by('unique_id')
+        self.assertEqual(
+            list(idents.values_list('unique_id', flat=True)), ids)
+        content = json.loads(idents.get(unique_id='1002').content)
+        self.assertEqual(str(content['PMID']), '1002')
+        self.assertEqual(content['title'], 'Article 1002')
+
+
+class TagMatrixTest(SimpleTestCase):
+
+    tags = [{
+        'id': 1, 'data': {'name': 'root'}, 'children': [
+            {'id': 2, 'data': {'name': 'a'}, 'children': [
+                {'id': 3, 'data': {'name': 'b'}},
+                {'id': 4, 'data': {'name': 'c'}},
+            ]},
+            {'id': 5, 'data': {'name': 'd'}},
+        ]
+    }]
+
+    def test_build(self):
+        matrix = exports.TagMatrix(self.tags, include_parent_tag=False)
+        self.assertEqual(
+            models.ReferenceFilterTag.get_flattened_taglist(self.tags, False),
+            ['a', 'a|b', 'a|c', 'd'])
+        rows, values = matrix.build([10, 11, 12], [(10, 4), (11, 5), (11, 3), (12, 1)])
+        self.assertEqual(values[rows[10]].tolist(), [True, False, True, False])
+        self.assertEqual(values[rows[11]].tolist(), [True, True, False, True])
+        self.assertEqual(values[rows[12]].tolist(), [False, False, False, False])
+
+        matrix = exports.TagMatrix(self.tags, include_parent_tag=True)
+        rows, values = matrix.build([10], [(10, 3)])
+        self.assertEqual(values[rows[10]].tolist(), [True, True, True, False, False])
+
+
+class TagClosureTest(TestCase):
+
+    def setUp(self):
+        build_assessments_for_permissions_testing(self)
+        self.assessment_id = self.assessment_working.id
+        models.ReferenceFilterTag.clear_cache(self.assessment_id)
+        tags = models.ReferenceFilterTag.get_assessment_qs(self.assessment_id)
+        self.inclusion = tags.get(name='Inclusion')
+        self.human = tags.get(name='Human Study')
+        self.ref1 = models.Reference.objects.create(assessment_id=self.assessment_id)
+        self.ref2 = models.Reference.objects.create(assessment_id=self.assessment_id)
+        models.ReferenceTags.objects.create(tag=self.human, content_object=self.ref1)
+        models.ReferenceTags.objects.create(tag=self.inclusion, content_object=self.ref1)
+        models.ReferenceTags.objects.create(tag=self.human, content_object=self.ref2)
+
+    def test_closure(self):
+        closure = models.ReferenceFilterTag.get_closure(self.assessment_id)
+        self.assertEqual(closure[self.inclusion.id][0], self.inclusion.id)
+        self.assertIn(self.human.id, closure[self.inclusion.id])
+        self.assertEqual(closure[self.human.id], [self.human.id])
+
+        refs = models.Reference.objects.get_references_with_tag(
+            self.inclusion, descendants=True, assessment_id=self.assessment_id)
+        self.assertEqual(set(refs), {self.ref1, self.ref2})
+        refs = models.Reference.objects.get_references_with_tag(self.inclusion)
+        self.assertEqual(list(refs), [self.ref1])
+
+    def test_closure_missing_tag(self):
+        # a closure cached before a tag was committed doesn't include it
+        closure = models.ReferenceFilterTag.get_closure(self.assessment_id)
+        tag = self.human.add_child(name='Stale')
+        models.ReferenceTags.objects.create(tag=tag, content_object=self.ref2)
+        cache.set(models.ReferenceFilterTag.get_closure_cache_name(self.assessment_id), closure)
+
+        refs = models.Reference.objects.get_references_with_tag(
+            self.human, descendants=True, assessment_id=self.assessment_id)
+        self.assertEqual(set(refs), {self.ref1, self.ref2})
+        refs = models.Reference.objects.get_references_with_tag(
+            tag, descendants=True, assessment_id=self.assessment_id)
+        self.assertEqual(list(refs), [self.ref2])
+
+        # tags which aren't in the given assessment's closure
+        refs = models.Reference.objects.get_references_with_tag(
+            self.inclusion, descendants=True, assessment_id=self.assessment_final.id)
+        self.assertEqual(set(refs), {self.ref1, self.ref2})
+
+    def test_refs_json_paginated(self):
+        client = Client()
+        self.assertTrue(client.login(username='pm@pm.com', password='pw'))
+        url = reverse('lit:refs_json', kwargs={'pk': self.assessment_id,
+                                               'tag_id': self.inclusion.id})
+
+        data = json.loads(client.get(url).content.decode('utf-8'))
+        self.assertEqual((data['count'], data['page'], data['num_pages']), (2, 1, 1))
+        self.assertEqual([d['pk'] for d in data['refs']], [self.ref1.id, self.ref2.id])
+        self.assertEqual(client.get(url, {'page': 2}).status_code, 404)
+
+    def test_counts(self):
+        counts = {
+            d['id']: d
+            for d in models.ReferenceFilterTag.get_reference_counts(self.assessment_id)
+        }
+        self.assertEqual(counts[self.inclusion.id]['direct'], 1)
+        self.assertEqual(counts[self.inclusion.id]['total'], 2)
+        self.assertEqual(counts[self.human.id]['direct'], 2)
+
+    def test_api(self):
+        c = Client()
+        self.assertTrue(c.login(email='pm@pm.com', password='pw'))
+        url = reverse('lit:api:tags-references', args=(self.inclusion.id, ))
+        response = c.get(url, {'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 1)
+
+        url = reverse('lit:api:tags-counts')
+        response = c.get(url, {'assessment_id': self.assessment_id})
+        self.assertEqual(response.status_code, 200)
+
+        c.logout()
+        response = c.get(url, {'assessment_id': self.assessment_id})
+        self.assertEqual(response.status_code, 403)
+
+
+class FullTextQueryTest(SimpleTestCase):
+
+    def test_get_tsquery(self):
+        self.assertEqual(managers.get_tsquery('liver tox*'), 'liver & tox:*')
+        self.assertEqual(
+            managers.get_tsquery('"dose response" rats'), '(dose <-> response) & rats')
+        self.assertEqual(managers.get_tsquery('dose-response*'), '(dose <-> response:*)')
+        self.assertEqual(managers.get_tsquery("it's & | !"), '(it <-> s)')
+        self.assertEqual(managers.get_tsquery('"" *'), '')
+        self.assertEqual(managers.get_tsquery('liver tox*', 'A'), 'liver:A & tox:*A')
+        self.assertEqual(
+            managers.get_tsquery('"dose response"', 'D'), '(dose:D <-> response:D)')
@@ -8,6 +8,8 @@ from . import views, api
 router = DefaultRouter()
 router.register(r'tags', api.ReferenceFilterTag, base_name="tags")
 router.register(r'reference-cleanup', api.ReferenceCleanup, base_name="reference-cleanup")
+router.register(r'reference-search', api.ReferenceSearch, base_name="reference-search")
+router.register(r'search-job', api.SearchJob, base_name="search-job")
 
 urlpatterns = [
 
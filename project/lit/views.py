@@ -2,6 +2,7 @@ import json
 
 from datetime import datetime
 
+from django.core.paginator import InvalidPage, Paginator
 from django.core.urlresolvers import reverse_lazy
 from django.forms.models import model_to_dict
 from django.http import HttpResponseRedirect, Http404, HttpResponse
@@ -104,7 +105,8 @@ class RefDownloadExcel(BaseList):
 
     def get_queryset(self):
         if self.tag:
-            return self.model.objects.get_references_with_tag(self.tag, descendants=True)
+            return self.model.objects.get_references_with_tag(
+                self.tag, descendants=True, assessment_id=self.assessment.id)
         else:
             return self.model.objects.get_qs(self.assessment)
 
@@ -165,7 +167,7 @@ class ImportNew(SearchNew):
     search_type = 'Import'
 
     def post_object_save(self, form):
-        self.object.run_new_import()
+        self.object.queue_job()
 
 
 class ImportRISNew(ImportNew):
@@ -185,6 +187,11 @@ class SearchDetail(BaseDetail):
                                 assessment=self.kwargs.get('pk'))
         return super().get_object(object=obj)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['job'] = self.object.get_latest_job()
+        return context
+
 
 class SearchUpdate(BaseUpdate):
     success_message = 'Search updated.'
@@ -262,14 +269,12 @@ class SearchQuery(BaseUpdate):
         return super().get_object(object=obj)
 
     def get(self, request, *args, **kwargs):
+        # searches are run in the background; the detail page polls for
+        # progress of the latest job
         self.object = self.get_object()
-        try:
-            self.object.run_new_query()
-        except models.TooManyPubMedResults as e:
-            return HttpResponse("""
-                                <p>PubMed Search error: <br>{0}</p>
-                                <p>Please perform a more targeted-search.</p>
-                                """.format(e))
+        job = self.object.get_latest_job()
+        if job is None or job.is_finished:
+            self.object.queue_job()
         return HttpResponseRedirect(self.object.get_absolute_url())
 
 
@@ -505,6 +510,7 @@ class RefEdit(BaseUpdate):
 class RefSearch(AssessmentPermissionsMixin, FormView):
     template_name = 'lit/reference_search.html'
     form_class = forms.ReferenceSearchForm
+    max_results = 100
 
     def dispatch(self, *args, **kwargs):
         self.assessment = get_object_or_404(Assessment, pk=kwargs['pk'])
@@ -518,7 +524,14 @@ class RefSearch(AssessmentPermissionsMixin, FormView):
 
     def form_valid(self, form):
         refs = form.search()
+        count = refs.count()
+        refs = refs.prefetch_related('searches', 'identifiers', 'tags')
+        refs = [
+            ref.get_json(json_encode=False, searches=True)
+            for ref in refs[:self.max_results]
+        ]
         return HttpResponse(json.dumps({"status": "success",
+                                        "count": count,
                                         "refs": refs}),
                             content_type="application/json")
 
@@ -531,13 +544,16 @@ class RefSearch(AssessmentPermissionsMixin, FormView):
 
 
 class RefsByTagJSON(BaseDetail):
+    """
+    References with a tag (including descendant tags), or untagged
+    references, optionally in a single search; paginated using the `page`
+    query parameter.
+    """
     model = Assessment
+    paginate_by = 100
 
     def get_context_data(self, **kwargs):
-        response = {"status": "success", "refs": []}
-        search_id = self.request.GET.get('search_id', None)
-        if search_id is not None:
-            search_id = int(search_id)
+        search_id = tryParseInt(self.request.GET.get('search_id'))
 
         tag_id = self.kwargs.get('tag_id', None)
         tag = None
@@ -546,24 +562,34 @@ class RefsByTagJSON(BaseDetail):
                 self.assessment.id, int(tag_id))
 
         if search_id:
-            search = models.Search.objects.get(id=search_id)
-            refs = search\
-                .get_references_with_tag(tag=tag, descendants=True)\
-                .prefetch_related('searches', 'identifiers')
+            search = get_object_or_404(
+                models.Search, id=search_id, assessment=self.assessment)
+            refs = search.get_references_with_tag(tag=tag, descendants=True)
         elif tag:
             refs = models.Reference.objects\
-                .get_references_with_tag(tag, descendants=True)\
-                .prefetch_related('searches', 'identifiers')
+                .get_references_with_tag(tag, descendants=True,
+                                         assessment_id=self.assessment.id)
         else:
             refs = models.Reference.objects\
-                .get_untagged_references(self.assessment)\
-                .prefetch_related('searches', 'identifiers')
+                .get_untagged_references(self.assessment)
 
-        response["refs"] = [
-            ref.get_json(json_encode=False, searches=True)
-            for ref in refs
-        ]
-        self.response = response
+        paginator = Paginator(refs.order_by('id'), self.paginate_by)
+        try:
+            page = paginator.page(tryParseInt(self.request.GET.get('page'), 1))
+        except InvalidPage:
+            raise Http404()
+        refs = page.object_list.prefetch_related('searches', 'identifiers', 'tags')
+
+        self.response = {
+            "status": "success",
+            "count": paginator.count,
+            "page": page.number,
+            "num_pages": paginator.num_pages,
+            "refs": [
+                ref.get_json(json_encode=False, searches=True)
+                for ref in refs
+            ],
+        }
 
     def render_to_response(self, context, **response_kwargs):
         return HttpResponse(json.dumps(self.response), content_type="application/json")
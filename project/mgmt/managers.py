@@ -11,18 +11,21 @@ class TaskManager(BaseManager):
     def owned_by(self, user):
         return self.filter(owner=user)
 
-    def create_assessment_tasks(self, assessment):
+    def create_assessment_tasks(self, assessment, study_ids=None):
         """
         Create tasks for all studies in assessment and save to database.
 
         Tasks are only added, not removed with changes. Method called via
-        signal whenever assessment is created/modified.
+        signal whenever assessment is created/modified, and for studies
+        bulk-copied into an assessment (`study_ids`), which send no signals.
         """
         if not assessment.enable_project_management:
             return
         studies = Study.objects\
             .assessment_qs(assessment.id)\
             .prefetch_related('tasks')
+        if study_ids is not None:
+            studies = studies.filter(id__in=study_ids)
         tasks = []
         for study in studies:
             tasks.extend(self._get_missing_tasks(study, assessment))
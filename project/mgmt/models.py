@@ -84,11 +84,11 @@ class Task(models.Model):
 
     @staticmethod
     def get_qs_json(queryset, json_encode=True):
-        tasks = [task.get_json(json_encode=False) for task in queryset]
+        tasks = SerializerHelper.get_serialized_many(queryset)
         if json_encode:
             return json.dumps(tasks, cls=HAWCDjangoJSONEncoder)
         else:
-            return outcomes
+            return tasks
 
 
     def save(self, *args, **kwargs):
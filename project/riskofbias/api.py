@@ -50,9 +50,9 @@ class RiskOfBias(viewsets.ModelViewSet):
         if serializer.instance.final and serializer.instance.is_complete:
             Task.objects.ensure_rob_stopped(study)
 
-        # send time complete task
+        # record time spent editing
         if not serializer.errors:
-            TimeSpentEditing.add_time_spent_job(
+            TimeSpentEditing.add_time_spent(
                 self.request.session.session_key,
                 serializer.instance.get_edit_url(),
                 serializer.instance,
@@ -1,6 +1,6 @@
 from . import models
 from study.models import Study
-from utils.helper import FlatFileExporter
+from utils.helper import FlatFileExporter, SerializerHelper
 
 
 class RiskOfBiasFlat(FlatFileExporter):
@@ -16,9 +16,7 @@ class RiskOfBiasFlat(FlatFileExporter):
         return header
 
     def _get_data_rows(self):
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
             row = []
             row.extend(Study.flat_complete_data_row(ser))
 
@@ -33,8 +31,7 @@ class RiskOfBiasFlat(FlatFileExporter):
             for score in scores:
                 row_copy = list(row)  # clone
                 row_copy.extend(models.RiskOfBiasScore.flat_complete_data_row(score))
-                rows.append(row_copy)
-        return rows
+                yield row_copy
 
 
 class RiskOfBiasCompleteFlat(RiskOfBiasFlat):
@@ -49,9 +46,7 @@ class RiskOfBiasCompleteFlat(RiskOfBiasFlat):
         return header
 
     def _get_data_rows(self):
-        rows = []
-        for obj in self.queryset:
-            ser = obj.get_json(json_encode=False)
+        for ser in SerializerHelper.iter_serialized_many(self.queryset):
             row = []
             row.extend(Study.flat_complete_data_row(ser))
             for rob in ser.get('riskofbiases', []):
@@ -60,5 +55,4 @@ class RiskOfBiasCompleteFlat(RiskOfBiasFlat):
                     row_copy = list(row)
                     row_copy.extend(models.RiskOfBiasScore.flat_complete_data_row(score))
                     row_copy.extend(rob_data)
-                    rows.append(row_copy)
-        return rows
+                    yield row_copy
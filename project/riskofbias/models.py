@@ -14,6 +14,7 @@ from reversion import revisions as reversion
 from assessment.models import Assessment
 from myuser.models import HAWCUser
 from study.models import Study
+from utils.cloning import BulkCloner
 from utils.helper import cleanHTML, HAWCDjangoJSONEncoder, SerializerHelper
 from utils.models import get_crumbs
 
@@ -227,6 +228,8 @@ class RiskOfBias(models.Model):
     last_updated = models.DateTimeField(
         auto_now=True)
 
+    COPY_NAME = 'riskofbiases'
+
     class Meta:
         verbose_name_plural = 'Study Evaluation'
         ordering = ('final',)
@@ -255,7 +258,7 @@ class RiskOfBias(models.Model):
 
     @staticmethod
     def get_qs_json(queryset, json_encode=True):
-        robs = [rob.get_json(json_encode=False) for rob in queryset]
+        robs = SerializerHelper.get_serialized_many(queryset)
         if json_encode:
             return json.dumps(robs, cls=HAWCDjangoJSONEncoder)
         else:
@@ -366,22 +369,21 @@ class RiskOfBias(models.Model):
         # from the old RiskOfBiasMetric ID.
 
         author = assessment.project_manager.first()
-        final_robs = cls.objects.filter(study__in=studies, active=True, final=True)
-
-        # copy reviews and scores
-        for rob in final_robs:
-            scores = list(rob.scores.all())
-
-            rob.id = None
-            rob.study_id = cw[Study.COPY_NAME][rob.study_id]
-            rob.author = author
-            rob.save()
-
-            for score in scores:
-                score.id = None
-                score.riskofbias_id = rob.id
-                score.metric_id = cw[RiskOfBiasMetric.COPY_NAME][score.metric_id]
-                score.save()
+        cloner = BulkCloner(cw)
+
+        # copy reviews and scores; caches are invalidated by
+        # Study.copy_across_assessment when the transaction is committed.
+        ids = cloner.clone(
+            cls.objects.filter(study__in=studies, active=True, final=True),
+            cls.COPY_NAME,
+            remaps={'study_id': Study.COPY_NAME},
+            updates={'author_id': author.id if author else None})
+        cloner.clone(
+            RiskOfBiasScore.objects.filter(riskofbias_id__in=ids),
+            remaps={
+                'riskofbias_id': cls.COPY_NAME,
+                'metric_id': RiskOfBiasMetric.COPY_NAME,
+            })
 
         return cw
 
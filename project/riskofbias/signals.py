@@ -1,9 +1,12 @@
 import logging
 
 from django.apps import apps
+from django.db import transaction
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
+from utils.warmup import cache_refresher
+
 from . import models
 
 
@@ -18,11 +21,10 @@ def invalidate_caches_rob_metrics(sender, instance, **kwargs):
     elif sender is models.RiskOfBiasMetric:
         assessment_id = instance.domain.assessment_id
 
-    ids = Study.objects\
-        .filter(assessment_id=assessment_id)\
-        .values_list('id', flat=True)
-
-    Study.delete_caches(ids)
+    # bumped and re-warmed once per assessment when the transaction commits
+    cache_refresher.add(Study, assessment_id)
+    transaction.on_commit(
+        lambda: Study.delete_overall_confidence_caches([assessment_id]))
 
 
 @receiver(post_save, sender=models.RiskOfBiasMetric)
@@ -81,9 +83,13 @@ def invalidate_caches_risk_of_bias(sender, instance, **kwargs):
     if sender is models.RiskOfBias:
         rob_ids = [instance.id]
         study_ids = [instance.study_id]
+        assessment_ids = [instance.study.assessment_id]
     elif sender is models.RiskOfBiasScore:
         rob_ids = [instance.riskofbias.id]
         study_ids = [instance.riskofbias.study_id]
+        assessment_ids = [instance.riskofbias.study.assessment_id]
 
     models.RiskOfBias.delete_caches(rob_ids)
     Study.delete_caches(study_ids)
+    transaction.on_commit(
+        lambda: Study.delete_overall_confidence_caches(assessment_ids))
@@ -1,8 +1,12 @@
 "use strict";
-var page = require('webpage').create(),
+// Usage:
+//   phantomjs rasterize.js input.html output.[png|pdf]
+//   phantomjs rasterize.js
+// With no arguments, runs as a long-lived worker; each line on stdin is a
+// JSON job {"id", "input", "output"}, and a JSON result {"id", "ok"} is
+// written to stdout after each job is rendered.
+var webpage = require('webpage'),
     system = require('system'),
-    address = system.args[1],
-    output = system.args[2],
     renderTimeout = 500,
     pageEvalGetSvgSize = function(){
         var d = document.querySelector('svg').getBoundingClientRect();
@@ -13,82 +17,109 @@ var page = require('webpage').create(),
             width: d.width,
         };
     },
-    renderAndExit = function(){
-        // Wait for animations, after viewport size change
-        window.setTimeout(function(){
-            page.render(output);
-            phantom.exit();
-        }, renderTimeout);
-    },
-    getPdf = function(){
-        var svg = page.evaluate(pageEvalGetSvgSize);
+    render = function(address, output, done){
+        var page = webpage.create(),
+            renderAndExit = function(){
+                // Wait for animations, after viewport size change
+                window.setTimeout(function(){
+                    page.render(output);
+                    page.close();
+                    done(true);
+                }, renderTimeout);
+            },
+            getPdf = function(){
+                var svg = page.evaluate(pageEvalGetSvgSize);
 
-        page.viewportSize = {
-            height: (2 * svg.top + svg.height),
-            width: (2 * svg.left + svg.width),
-        };
+                page.viewportSize = {
+                    height: (2 * svg.top + svg.height),
+                    width: (2 * svg.left + svg.width),
+                };
 
-        page.paperSize = {
-            height: (20 + 2 * svg.top + svg.height) + 'px',
-            width: (10 + 2 * svg.left + svg.width) + 'px',
-            margin: '5px',
-        };
+                page.paperSize = {
+                    height: (20 + 2 * svg.top + svg.height) + 'px',
+                    width: (10 + 2 * svg.left + svg.width) + 'px',
+                    margin: '5px',
+                };
 
-        renderAndExit();
+                renderAndExit();
 
-    }, getRasterization = function(){
-        var svg = page.evaluate(pageEvalGetSvgSize),
-            zoomFactor = 3;
+            }, getRasterization = function(){
+                var svg = page.evaluate(pageEvalGetSvgSize),
+                    zoomFactor = 3;
 
-        page.zoomFactor = zoomFactor;
+                page.zoomFactor = zoomFactor;
 
-        page.clipRect = {
-            top: svg.top,
-            height: svg.height * zoomFactor + 15,
-            left: svg.left,
-            width: svg.width * zoomFactor + 15,
-        };
+                page.clipRect = {
+                    top: svg.top,
+                    height: svg.height * zoomFactor + 15,
+                    left: svg.left,
+                    width: svg.width * zoomFactor + 15,
+                };
+
+                page.viewportSize = {
+                    height: 2 * svg.top + svg.height * zoomFactor,
+                    width: 2 * svg.left + svg.width * zoomFactor,
+                };
+
+                renderAndExit();
+            },
+            func = (output.substr(-4) === '.pdf') ? getPdf : getRasterization,
+            onPageReady = function(){
+                window.setTimeout(func, renderTimeout);
+            },
+            checkReadyState = function() {
+                // continue to check until ready-state is complete
+                setTimeout(function () {
+                    var readyState = page.evaluate(function () {
+                        return document.readyState;
+                    });
+                    if (readyState === 'complete') {
+                        onPageReady();
+                    } else {
+                        checkReadyState();
+                    }
+                });
+            },
+            onLoadFinished = function (status) {
+                // page loaded but other resources may not be complete
+                if (status === 'success') {
+                    checkReadyState();
+                } else {
+                    page.close();
+                    done(false);
+                }
+            };
 
+        // start with a large viewport to render maximum-size
         page.viewportSize = {
-            height: 2 * svg.top + svg.height * zoomFactor,
-            width: 2 * svg.left + svg.width * zoomFactor,
+            height: 1440,
+            width: 2560,
         };
 
-        renderAndExit();
-    };
-
-var func = (output.substr(-4) === '.pdf') ? getPdf : getRasterization,
-    onPageReady = function(){
-        window.setTimeout(func, renderTimeout);
+        page.open(address, onLoadFinished);
     },
-    checkReadyState = function() {
-        // continue to check until ready-state is complete
-        setTimeout(function () {
-            var readyState = page.evaluate(function () {
-                return document.readyState;
-            });
-            if (readyState === 'complete') {
-                onPageReady();
-            } else {
-                checkReadyState();
-            }
-        });
-    },
-    onLoadFinished = function (status) {
-        // page loaded but other resources may not be complete
-        if (status === 'success') {
-            checkReadyState();
-        } else {
-            console.log('Unable to load the address!');
-            phantom.exit(1);
+    nextJob = function(){
+        var line = system.stdin.readLine(),
+            job;
+        if (!line) {
+            phantom.exit();
+            return;
         }
+        job = JSON.parse(line);
+        render(job.input, job.output, function(ok){
+            system.stdout.writeLine(JSON.stringify({id: job.id, ok: ok}));
+            system.stdout.flush();
+            window.setTimeout(nextJob, 0);
+        });
     };
 
-// start with a large viewport to render maximum-size
-page.viewportSize = {
-    height: 1440,
-    width: 2560,
-};
-
-
-page.open(address, onLoadFinished);
+if (system.args.length > 2) {
+    render(system.args[1], system.args[2], function(ok){
+        if (!ok) {
+            console.log('Unable to load the address!');
+        }
+        phantom.exit(ok ? 0 : 1);
+    });
+} else {
+    nextJob();
+}
@@ -38,3 +38,6 @@ class Command(BaseCommand):
 
             cw = RiskOfBias.copy_across_assessment(
                 cw, source_studies, target_assessment)
+
+        for name, values in sorted(cw.items()):
+            self.stdout.write('Copied {}: {}'.format(name, len(values)))
@@ -13,6 +13,14 @@ class StudyManager(BaseManager):
         return self.get_qs(assessment_id)\
                   .values_list('id', 'short_citation')
 
+    def optimized_qs(self, **filters):
+        return self.filter(**filters)\
+                .prefetch_related(
+                    'identifiers',
+                    'searches',
+                    'riskofbiases__scores__metric__domain',
+                )
+
     def rob_scores(self, assessment_id=None):
         return self.get_qs(assessment_id)\
                 .annotate(final_score=models.Sum(
@@ -2,11 +2,11 @@ import json
 import logging
 import os
 import collections
-import itertools
 
 from django.db import models, transaction
 from django.db.models import Prefetch
 from django.apps import apps
+from django.core.cache import cache
 from django.core.exceptions import (ValidationError, ObjectDoesNotExist,
                                     MultipleObjectsReturned)
 from django.core.urlresolvers import reverse
@@ -16,7 +16,10 @@ from reversion import revisions as reversion
 
 from assessment.models import Assessment
 from assessment.serializers import AssessmentSerializer
+from assessment.tasks import warm_cache
 from lit.models import Reference
+from utils import counts
+from utils.cloning import BulkCloner
 from utils.helper import HAWCDjangoJSONEncoder, SerializerHelper, cleanHTML
 from utils.models import get_crumbs
 
@@ -134,6 +137,8 @@ class Study(Reference):
 
     COPY_NAME = "studies"
 
+    OVERALL_CONFIDENCE_CACHE_NAME = 'study.models.Study.overall-confidence.assessment-{}'
+
     class Meta:
         verbose_name_plural = "Studies"
         ordering = ("short_citation", )
@@ -158,10 +163,11 @@ class Study(Reference):
     def copy_across_assessment(cls, studies, assessment):
         # copy selected studies from one assessment to another.
         cw = collections.defaultdict(dict)
+        ids = [study.id for study in studies]
 
         # assert all studies come from a single assessment
         source_assessment = Assessment.objects\
-            .filter(references__in=studies)\
+            .filter(references__in=ids)\
             .distinct()\
             .values_list('id', flat=True)
         if len(source_assessment) != 1:
@@ -169,69 +175,61 @@ class Study(Reference):
         source_assessment = source_assessment[0]
         cw[Assessment.COPY_NAME][source_assessment] = assessment.id
 
-        # copy studies; flag if any epi-meta studies exist
-        any_epi_meta = False
-        for study in studies:
-            logging.info('Copying study {} to assessment {}'
-                         .format(study.id, assessment.id))
-
-            # get child-types and copy
-            children = []
-
-            if study.bioassay:
-                children.extend(list(study.experiments.all()))
-
-            if study.epi:
-                children.extend(list(study.study_populations.all()))
-
-            if study.in_vitro:
-                children.extend(itertools.chain(
-                    study.ivchemicals.all(),
-                    study.ivcelltypes.all(),
-                    study.ivexperiments.all()))
-
-            if study.epi_meta:
-                any_epi_meta = True
-                children.extend(list(study.meta_protocols.all()))
-
-            # copy study and references
-            study._copy_across_assessment(cw)
-
-            for child in children:
-                child.copy_across_assessments(cw)
-
-        # Copy epimeta.SingleResult after copying studies because to ensure
-        # Study clones have already been created.
-        if any_epi_meta:
-            logging.info('Copying epi results')
-            SingleResult = apps.get_model('epimeta', 'SingleResult')
-            results = SingleResult.objects\
-                .filter(meta_result__protocol__study__in=studies)
-            for result in results:
-                result.copy_across_assessments(cw)
+        logging.info('Copying {} studies to assessment {}'
+                     .format(len(ids), assessment.id))
+
+        # copy studies and references, and identifiers (except RIS which is
+        # assessment-specific); all studies are copied before any children.
+        cloner = BulkCloner(cw)
+        types = list(
+            cls.objects
+                .filter(id__in=ids)
+                .values_list('id', 'bioassay', 'epi', 'in_vitro', 'epi_meta'))
+        cloner.clone(
+            cls.objects.filter(id__in=ids),
+            cls.COPY_NAME,
+            remaps={'assessment_id': Assessment.COPY_NAME})
+        cloner.clone_m2m(cls, 'identifiers', cls.COPY_NAME, ids,
+                         identifiers__database__in=[0, 1, 2])
+
+        # copy children, one level at a time, for each study type
+        bioassay_ids = [row[0] for row in types if row[1]]
+        epi_ids = [row[0] for row in types if row[2]]
+        in_vitro_ids = [row[0] for row in types if row[3]]
+        epi_meta_ids = [row[0] for row in types if row[4]]
+
+        apps.get_model('animal', 'Experiment')\
+            .copy_across_assessments(cloner, bioassay_ids)
+        apps.get_model('epi', 'StudyPopulation')\
+            .copy_across_assessments(cloner, epi_ids)
+        for model_name in ('IVChemical', 'IVCellType', 'IVExperiment'):
+            apps.get_model('invitro', model_name)\
+                .copy_across_assessments(cloner, in_vitro_ids)
+        apps.get_model('epimeta', 'MetaProtocol')\
+            .copy_across_assessments(cloner, epi_meta_ids)
+
+        # bulk inserts don't send signals; create management tasks and
+        # invalidate the assessment once
+        apps.get_model('mgmt', 'Task').objects.create_assessment_tasks(
+            assessment, study_ids=list(cw[cls.COPY_NAME].values()))
+        cls.invalidate_assessment_caches(assessment.id)
 
         return cw
 
-    def _copy_across_assessment(self, cw):
-        # copy reference and identifiers
-        # (except RIS which is assessment-specific)
-        ref = self.reference_ptr
-        idents = ref.identifiers.filter(database__in=[0, 1, 2])\
-                    .values_list('id', flat=True)
-        ref.id = None
-        ref.assessment_id = cw[Assessment.COPY_NAME][self.assessment_id]
-        ref.save()
-        ref.identifiers.add(*idents)
-
-        # copy study
-        old_id = self.id
-        self.id = None
-        self.reference_ptr = ref
-        self.assessment_id = cw[Assessment.COPY_NAME][self.assessment_id]
-        self.save()
-
-        # save self to crosswalk
-        cw[self.COPY_NAME][old_id] = self.id
+    @classmethod
+    def invalidate_assessment_caches(cls, assessment_id):
+        """
+        Invalidate all serialized objects and object counts in an assessment
+        when the current transaction is committed, and re-warm the cache.
+        """
+        def invalidate():
+            for model in list(SerializerHelper.serializers.keys()):
+                SerializerHelper.bump_generation(model, assessment_id)
+            counts.invalidate_assessment(assessment_id)
+            cls.delete_overall_confidence_caches([assessment_id])
+            warm_cache.delay(assessment_id)
+
+        transaction.on_commit(invalidate)
 
     def clean(self):
         pk_exclusion = {}
@@ -338,7 +336,7 @@ class Study(Reference):
 
     @staticmethod
     def get_docx_template_context(assessment, queryset):
-        studies = [SerializerHelper.get_serialized(study, json=False) for study in queryset]
+        studies = SerializerHelper.get_serialized_many(queryset)
         return {
             "assessment": AssessmentSerializer().to_representation(assessment),
             "studies": studies
@@ -393,14 +391,47 @@ class Study(Reference):
         else:
             return -1
 
+    @classmethod
+    def get_overall_confidence_index(cls, assessment_id):
+        """
+        Return a dictionary of {study_id: overall-confidence} for all studies
+        in an assessment which have a final overall-confidence score, using
+        the same encoding as `get_overall_confidence`. Built using a single
+        aggregate query and cached alongside study serializations.
+        """
+        key = cls.OVERALL_CONFIDENCE_CACHE_NAME.format(assessment_id)
+        index = cache.get(key)
+        if index is not None:
+            logging.debug('using cache: {}'.format(key))
+            return index
+
+        RiskOfBiasScore = apps.get_model('riskofbias', 'RiskOfBiasScore')
+        scores = RiskOfBiasScore.objects\
+            .filter(
+                riskofbias__study__assessment_id=assessment_id,
+                riskofbias__active=True,
+                riskofbias__final=True,
+                metric__domain__is_overall_confidence=True)\
+            .order_by()\
+            .values('riskofbias__study_id')\
+            .annotate(n=models.Count('id'), score=models.Max('score'))
+
+        index = {
+            d['riskofbias__study_id']: (d['score'] + 1) % 11 if d['n'] == 1 else -1
+            for d in scores
+        }
+        logging.debug('setting cache: {}'.format(key))
+        cache.set(key, index)
+        return index
+
+    @classmethod
+    def delete_overall_confidence_caches(cls, assessment_ids):
+        names = [cls.OVERALL_CONFIDENCE_CACHE_NAME.format(id) for id in set(assessment_ids)]
+        logging.debug("Removing caches: {}".format(', '.join(names)))
+        cache.delete_many(names)
+
     def optimized_for_serialization(self):
-        return self.__class__.objects\
-            .filter(id=self.id)\
-            .prefetch_related(
-                'identifiers',
-                'searches',
-                'riskofbiases__scores__metric__domain',
-            ).first()
+        return self.__class__.objects.optimized_qs(id=self.id).first()
 
     def get_study(self):
         return self
@@ -412,8 +443,7 @@ class Study(Reference):
             return False
         else:
             return (self.editable and
-                    (user in assessment.project_manager.all() or
-                     user in assessment.team_members.all()))
+                    assessment.user_is_editor(user))
 
 class Attachment(models.Model):
     objects = managers.AttachmentManager()
@@ -1,17 +1,15 @@
 from django.apps import apps
+from django.db import transaction
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
-from utils.helper import SerializerHelper
+from utils.helper import cache_invalidator
 
 from . import models
 
 
-def clear_cache(Model, filters):
-    ids = Model.objects\
-        .filter(**filters)\
-        .values_list('id', flat=True)
-    SerializerHelper.delete_caches(Model, ids)
+def clear_cache(Model, filters, resolve=False):
+    cache_invalidator.add(Model, filters=filters, resolve=resolve)
 
 
 @receiver(post_save, sender=models.Study)
@@ -26,31 +24,39 @@ def update_study_rob_scores(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=models.Study)
 @receiver(pre_delete, sender=models.Study)
-def invalidate_caches_study(sender, instance, **kwargs):
-    models.Study.delete_caches([instance.id])
+def invalidate_caches_study(sender, instance, signal, **kwargs):
+    cache_invalidator.add(models.Study, [instance.id])
+    assessment_id = instance.assessment_id
+    transaction.on_commit(
+        lambda: models.Study.delete_overall_confidence_caches([assessment_id]))
+    resolve = signal is pre_delete
 
     if instance.bioassay:
         clear_cache(
             apps.get_model('animal', 'Endpoint'),
-            {'animal_group__experiment__study': instance.id}
+            {'animal_group__experiment__study': instance.id},
+            resolve
         )
 
     if instance.epi:
         clear_cache(
             apps.get_model('epi', 'Outcome'),
-            {'study_population__study': instance.id}
+            {'study_population__study': instance.id},
+            resolve
         )
 
     if instance.in_vitro:
         clear_cache(
             apps.get_model('invitro', 'ivendpoint'),
-            {'experiment__study_id': instance.id}
+            {'experiment__study_id': instance.id},
+            resolve
         )
 
     if instance.epi_meta:
         clear_cache(
             apps.get_model('epimeta', 'MetaResult'),
-            {'protocol__study': instance.id}
+            {'protocol__study': instance.id},
+            resolve
         )
 
 
@@ -1,8 +1,12 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from rest_framework.decorators import detail_route
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import BaseFilterBackend
+from rest_framework.response import Response
 from assessment.api import AssessmentViewset, DisabledPagination, InAssessmentFilter
 
-from . import models, serializers
+from . import models, serializers, tasks
 
 
 class UnpublishedFilter(BaseFilterBackend):
@@ -36,8 +40,32 @@ class DataPivot(AssessmentViewset):
         cls = serializers.DataPivotSerializer
         if self.action == "list":
             cls = serializers.CollectionDataPivotSerializer
+        elif self.action == "export":
+            cls = serializers.DataPivotExportSerializer
         return cls
 
+    @detail_route(methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Start a background export of the data-pivot dataset, or return the
+        status of an existing export if the dataset is unchanged; ping until
+        the export is finished and then use the download url.
+        """
+        instance = self.get_object()
+        if not hasattr(instance, 'datapivotquery'):
+            raise NotFound('Exports are only available for query data-pivots.')
+
+        format_ = request.query_params.get('format', 'excel')
+        if format_ not in models.DataPivotExport.CONTENT_TYPES:
+            raise ValidationError('Unknown export format: {}'.format(format_))
+
+        export, queued = instance.datapivotquery.get_or_create_export(format_)
+        if queued:
+            transaction.on_commit(lambda: tasks.build_data_pivot_export.delay(export.id))
+
+        serializer = self.get_serializer(export)
+        return Response(serializer.data)
+
 
 class Visual(AssessmentViewset):
     """
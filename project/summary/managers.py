@@ -39,3 +39,7 @@ class DataPivotUploadManager(BaseManager):
 
 class DataPivotQueryManager(BaseManager):
     assessment_relation = 'assessment'
+
+
+class DataPivotExportManager(BaseManager):
+    assessment_relation = 'data_pivot__assessment'
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summary', '0021_auto_20181128_1124'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataPivotExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_format', models.CharField(max_length=8)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Queued'), (1, 'Running'), (2, 'Done'), (3, 'Failed')], default=0)),
+                ('file', models.FileField(blank=True, max_length=250, upload_to='data_pivot_exports')),
+                ('message', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_pivot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to='summary.DataPivotQuery')),
+            ],
+            options={
+                'get_latest_by': 'last_updated',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='datapivotexport',
+            unique_together=set([('data_pivot', 'export_format', 'content_hash')]),
+        ),
+    ]
@@ -1,11 +1,16 @@
 from datetime import datetime
-from operator import methodcaller
+import hashlib
 import json
+import logging
+import os
+import tempfile
 
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
+from django.core.files import File
 from django.core.urlresolvers import reverse
+from django.http import FileResponse
 from django.utils.html import strip_tags
 
 from assessment.models import Assessment, DoseUnits, BaseEndpoint
@@ -313,7 +318,9 @@ class Visual(models.Model):
                     qs = self.studies.all()
 
         if self.sort_order == "overall_confidence":
-            sorted_studies = sorted(qs, key=methodcaller('get_overall_confidence'), reverse=True)
+            confidence = Study.get_overall_confidence_index(self.assessment_id)
+            sorted_studies = sorted(
+                qs, key=lambda study: confidence.get(study.id, -1), reverse=True)
             return sorted_studies
         else:
             return qs.order_by(self.sort_order)
@@ -339,15 +346,11 @@ class Visual(models.Model):
             "last_updated": datetime.now().isoformat()
         }
 
-        data["endpoints"] = [
-            SerializerHelper.get_serialized(e, json=False)
-            for e in self.get_endpoints(request)
-        ]
+        data["endpoints"] = SerializerHelper.get_serialized_many(
+            self.get_endpoints(request))
 
-        data["studies"] = [
-            SerializerHelper.get_serialized(s, json=False)
-            for s in self.get_studies(request)
-        ]
+        data["studies"] = SerializerHelper.get_serialized_many(
+            self.get_studies(request))
 
         return json.dumps(data)
 
@@ -614,6 +617,57 @@ class DataPivotQuery(DataPivot):
         exporter = self._get_dataset_exporter(qs, format_)
         return exporter.build_response()
 
+    def get_content_hash(self, format_):
+        """
+        Return a hash of all inputs to a dataset export: the query settings,
+        the dataset size, and the cache version of the exported model in this
+        assessment. Cache invalidation signals change the version whenever a
+        serialized object changes, so the dataset isn't serialized here.
+        """
+        qs = self.get_queryset()
+        h = hashlib.sha256()
+        inputs = [
+            format_, self.evidence_type, self.export_style,
+            self.preferred_units, self.prefilters, self.published_only,
+            qs.count(), SerializerHelper.get_version(qs.model, self.assessment_id),
+        ]
+        h.update(json.dumps(inputs).encode('utf8'))
+        confidence = Study.get_overall_confidence_index(self.assessment_id)
+        h.update(json.dumps(sorted(confidence.items())).encode('utf8'))
+        return h.hexdigest()
+
+    def get_completed_export(self, format_, content_hash=None):
+        """
+        Return a completed export for the current dataset, or None.
+        """
+        if content_hash is None:
+            content_hash = self.get_content_hash(format_)
+        return self.exports\
+            .filter(export_format=format_,
+                    content_hash=content_hash,
+                    status=DataPivotExport.DONE)\
+            .first()
+
+    def get_or_create_export(self, format_):
+        """
+        Return the export for the current dataset, creating a new queued
+        export if no export exists or if the previous attempt failed. Returns
+        a tuple of (export, queued), where queued is True if the export needs
+        to be built.
+        """
+        content_hash = self.get_content_hash(format_)
+        export, created = DataPivotExport.objects.get_or_create(
+            data_pivot=self,
+            export_format=format_,
+            content_hash=content_hash)
+        queued = created
+        if export.status == DataPivotExport.FAILED:
+            export.status = DataPivotExport.QUEUED
+            export.message = ''
+            export.save()
+            queued = True
+        return export, queued
+
     @property
     def visual_type(self):
         if self.evidence_type == BIOASSAY:
@@ -628,6 +682,118 @@ class DataPivotQuery(DataPivot):
             raise ValueError("Unknown type")
 
 
+class DataPivotExport(models.Model):
+    """
+    A dataset export for a DataPivotQuery, built in the background and stored
+    in media storage. Exports are keyed by a content-hash of their inputs, so
+    an existing file is reused until the data or query settings change.
+    """
+    objects = managers.DataPivotExportManager()
+
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    CONTENT_TYPES = {
+        'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'tsv': 'text/tab-separated-values',
+    }
+    EXTENSIONS = {
+        'excel': 'xlsx',
+        'tsv': 'tsv',
+    }
+
+    data_pivot = models.ForeignKey(
+        DataPivotQuery,
+        related_name='exports')
+    export_format = models.CharField(
+        max_length=8)
+    content_hash = models.CharField(
+        max_length=64)
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES,
+        default=QUEUED)
+    file = models.FileField(
+        upload_to='data_pivot_exports',
+        max_length=250,
+        blank=True)
+    message = models.TextField(
+        blank=True)
+    created = models.DateTimeField(
+        auto_now_add=True)
+    last_updated = models.DateTimeField(
+        auto_now=True)
+
+    class Meta:
+        unique_together = (('data_pivot', 'export_format', 'content_hash'), )
+        get_latest_by = 'last_updated'
+
+    def __str__(self):
+        return '{} ({})'.format(self.data_pivot, self.export_format)
+
+    def get_assessment(self):
+        return self.data_pivot.get_assessment()
+
+    def get_filename(self):
+        return '{}-{}.{}'.format(
+            self.data_pivot.slug,
+            self.content_hash[:12],
+            self.EXTENSIONS[self.export_format])
+
+    @property
+    def is_finished(self):
+        return self.status in [self.DONE, self.FAILED]
+
+    def build(self):
+        """
+        Generate the export file, and remove previous exports of the same
+        data-pivot and format which are now stale.
+        """
+        self.status = self.RUNNING
+        self.save()
+
+        dp = self.data_pivot
+        try:
+            exporter = dp._get_dataset_exporter(dp.get_queryset(), self.export_format)
+            response = exporter.build_response()
+            with tempfile.TemporaryFile() as f:
+                for chunk in response.streaming_content:
+                    f.write(chunk)
+                response.close()
+                f.seek(0)
+                self.file.save(self.get_filename(), File(f), save=False)
+            self.status = self.DONE
+        except Exception as err:
+            logging.exception('Data pivot export failed: {}'.format(self.id))
+            self.status = self.FAILED
+            self.message = str(err)
+        self.save()
+
+        if self.status == self.DONE:
+            stale = dp.exports\
+                .filter(export_format=self.export_format,
+                        status__in=[self.DONE, self.FAILED])\
+                .exclude(id=self.id)
+            for export in stale:
+                export.file.delete(save=False)
+            stale.delete()
+
+    def get_response(self):
+        response = FileResponse(
+            self.file.storage.open(self.file.name, 'rb'),
+            content_type=self.CONTENT_TYPES[self.export_format])
+        fn = os.path.basename(self.file.name)
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(fn)
+        return response
+
+
 class Prefilter(object):
     """
     Helper-object to deal with DataPivot and Visual prefilters fields.
@@ -30,6 +30,23 @@ class DataPivotSerializer(CollectionDataPivotSerializer):
         return ret
 
 
+class DataPivotExportSerializer(serializers.ModelSerializer):
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        ret['status_display'] = instance.get_status_display()
+        ret['finished'] = instance.is_finished
+        ret['download_url'] = None
+        if instance.status == instance.DONE:
+            ret['download_url'] = '{}?format={}'.format(
+                instance.data_pivot.get_download_url(), instance.export_format)
+        return ret
+
+    class Meta:
+        model = models.DataPivotExport
+        exclude = ('file', 'content_hash', )
+
+
 class CollectionVisualSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
@@ -52,14 +69,10 @@ class VisualSerializer(CollectionVisualSerializer):
         ret['url_update'] = instance.get_update_url()
         ret['url_delete'] = instance.get_delete_url()
 
-        ret["endpoints"] = [
-            SerializerHelper.get_serialized(d, json=False)
-            for d in instance.get_endpoints()
-        ]
+        ret["endpoints"] = SerializerHelper.get_serialized_many(
+            instance.get_endpoints())
 
-        ret["studies"] = [
-            SerializerHelper.get_serialized(d, json=False)
-            for d in instance.get_studies()
-        ]
+        ret["studies"] = SerializerHelper.get_serialized_many(
+            instance.get_studies())
 
         return ret
@@ -0,0 +1,12 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.apps import apps
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def build_data_pivot_export(export_id):
+    logger.info('Data pivot export -> {}'.format(export_id))
+    export = apps.get_model('summary', 'DataPivotExport').objects.get(id=export_id)
+    export.build()
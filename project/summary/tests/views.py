@@ -1,8 +1,12 @@
 import json
 
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.client import Client
 
+from animal.tests.utils import build_endpoints_for_permission_testing
 from assessment.tests.utils import build_assessments_for_permissions_testing
+from utils.helper import cache_invalidator
 
 from .. import models, forms
 
@@ -95,3 +99,57 @@ class SummaryTextTests(TestCase):
         self.assertEqual(
             SummaryTextTests.comparableTree(root),
             """[{"data": {"title": "assessment-1"}, "children": [{"data": {"title": "lvl_1a"}, "children": [{"data": {"title": "lvl_2a"}}, {"data": {"title": "lvl_2b"}}]}, {"data": {"title": "lvl_1b"}}]}]""")
+
+
+class DataPivotExportTests(TestCase):
+
+    def setUp(self):
+        build_endpoints_for_permission_testing(self)
+        self.data_pivot = models.DataPivotQuery.objects.create(
+            assessment=self.assessment_working,
+            title='endpoints',
+            slug='endpoints',
+            evidence_type=models.BIOASSAY,
+            published_only=False)
+        self.url = reverse('summary:data_pivot-export', args=[self.data_pivot.id])
+        self.client = Client()
+        self.assertTrue(self.client.login(username='pm@pm.com', password='pw'))
+
+    def get_export(self, format_='tsv'):
+        response = self.client.get(self.url, {'format': format_})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_export_queued(self):
+        data = self.get_export()
+        self.assertEqual(data['status'], models.DataPivotExport.QUEUED)
+        export = models.DataPivotExport.objects.get()
+        self.assertEqual(export.data_pivot_id, self.data_pivot.id)
+        self.assertEqual(export.export_format, 'tsv')
+
+        # unchanged dataset reuses the existing export
+        self.get_export()
+        self.assertEqual(models.DataPivotExport.objects.count(), 1)
+
+        # each format is exported separately
+        self.get_export('excel')
+        self.assertEqual(models.DataPivotExport.objects.count(), 2)
+
+    def test_export_data_changed(self):
+        self.get_export()
+        hash_ = models.DataPivotExport.objects.get().content_hash
+
+        # invalidations are flushed on commit, which doesn't occur in a test
+        self.endpoint_working.name = 'changed'
+        self.endpoint_working.save()
+        cache_invalidator.flush()
+
+        self.get_export()
+        self.assertEqual(models.DataPivotExport.objects.count(), 2)
+        self.assertNotEqual(
+            models.DataPivotExport.objects.latest('id').content_hash, hash_)
+
+    def test_export_unknown_format(self):
+        response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.DataPivotExport.objects.count(), 0)
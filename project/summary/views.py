@@ -344,6 +344,9 @@ class DataPivotData(GetDataPivotObjectMixin, BaseDetail):
             response['Content-Disposition'] = f'attachment; filename="{fn}"'
             return response
         elif hasattr(self.object, 'datapivotquery'):
+            export = self.object.datapivotquery.get_completed_export(format_)
+            if export:
+                return export.get_response()
             return self.object.get_dataset(format_)
         else:
             raise Http404()
@@ -0,0 +1,164 @@
+"""
+Bulk cloning of model rows, used to copy studies across assessments.
+
+Rows are cloned one model (level) at a time: each level is loaded with a
+single query, foreign keys are remapped through a crosswalk of
+{copy_name: {old_id: new_id}}, and the clones are inserted in batches.
+Inserts don't send model signals; callers should invalidate caches once
+when the copy is complete.
+"""
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Value, When
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BulkCloner(object):
+
+    def __init__(self, cw, batch_size=500):
+        self.cw = cw
+        self.batch_size = batch_size
+
+    def _remap(self, field, copy_name, value):
+        if value is None:
+            return None
+        if field.null:
+            # optional relations outside of the copied set are dropped
+            return self.cw[copy_name].get(value)
+        return self.cw[copy_name][value]
+
+    def _get_fields(self, model, names):
+        return {
+            name: next(f for f in model._meta.concrete_fields if f.attname == name)
+            for name in names
+        }
+
+    def _insert_children(self, model, objs):
+        # bulk_create doesn't support multi-table inheritance; parents are
+        # created first, and child rows are inserted with a parent pointer
+        fields = model._meta.local_concrete_fields
+        db = router.db_for_write(model)
+        max_size = connections[db].ops.bulk_batch_size(fields, objs)
+        for batch in chunks(objs, min(self.batch_size, max_size or self.batch_size)):
+            model._base_manager._insert(batch, fields=fields, using=db)
+
+    def clone(self, queryset, copy_name=None, remaps=None, updates=None):
+        """
+        Clone all objects in a queryset. `remaps` is a dictionary of
+        {attname: copy_name} for foreign keys to objects which have already
+        been cloned, and `updates` a dictionary of {attname: value} to set
+        on each clone. Returns a list of the source object ids.
+        """
+        model = queryset.model
+        remaps = remaps or {}
+        updates = updates or {}
+        objs = list(queryset)
+        if len(objs) == 0:
+            return []
+
+        fields = self._get_fields(model, remaps.keys())
+        old_ids = []
+        for obj in objs:
+            old_ids.append(obj.pk)
+            for name, value in updates.items():
+                setattr(obj, name, value)
+            for name, name_copy in remaps.items():
+                setattr(obj, name, self._remap(
+                    fields[name], name_copy, getattr(obj, name)))
+
+        if model._meta.parents:
+            # single-level multi-table inheritance (eg., Study -> Reference)
+            (parent_model, ptr), = model._meta.parents.items()
+            parent_fields = parent_model._meta.concrete_fields
+            parents = []
+            for obj in objs:
+                parent = parent_model(**{
+                    f.attname: getattr(obj, f.attname) for f in parent_fields})
+                parent.pk = None
+                parents.append(parent)
+            parent_model._base_manager.bulk_create(parents, batch_size=self.batch_size)
+            for obj, parent in zip(objs, parents):
+                setattr(obj, parent_model._meta.pk.attname, parent.pk)
+                setattr(obj, ptr.attname, parent.pk)
+            self._insert_children(model, objs)
+        else:
+            for obj in objs:
+                obj.pk = None
+            model._base_manager.bulk_create(objs, batch_size=self.batch_size)
+
+        if copy_name is not None:
+            self.cw[copy_name].update(
+                (old_id, obj.pk) for old_id, obj in zip(old_ids, objs))
+
+        return old_ids
+
+    def clone_m2m(self, model, name, copy_name, ids, target_copy_name=None, **filters):
+        """
+        Clone many-to-many relations `name` of `model` objects with source
+        `ids`, which have already been cloned as `copy_name`. If
+        `target_copy_name` is given, related objects are also remapped and
+        relations to objects which weren't cloned are dropped.
+        """
+        field = model._meta.get_field(name)
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+        filters['{}__in'.format(source)] = ids
+        remaps = {source: copy_name}
+        if target_copy_name is not None:
+            filters['{}__in'.format(target)] = list(self.cw[target_copy_name].keys())
+            remaps[target] = target_copy_name
+
+        return self.clone(through.objects.filter(**filters), remaps=remaps)
+
+    def clone_unique(self, queryset, copy_name, key, remaps):
+        """
+        Map objects to existing objects with identical `key` fields and
+        remapped foreign keys (eg., the same name in the target assessment),
+        cloning only those which don't already exist.
+        """
+        model = queryset.model
+        fields = self._get_fields(model, remaps.keys())
+        names = list(remaps.keys()) + list(key)
+        filters = {
+            '{}__in'.format(name): list(self.cw[name_copy].values())
+            for name, name_copy in remaps.items()
+        }
+        existing = {
+            tuple(row[:-1]): row[-1] for row in
+            model._base_manager
+                .filter(**filters)
+                .values_list(*(names + ['pk']))
+        }
+
+        missing = []
+        for obj in queryset:
+            values = [
+                self._remap(fields[name], name_copy, getattr(obj, name))
+                for name, name_copy in remaps.items()
+            ]
+            values.extend(getattr(obj, name) for name in key)
+            target_id = existing.get(tuple(values))
+            if target_id is None:
+                missing.append(obj.pk)
+            else:
+                self.cw[copy_name][obj.pk] = target_id
+
+        self.clone(model._base_manager.filter(pk__in=missing),
+                   copy_name, remaps=remaps)
+
+    def remap_field(self, model, name, copy_name, ids):
+        """
+        Remap a foreign key on already-cloned `model` objects with `ids`;
+        used when two levels refer to each other.
+        """
+        mapping = list(self.cw[copy_name].items())
+        for batch in chunks(mapping, self.batch_size):
+            whens = [When(**{name: old, 'then': Value(new)}) for old, new in batch]
+            model._base_manager\
+                .filter(pk__in=ids, **{'{}__in'.format(name): [old for old, _ in batch]})\
+                .update(**{name: Case(*whens, output_field=IntegerField())})
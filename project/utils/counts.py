@@ -0,0 +1,211 @@
+"""
+Object counts used for site statistics and assessment summaries.
+
+Counts are stored in the cache, and computed on the first read. Models in
+`COUNTED_MODELS` (and their inheritance parents and children) are kept
+current by save/delete signals; all counts are periodically reconciled by the
+`assessment.tasks.reconcile_counts` task, which corrects drift from bulk
+operations and lost updates. Large tables (as reported by planner
+statistics) are estimated instead of counted.
+
+Large leaf tables (eg., reference tags and evaluation scores) are
+intentionally not signal-tracked; a delete receiver would disable fast
+cascade-deletes for these models.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+
+# models whose global counts are updated incrementally
+COUNTED_MODELS = (
+    'myuser.HAWCUser',
+    'assessment.Assessment',
+    'lit.Reference',
+    'study.Study',
+    'animal.Endpoint',
+    'epi.Outcome',
+    'epi.Result',
+    'epimeta.MetaResult',
+    'invitro.IVEndpoint',
+    'summary.Visual',
+    'summary.DataPivot',
+)
+
+# models which are also counted per assessment
+ASSESSMENT_COUNT_MODELS = (
+    'animal.Endpoint',
+    'epi.Outcome',
+    'epimeta.MetaResult',
+    'invitro.IVEndpoint',
+)
+
+COVERAGE_KEY = 'counts-coverage'
+
+
+def get_key(model, assessment_id=None):
+    key = 'counts-{}'.format(model._meta.label_lower)
+    if assessment_id is not None:
+        key = '{}-assessment-{}'.format(key, assessment_id)
+    return key
+
+
+def get_estimate(model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def count_model(model, assessment_id=None):
+    if assessment_id is not None:
+        return model.objects.get_qs(assessment_id).count()
+
+    # use planner statistics instead of a sequential scan for large tables
+    estimate = get_estimate(model)
+    if estimate > settings.COUNTS_ESTIMATE_THRESHOLD:
+        return estimate
+    return model._default_manager.count()
+
+
+def get_counts(models, assessment_id=None):
+    """
+    Return a dictionary of {model: count}; counts which aren't cached are
+    computed and cached.
+    """
+    keys = {get_key(model, assessment_id): model for model in models}
+    cached = cache.get_many(list(keys.keys()))
+    counts = {}
+    for key, model in keys.items():
+        count = cached.get(key)
+        if count is None:
+            count = count_model(model, assessment_id)
+            # don't overwrite a value set concurrently by reconcile
+            cache.add(key, count, None)
+        counts[model] = count
+    return counts
+
+
+def get_count(model, assessment_id=None):
+    return get_counts([model], assessment_id)[model]
+
+
+def get_counted_models():
+    """
+    Models in `COUNTED_MODELS`, and their multi-table inheritance parents and
+    children; saving a child only sends a signal for the child, but parents
+    are deleted (and signaled) separately.
+    """
+    counted = set(apps.get_model(label) for label in COUNTED_MODELS)
+    models = set()
+    for model in apps.get_models():
+        lineage = [model] + model._meta.get_parent_list()
+        if counted.intersection(lineage):
+            models.update(lineage)
+    return sorted(models, key=lambda model: model._meta.label)
+
+
+def increment(model, assessment_id, delta, parents=False):
+    """
+    Adjust cached counts for a model (and its parents, if `parents`), and
+    the assessment count if given. Counts which aren't cached are skipped;
+    they'll be computed on the next read.
+    """
+    keys = [get_key(model)]
+    if parents:
+        keys.extend(get_key(parent) for parent in model._meta.get_parent_list())
+    if assessment_id is not None:
+        keys.append(get_key(model, assessment_id))
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def get_assessment_id(instance):
+    if instance._meta.label not in ASSESSMENT_COUNT_MODELS:
+        return None
+    return instance.get_assessment().id
+
+
+def invalidate_assessment(assessment_id):
+    cache.delete_many([
+        get_key(apps.get_model(label), assessment_id)
+        for label in ASSESSMENT_COUNT_MODELS
+    ])
+
+
+def get_coverage():
+    """
+    Return distinct counts of objects with related content, which are too
+    expensive to maintain incrementally; refreshed by `reconcile`.
+    """
+    coverage = cache.get(COVERAGE_KEY)
+    if coverage is None:
+        coverage = compute_coverage()
+        cache.set(COVERAGE_KEY, coverage, None)
+    return coverage
+
+
+def _distinct_count(model, field):
+    return apps.get_model(model).objects\
+        .order_by()\
+        .values(field)\
+        .distinct()\
+        .count()
+
+
+def compute_coverage():
+    visual_assessments = set(
+        apps.get_model('summary', 'Visual').objects
+            .order_by()
+            .values_list('assessment_id', flat=True)
+            .distinct())
+    visual_assessments.update(
+        apps.get_model('summary', 'DataPivot').objects
+            .order_by()
+            .values_list('assessment_id', flat=True)
+            .distinct())
+
+    return dict(
+        tags=count_model(apps.get_model('lit', 'ReferenceTags')),
+        rob_scores=count_model(apps.get_model('riskofbias', 'RiskOfBiasScore')),
+        references_tagged=_distinct_count('lit.ReferenceTags', 'content_object_id'),
+        assessments_with_studies=_distinct_count('study.Study', 'assessment_id'),
+        studies_with_rob=_distinct_count('riskofbias.RiskOfBias', 'study_id'),
+        endpoints_with_data=_distinct_count('animal.EndpointGroup', 'endpoint_id'),
+        results_with_data=_distinct_count('epi.GroupResult', 'result_id'),
+        assessments_with_visuals=len(visual_assessments),
+    )
+
+
+def reconcile():
+    """
+    Recompute all model counts, per-assessment counts, and coverage counts.
+    Returns the number of counts set.
+    """
+    values = {}
+    for model in apps.get_models():
+        values[get_key(model)] = count_model(model)
+
+    assessment_ids = list(
+        apps.get_model('assessment', 'Assessment').objects
+            .values_list('id', flat=True))
+    for label in ASSESSMENT_COUNT_MODELS:
+        model = apps.get_model(label)
+        relation = model.objects.assessment_relation
+        counts = dict(
+            model.objects
+                .order_by()
+                .values_list(relation)
+                .annotate(n=Count('id')))
+        for assessment_id in assessment_ids:
+            values[get_key(model, assessment_id)] = counts.get(assessment_id, 0)
+
+    values[COVERAGE_KEY] = compute_coverage()
+    cache.set_many(values, None)
+    return len(values)
@@ -1,13 +1,21 @@
 from datetime import datetime
 import decimal
+import itertools
 import logging
+import tempfile
 from collections import OrderedDict
-from io import BytesIO, StringIO
 import re
+import threading
+import time
 
+from django.apps import apps
+from django.conf import settings
 from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
-from django.shortcuts import HttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.http import FileResponse, StreamingHttpResponse
 from django.utils import html
 
 from rest_framework.renderers import JSONRenderer
@@ -80,6 +88,11 @@ class SerializerHelper(object):
     HAWC helper-object for getting serialized objects and setting cache.
     Sets cache names based on django models and primary keys automatically.
     Sets a cache using the serialized object, and also a JSON object.
+
+    Cached objects are stored with the generation of their model and
+    assessment; incrementing a generation (`bump_generation`) invalidates
+    all objects in an assessment (or model) at once, and stale objects
+    age-out from the cache.
     """
 
     serializers = {}
@@ -91,11 +104,156 @@ class SerializerHelper(object):
             name += ".json"
         return name
 
+    @classmethod
+    def _get_generation_name(cls, model, assessment_id=None):
+        name = "generation.{}.{}".format(model.__module__, model.__name__)
+        if assessment_id is not None:
+            name += ".assessment-{}".format(assessment_id)
+        return name
+
+    @classmethod
+    def _get_version_name(cls, model, assessment_id=None):
+        name = "version.{}.{}".format(model.__module__, model.__name__)
+        if assessment_id is not None:
+            name += ".assessment-{}".format(assessment_id)
+        return name
+
+    @classmethod
+    def _new_generation(cls):
+        # initial generations are unique so that an evicted counter cannot
+        # reset to a value used by a stale cache
+        return int(time.time() * 1e6)
+
+    @classmethod
+    def _get_counters(cls, names):
+        values = cache.get_many(names)
+        for name in names:
+            if name not in values:
+                cache.add(name, cls._new_generation(), timeout=None)
+                values[name] = cache.get(name)
+        return values
+
+    @classmethod
+    def _incr_counter(cls, name):
+        if not cache.add(name, cls._new_generation(), timeout=None):
+            try:
+                cache.incr(name)
+            except ValueError:
+                # evicted since add
+                cache.set(name, cls._new_generation(), timeout=None)
+
+    @classmethod
+    def _get_generations(cls, model, assessment_ids):
+        """
+        Return a dictionary of {assessment_id: generation} for each
+        assessment; a generation is a (model, assessment) counter tuple.
+        """
+        model_name = cls._get_generation_name(model)
+        names = {
+            assessment_id: cls._get_generation_name(model, assessment_id)
+            for assessment_id in assessment_ids
+            if assessment_id is not None
+        }
+        values = cls._get_counters([model_name] + list(names.values()))
+
+        generations = {None: (values[model_name], None)}
+        for assessment_id, name in names.items():
+            generations[assessment_id] = (values[model_name], values[name])
+        return generations
+
+    @classmethod
+    def bump_generation(cls, model, assessment_id=None):
+        """
+        Invalidate all cached objects of this model, in a single assessment
+        if `assessment_id` is specified. Models which store other data
+        derived from their serialization remove it in a
+        `delete_generation_caches(assessment_id)` classmethod.
+        """
+        name = cls._get_generation_name(model, assessment_id)
+        logging.debug('incrementing cache generation: {}'.format(name))
+        cls._incr_counter(name)
+        delete_generation_caches = getattr(model, 'delete_generation_caches', None)
+        if callable(delete_generation_caches):
+            delete_generation_caches(assessment_id)
+
+    @classmethod
+    def get_version(cls, model, assessment_id):
+        """
+        Return a tuple of counters which change whenever a cached object of
+        this model in the assessment is invalidated, or the generation is
+        bumped; used to fingerprint data derived from these objects without
+        serializing them.
+        """
+        generation = cls._get_generations(model, [assessment_id])[assessment_id]
+        names = [cls._get_version_name(model), cls._get_version_name(model, assessment_id)]
+        values = cls._get_counters(names)
+        return generation + tuple(values[name] for name in names)
+
+    @classmethod
+    def _bump_versions(cls, model, ids):
+        assessment_ids = cls._get_assessment_ids(model, ids)
+        targets = set(assessment_ids.values())
+        # objects which no longer exist (eg., deleted) bump the model version
+        if len(assessment_ids) < len(set(ids)):
+            targets.add(None)
+        for assessment_id in targets:
+            cls._incr_counter(cls._get_version_name(model, assessment_id))
+
+    @classmethod
+    def _get_assessment_ids(cls, model, ids):
+        relation = getattr(model.objects, 'assessment_relation', None)
+        if relation is None:
+            return {}
+        return dict(
+            model.objects
+                .filter(id__in=ids)
+                .values_list('id', relation)
+        )
+
+    @classmethod
+    def _get_valid(cls, model, entries):
+        """
+        Given a dictionary of cached entries, return a dictionary of the
+        cached values which are from the current generation.
+        """
+        # ignore objects cached before generations were used
+        entries = {
+            name: entry for name, entry in entries.items()
+            if isinstance(entry, dict) and 'generation' in entry
+        }
+        if len(entries) == 0:
+            return {}
+        generations = cls._get_generations(
+            model, set(entry['assessment'] for entry in entries.values()))
+        return {
+            name: entry['data']
+            for name, entry in entries.items()
+            if entry['generation'] == generations[entry['assessment']]
+        }
+
+    @classmethod
+    def _set_many(cls, model, objects, generations, assessment_ids):
+        # objects is a dictionary of {id: {name: data}}
+        to_cache = {}
+        for id, names in objects.items():
+            assessment_id = assessment_ids.get(id)
+            for name, data in names.items():
+                to_cache[name] = {
+                    'assessment': assessment_id,
+                    'generation': generations[assessment_id],
+                    'data': data,
+                }
+        cache.set_many(to_cache, timeout=settings.SERIALIZER_CACHE_TIMEOUT)
+
     @classmethod
     def get_serialized(cls, obj, json=True, from_cache=True):
         if from_cache:
-            name = cls._get_cache_name(obj.__class__, obj.id, json)
-            cached = cache.get(name)
+            model = obj.__class__
+            name = cls._get_cache_name(model, obj.id, json)
+            entry = cache.get(name)
+            cached = None
+            if entry:
+                cached = cls._get_valid(model, {name: entry}).get(name)
             if cached:
                 logging.debug('using cache: {}'.format(name))
             else:
@@ -104,6 +262,108 @@ class SerializerHelper(object):
         else:
             return cls._serialize(obj, json=json)
 
+    @classmethod
+    def get_serialized_many(cls, queryset, json=False):
+        """
+        Return serialized objects for a queryset, in the same order.
+
+        Cached objects are fetched in a single multi-get; any cache-misses are
+        re-queried together using the model manager's `optimized_qs` (if
+        available), serialized together, and written back in a single call.
+        Objects deleted before they are re-queried are skipped.
+        """
+        return list(cls.iter_serialized_many(queryset, json=json))
+
+    @classmethod
+    def iter_serialized_many(cls, queryset, json=False, batch_size=1000):
+        """
+        Generator version of `get_serialized_many`; objects are fetched and
+        serialized in batches so that memory use is bounded by `batch_size`.
+        """
+        if isinstance(queryset, QuerySet):
+            model = queryset.model
+            ids = list(queryset.values_list('id', flat=True))
+        else:
+            objs = list(queryset)
+            model = objs[0].__class__ if len(objs) > 0 else None
+            ids = [obj.id for obj in objs]
+
+        for i in range(0, len(ids), batch_size):
+            yield from cls._get_serialized_batch(model, ids[i:i + batch_size], json)
+
+    @classmethod
+    def _get_serialized_batch(cls, model, ids, json):
+        names = [cls._get_cache_name(model, id, json) for id in ids]
+        cached = cls._get_valid(model, cache.get_many(names))
+
+        missing_ids = [id for id, name in zip(ids, names) if name not in cached]
+        if len(missing_ids) > 0:
+            cached.update(cls._serialize_and_cache_many(model, missing_ids, json))
+
+        # objects deleted since their ids were read are skipped
+        return [cached[name] for name in names if name in cached]
+
+    @classmethod
+    def get_cached_ids(cls, model, ids, batch_size=1000):
+        """
+        Return the set of ids which have a current serialized object cached.
+        """
+        cached_ids = set()
+        ids = list(ids)
+        for i in range(0, len(ids), batch_size):
+            names = {
+                cls._get_cache_name(model, id, json=True): id
+                for id in ids[i:i + batch_size]
+            }
+            valid = cls._get_valid(model, cache.get_many(list(names.keys())))
+            cached_ids.update(names[name] for name in valid)
+        return cached_ids
+
+    @classmethod
+    def warm_cache(cls, model, ids, batch_size=500):
+        """
+        Serialize and cache objects which are not currently cached, in
+        batches. Returns the number of objects serialized.
+        """
+        ids = list(ids)
+        missing_ids = sorted(set(ids) - cls.get_cached_ids(model, ids))
+        for i in range(0, len(missing_ids), batch_size):
+            cls._serialize_and_cache_many(model, missing_ids[i:i + batch_size], json=True)
+        return len(missing_ids)
+
+    @classmethod
+    def _get_optimized_qs(cls, model, ids):
+        optimized_qs = getattr(model.objects, 'optimized_qs', None)
+        if callable(optimized_qs):
+            return optimized_qs(id__in=ids)
+        return model.objects.filter(id__in=ids)
+
+    @classmethod
+    def _serialize_and_cache_many(cls, model, ids, json):
+        # generations are read before serialization, so that a concurrent
+        # invalidation isn't stored with data serialized before it
+        assessment_ids = cls._get_assessment_ids(model, ids)
+        generations = cls._get_generations(model, set(assessment_ids.values()))
+
+        objs = list(cls._get_optimized_qs(model, ids))
+        serializer = cls.serializers.get(model)
+        data = serializer(objs, many=True).data
+
+        to_cache = {}
+        results = {}
+        for obj, serialized in zip(objs, data):
+            name = cls._get_cache_name(model, obj.id, json=False)
+            json_name = cls._get_cache_name(model, obj.id, json=True)
+            json_str = JSONRenderer().render(serialized)
+            serialized = OrderedDict(serialized)  # for pickling
+            to_cache[obj.id] = {name: serialized, json_name: json_str}
+            results[json_name if json else name] = json_str if json else serialized
+
+        logging.debug('setting cache: {} {} objects'.format(model.__name__, len(objs)))
+        cls._set_many(model, to_cache, generations, assessment_ids)
+
+        return results
+
     @classmethod
     def _serialize(cls, obj, json=False):
         serializer = cls.serializers.get(obj.__class__)
@@ -115,8 +375,11 @@ class SerializerHelper(object):
     @classmethod
     def _serialize_and_cache(cls, obj, json):
         # get expected object names
-        name = cls._get_cache_name(obj.__class__, obj.id, json=False)
-        json_name = cls._get_cache_name(obj.__class__, obj.id, json=True)
+        model = obj.__class__
+        name = cls._get_cache_name(model, obj.id, json=False)
+        json_name = cls._get_cache_name(model, obj.id, json=True)
+        assessment_ids = cls._get_assessment_ids(model, [obj.id])
+        generations = cls._get_generations(model, set(assessment_ids.values()))
 
         # serialize data and get json-representation
         if hasattr(obj, 'optimized_for_serialization'):
@@ -126,7 +389,11 @@ class SerializerHelper(object):
         serialized = OrderedDict(serialized)  # for pickling
 
         logging.debug('setting cache: {}'.format(name))
-        cache.set_many({name: serialized, json_name: json_str})
+        cls._set_many(
+            model,
+            {obj.id: {name: serialized, json_name: json_str}},
+            generations,
+            assessment_ids)
 
         if json:
             return json_str
@@ -143,6 +410,76 @@ class SerializerHelper(object):
         names.extend([cls._get_cache_name(model, id, json=True) for id in ids])
         logging.debug("Removing caches: {}".format(', '.join(names)))
         cache.delete_many(names)
+        if len(ids) > 0:
+            cls._bump_versions(model, ids)
+
+
+class DeferredFlush(threading.local):
+    """
+    Base class for per-thread work collected in `pending` by model signals,
+    and flushed once when the current transaction is committed (or
+    immediately, if not in a transaction).
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+
+    def schedule_flush(self):
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self.flush()
+        elif not any(func == self.flush for _, func in connection.run_on_commit):
+            transaction.on_commit(self.flush)
+
+    def flush(self):
+        # should swap out and process `pending`
+        raise NotImplementedError()
+
+
+class CacheInvalidator(DeferredFlush):
+    """
+    Collect cache invalidations made by model signals, and flush them once
+    when the current transaction is committed (or immediately, if not in a
+    transaction). Ids are deduplicated, and filters for each model are
+    resolved with a single query at flush time. Caches are therefore not
+    cleared, and re-filled from uncommitted data, mid-transaction.
+
+    If a transaction is rolled back, collected invalidations are kept and
+    flushed with the next commit; clearing extra caches is harmless.
+    """
+
+    def add(self, model, ids=(), filters=None, resolve=False):
+        """
+        Invalidate caches for `model` objects; `ids` is a list of primary
+        keys, and `filters` a dictionary of {lookup: value}, matching
+        objects are invalidated. Set `resolve` to find filter matches
+        immediately; required when related objects are about to be deleted.
+        """
+        entry = self.pending.setdefault(model, {'ids': set(), 'filters': {}})
+        entry['ids'].update(ids)
+        for key, value in (filters or {}).items():
+            if resolve:
+                entry['ids'].update(
+                    model.objects.filter(**{key: value}).values_list('id', flat=True))
+            else:
+                entry['filters'].setdefault(key, set()).add(value)
+
+        self.schedule_flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, OrderedDict()
+        for model, entry in pending.items():
+            ids = entry['ids']
+            if entry['filters']:
+                query = Q()
+                for key, values in entry['filters'].items():
+                    query |= Q(**{'{}__in'.format(key): values})
+                ids.update(model.objects.filter(query).values_list('id', flat=True))
+            if ids:
+                model.delete_caches(list(ids))
+
+
+cache_invalidator = CacheInvalidator()
 
 
 class FlatFileExporter(object):
@@ -153,6 +490,7 @@ class FlatFileExporter(object):
         self.queryset = queryset
         self.export_format = export_format
         self.kwargs = kwargs
+        self._overall_confidence_indexes = {}
 
         if self.export_format == "tsv":
             self.exporter = TSVFileBuilder(**kwargs)
@@ -165,6 +503,8 @@ class FlatFileExporter(object):
         raise NotImplementedError()
 
     def _get_data_rows(self):
+        # should return an iterable of rows; generators are preferred so that
+        # rows can be written without materializing the complete export
         raise NotImplementedError()
 
     @classmethod
@@ -186,6 +526,26 @@ class FlatFileExporter(object):
 
         return returnValue
 
+    def _get_overall_confidence_text(self, study):
+        """
+        Return the overall-confidence display text for a serialized study.
+        Confidence values are read from a per-assessment index which is
+        loaded at most once per export.
+        """
+        Study = apps.get_model('study', 'Study')
+        RiskOfBiasScore = apps.get_model('riskofbias', 'RiskOfBiasScore')
+
+        assessment_id = study['assessment']
+        if assessment_id not in self._overall_confidence_indexes:
+            self._overall_confidence_indexes[assessment_id] = \
+                Study.get_overall_confidence_index(assessment_id)
+
+        confidence = self._overall_confidence_indexes[assessment_id].get(study['id'], -1)
+        if confidence == -1:
+            return 'N/A'
+        score = (confidence + 10) % 11
+        return dict(RiskOfBiasScore.RISK_OF_BIAS_SCORE_CHOICES).get(score, 'N/A')
+
     def build_response(self):
         header_row = self._get_header_row()
         data_rows = self._get_data_rows()
@@ -220,7 +580,7 @@ class FlatFile(object):
         raise NotImplementedError()
 
     def _write_data_rows(self, data_rows):
-        # `data_rows` is a list of lists
+        # `data_rows` is an iterable of lists
         raise NotImplementedError()
 
     def _django_response(self):
@@ -232,6 +592,9 @@ class ExcelFileBuilder(FlatFile):
     Implementation of FlatFile to generate an Excel workbook with a single
     Excel worksheet. Has one header row with minor styles applied.
 
+    The workbook is written in constant-memory mode to a temporary file, which
+    is streamed to the client and removed once the response is closed.
+
     Optional initialization argument:
 
     - `sheet_name`: String name of worksheet (default: "Sheet1")
@@ -239,8 +602,8 @@ class ExcelFileBuilder(FlatFile):
     """
 
     def _setup(self):
-        self.output = BytesIO()
-        self.wb = xlsxwriter.Workbook(self.output)
+        self.output = tempfile.TemporaryFile()
+        self.wb = xlsxwriter.Workbook(self.output, {'constant_memory': True})
         self._add_worksheet(sheet_name=self.kwargs.get("sheet_name", "Sheet1"))
 
     def _add_worksheet(self, sheet_name="Sheet1"):
@@ -292,28 +655,45 @@ class ExcelFileBuilder(FlatFile):
         fn = '{}.xlsx'.format(self.filename)
         self.wb.close()
         self.output.seek(0)
-        response = HttpResponse(self.output.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response = FileResponse(
+            self.output,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(fn)
         return response
 
 
+class EchoBuffer(object):
+    """
+    File-like object which returns the value written instead of storing it;
+    used to stream csv-writer output.
+    """
+
+    def write(self, value):
+        return value
+
+
 class TSVFileBuilder(FlatFile):
     """
     Implementation of FlatFile to generate an tab-separated value file.
+
+    Rows are not written until the response is iterated, so the file is
+    streamed to the client as rows are generated.
     """
 
     def _setup(self):
-        self.output = StringIO()
-        self.tsv = csv.writer(self.output, dialect='excel-tab')
+        self.rows = []
+        self.tsv = csv.writer(EchoBuffer(), dialect='excel-tab')
 
     def _write_header_row(self, header_row):
-        self.tsv.writerow(header_row)
+        self.rows.append([header_row])
 
     def _write_data_rows(self, data_rows):
-        self.tsv.writerows(data_rows)
+        self.rows.append(data_rows)
 
     def _django_response(self):
-        self.output.seek(0)
-        response = HttpResponse(self.output, content_type='text/tab-separated-values')
+        rows = itertools.chain.from_iterable(self.rows)
+        response = StreamingHttpResponse(
+            (self.tsv.writerow(row) for row in rows),
+            content_type='text/tab-separated-values')
         response['Content-Disposition'] = 'attachment; filename="{}.tsv"'.format(self.filename)
         return response
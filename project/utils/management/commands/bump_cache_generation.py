@@ -0,0 +1,45 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.helper import SerializerHelper
+from utils.warmup import queue_warm_cache
+
+
+HELP_TEXT = """Invalidate serialized-object caches for an assessment and/or model.
+
+Increments a cache generation; unlike `clear_cache`, other assessments and
+models are unaffected. If only an assessment is specified, all serialized
+models are invalidated for that assessment. The assessment cache is then
+re-warmed in the background."""
+
+
+class Command(BaseCommand):
+    help = HELP_TEXT
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assessment', type=int, dest='assessment_id',
+                            help='Assessment ID')
+        parser.add_argument('--model', type=str, dest='model',
+                            help='Model, as app_label.ModelName')
+
+    def handle(self, assessment_id=None, model=None, **options):
+        if assessment_id is None and model is None:
+            raise CommandError('An assessment and/or model is required.')
+
+        if model:
+            try:
+                models = [apps.get_model(model)]
+            except (LookupError, ValueError) as err:
+                raise CommandError(str(err))
+            if models[0] not in SerializerHelper.serializers:
+                raise CommandError('Model is not cached: {}'.format(model))
+        else:
+            models = list(SerializerHelper.serializers.keys())
+
+        for model in models:
+            SerializerHelper.bump_generation(model, assessment_id)
+            self.stdout.write('Invalidated {}.{}'.format(
+                model._meta.app_label, model.__name__))
+
+        if assessment_id is not None:
+            queue_warm_cache(assessment_id, [model._meta.label for model in models])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from utils.warmup import CacheWarmer
+
+
+HELP_TEXT = """Serialize and cache all objects in an assessment.
+
+Reports the percentage of objects cached for each model; use --coverage to
+report without caching."""
+
+
+class Command(BaseCommand):
+    help = HELP_TEXT
+
+    def add_arguments(self, parser):
+        parser.add_argument('assessment_ids', type=int, nargs='+')
+        parser.add_argument('--workers', type=int, dest='max_workers',
+                            help='Number of concurrent workers')
+        parser.add_argument('--coverage', action='store_true', dest='coverage_only',
+                            help='Report coverage only')
+
+    def handle(self, assessment_ids, max_workers=None, coverage_only=False, **options):
+        for assessment_id in assessment_ids:
+            warmer = CacheWarmer(assessment_id, max_workers=max_workers)
+            coverage = warmer.get_coverage() if coverage_only else warmer.warm()
+            self.stdout.write('Assessment {}'.format(assessment_id))
+            for label, values in coverage.items():
+                self.stdout.write('  {}: {cached}/{total} cached ({percent}%)'.format(
+                    label, **values))
@@ -195,10 +195,40 @@ class AssessmentRootMixin(object):
             logging.info('cache set: {0}'.format(key))
         return descendants
 
+    @classmethod
+    def get_closure_cache_name(cls, assessment_id):
+        return cls.cache_template_tagtree.format(assessment_id) + '-closure'
+
+    @classmethod
+    def get_closure(cls, assessment_id):
+        """
+        Return a dictionary of {tag_id: [tag_id, *descendant_ids]} for all
+        tags in the assessment, including the root. Built from materialized
+        paths in a single query.
+        """
+        key = cls.get_closure_cache_name(assessment_id)
+        closure = cache.get(key)
+        if closure:
+            logging.info('cache used: {0}'.format(key))
+        else:
+            root = cls.get_assessment_root(assessment_id)
+            nodes = list(cls.get_tree(root).values_list('id', 'path'))
+            ids = {path: id for id, path in nodes}
+            closure = {id: [] for id, path in nodes}
+            for id, path in nodes:
+                for end in range(cls.steplen, len(path) + 1, cls.steplen):
+                    ancestor_id = ids.get(path[:end])
+                    if ancestor_id is not None:
+                        closure[ancestor_id].append(id)
+            cache.set(key, closure)
+            logging.info('cache set: {0}'.format(key))
+        return closure
+
     @classmethod
     def clear_cache(cls, assessment_id):
         keys = (cls.cache_template_taglist.format(assessment_id),
-                cls.cache_template_tagtree.format(assessment_id))
+                cls.cache_template_tagtree.format(assessment_id),
+                cls.get_closure_cache_name(assessment_id))
         logging.info('removing cache: {0}'.format(', '.join(keys)))
         cache.delete_many(keys)
 
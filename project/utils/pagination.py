@@ -0,0 +1,160 @@
+"""
+Pagination for large filtered lists.
+
+`KeysetPaginator` seeks to a page using the sort value and id of the last
+(or first) row of the adjacent page, instead of an OFFSET which requires
+scanning all preceding rows. The total count is supplied by the caller, so
+it can be cached or estimated instead of re-counted for each page.
+"""
+import base64
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+
+class CountedPaginator(Paginator):
+    """
+    Offset paginator with a precomputed count.
+    """
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.__dict__['count'] = count
+
+
+def get_keyset_field(model, order_by):
+    """
+    Return (field path, descending) for a keyset ordering, or None if the
+    ordering can't be used as a keyset (eg., not a field, or a field on a
+    to-many relation, where rows could be repeated).
+    """
+    if not order_by:
+        return 'id', False
+    descending = order_by.startswith('-')
+    path = order_by.lstrip('-')
+    opts = model._meta
+    for name in path.split('__'):
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.many_to_many or field.one_to_many:
+            return None
+        if field.is_relation:
+            opts = field.related_model._meta
+    return path, descending
+
+
+def encode_cursor(obj):
+    data = json.dumps([obj.keyset_value, obj.id], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return value, int(id_)
+    except (TypeError, ValueError):
+        raise InvalidPage('Invalid cursor')
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, number, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0]) if self.object_list else None
+
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self.object_list else None
+
+
+class KeysetPaginator(object):
+    """
+    Paginate a queryset ordered by a single field (ties broken by id);
+    nulls are always sorted last. Pages are loaded after or before a
+    cursor, or by page number for the first page or direct links.
+    """
+
+    def __init__(self, queryset, per_page, field, descending, count):
+        self.queryset = queryset.annotate(keyset_value=F(field))
+        self.per_page = per_page
+        self.descending = descending
+        self.count = count
+
+    @property
+    def num_pages(self):
+        return max(1, int(math.ceil(self.count / float(self.per_page))))
+
+    def _ordered(self, reverse=False):
+        descending = self.descending != reverse
+        # nulls are last in the page direction, so first when reversed
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        value = F('keyset_value')
+        value = value.desc(**nulls) if descending else value.asc(**nulls)
+        return self.queryset.order_by(value, '-id' if reverse else 'id')
+
+    def _seek(self, cursor, reverse=False):
+        value, id_ = decode_cursor(cursor)
+        # rows beyond the cursor, in the (possibly reversed) page direction
+        id_lookup = 'id__lt' if reverse else 'id__gt'
+        if value is None:
+            query = Q(keyset_value__isnull=True, **{id_lookup: id_})
+            if reverse:
+                query |= Q(keyset_value__isnull=False)
+            return query
+
+        value_lookup = 'keyset_value__lt' if self.descending != reverse \
+            else 'keyset_value__gt'
+        query = Q(**{value_lookup: value}) | Q(keyset_value=value, **{id_lookup: id_})
+        if not reverse:
+            query |= Q(keyset_value__isnull=True)
+        return query
+
+    def page(self, number=1, after=None, before=None):
+        limit = self.per_page + 1
+        if after:
+            rows = list(self._ordered().filter(self._seek(after))[:limit])
+            has_previous, has_next = True, len(rows) == limit
+            rows = rows[:self.per_page]
+        elif before:
+            rows = list(self._ordered(reverse=True)
+                        .filter(self._seek(before, reverse=True))[:limit])
+            has_previous, has_next = len(rows) == limit, True
+            rows = rows[:self.per_page][::-1]
+        else:
+            offset = (number - 1) * self.per_page
+            rows = list(self._ordered()[offset:offset + limit])
+            has_previous, has_next = number > 1, len(rows) == limit
+            rows = rows[:self.per_page]
+        return KeysetPage(rows, number, self, has_previous, has_next)
@@ -0,0 +1,180 @@
+"""
+Parallel PostgreSQL COPY to and from a directory of compressed files.
+
+A dump exports a snapshot from one connection, and each worker connection
+imports that snapshot so all tables are read from the same consistent
+state. Each table query is written to its own gzipped file, and a
+manifest describes the files and columns so they can be loaded again in
+parallel.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+import gzip
+import json
+import logging
+import os
+import subprocess
+import threading
+
+from django.db import connection
+
+import psycopg2
+
+
+MANIFEST = 'manifest.json'
+PRE_DATA = 'pre-data.sql'
+POST_DATA = 'post-data.sql'
+
+
+def connect():
+    # new connection using the same parameters as django's default database
+    return psycopg2.connect(**connection.get_connection_params())
+
+
+def get_database_name():
+    return connection.settings_dict['NAME']
+
+
+class LineCounter(object):
+    """
+    File wrapper which counts lines written; COPY text format writes one
+    line per row.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.lines = 0
+
+    def write(self, data):
+        self.lines += data.count(b'\n')
+        return self.f.write(data)
+
+
+class ParallelCopyOut(object):
+    """
+    COPY a list of table queries to a directory, using `max_workers`
+    connections which share a single exported snapshot.
+
+    Each table is a dictionary with keys `table`, `columns`, `query`, and
+    `file`; the query must select the columns in order.
+    """
+
+    def __init__(self, directory, max_workers=4):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.snapshot = None
+
+    def _get_cursor(self):
+        cursor = getattr(self.local, 'cursor', None)
+        if cursor is None:
+            conn = connect()
+            conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            with self.lock:
+                self.connections.append(conn)
+            cursor = conn.cursor()
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [self.snapshot])
+            self.local.cursor = cursor
+        return cursor
+
+    def _copy_table(self, table):
+        path = os.path.join(self.directory, table['file'])
+        with gzip.open(path, 'wb') as f:
+            counter = LineCounter(f)
+            self._get_cursor().copy_expert(
+                'COPY ({}) TO STDOUT'.format(table['query']), counter)
+        logging.info('Copied {}: {} rows'.format(table['table'], counter.lines))
+        return dict(
+            table=table['table'],
+            columns=table['columns'],
+            file=table['file'],
+            rows=counter.lines,
+        )
+
+    def _dump_schema(self, section, fn):
+        subprocess.check_call([
+            'pg_dump', '-d', get_database_name(),
+            '--section={}'.format(section), '--no-owner',
+            '--snapshot={}'.format(self.snapshot),
+            '-f', os.path.join(self.directory, fn),
+        ])
+
+    def run(self, tables, **extra):
+        """
+        Write schema, tables and a manifest to the directory; `extra`
+        values are added to the manifest. Returns the manifest.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        # hold the exporting transaction open until all workers are done
+        with closing(connect()) as exporter:
+            exporter.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            with exporter.cursor() as cursor:
+                cursor.execute('SELECT pg_export_snapshot()')
+                self.snapshot = cursor.fetchone()[0]
+
+            try:
+                self._dump_schema('pre-data', PRE_DATA)
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = list(executor.map(self._copy_table, tables))
+                self._dump_schema('post-data', POST_DATA)
+            finally:
+                for conn in self.connections:
+                    conn.close()
+                self.connections = []
+
+        manifest = dict(
+            created=datetime.now().isoformat(),
+            snapshot=self.snapshot,
+            pre_data=PRE_DATA,
+            post_data=POST_DATA,
+            tables=results,
+            **extra
+        )
+        with open(os.path.join(self.directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+class ParallelCopyIn(object):
+    """
+    Load a directory written by `ParallelCopyOut` into an empty database.
+    Tables are loaded in parallel after the pre-data schema, and before
+    the post-data schema (indexes and constraints) is created.
+    """
+
+    def __init__(self, directory, max_workers=4):
+        self.directory = directory
+        self.max_workers = max_workers
+
+    def get_manifest(self):
+        with open(os.path.join(self.directory, MANIFEST), 'r') as f:
+            return json.load(f)
+
+    def _load_schema(self, fn):
+        subprocess.check_call([
+            'psql', '-d', get_database_name(), '-v', 'ON_ERROR_STOP=1',
+            '-q', '-f', os.path.join(self.directory, fn),
+        ])
+
+    def _copy_table(self, table):
+        columns = ', '.join('"{}"'.format(col) for col in table['columns'])
+        sql = 'COPY "{}" ({}) FROM STDIN'.format(table['table'], columns)
+        path = os.path.join(self.directory, table['file'])
+        with closing(connect()) as conn:
+            with conn.cursor() as cursor, gzip.open(path, 'rb') as f:
+                cursor.copy_expert(sql, f)
+            conn.commit()
+        logging.info('Loaded {}: {} rows'.format(table['table'], table['rows']))
+        return table['rows']
+
+    def run(self):
+        manifest = self.get_manifest()
+        self._load_schema(manifest['pre_data'])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            rows = sum(executor.map(self._copy_table, manifest['tables']))
+        self._load_schema(manifest['post_data'])
+        return rows
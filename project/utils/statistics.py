@@ -0,0 +1,169 @@
+"""
+Array-based statistics for dose-response groups.
+
+Groups from many endpoints (or results) are flattened into a single set of
+arrays so that calculations are performed once per batch instead of once per
+group. Missing values are NaN in arrays, and None in serialized groups.
+"""
+from functools import lru_cache
+import math
+
+import numpy as np
+from scipy import stats
+
+
+# inverse normal CDF at 0.975; two-tailed 95% confidence interval
+Z_975 = float(stats.norm.ppf(0.975))
+
+
+@lru_cache(maxsize=None)
+def t_quantile(df):
+    """
+    Two-tailed 95% quantile of a t-distribution; memoized by degrees of
+    freedom since the same handful of sample sizes are used repeatedly.
+    """
+    return float(stats.t.ppf(0.975, df))
+
+
+def t_quantiles(dfs):
+    """
+    Vectorized version of `t_quantile`, for an array of degrees of freedom.
+    """
+    dfs = np.asarray(dfs, dtype=int)
+    if dfs.size == 0:
+        return np.empty(0)
+    unique, inverse = np.unique(dfs, return_inverse=True)
+    table = np.array([t_quantile(int(df)) for df in unique])
+    return table[inverse]
+
+
+def flatten(datasets):
+    """
+    Flatten a list of (label, groups) tuples. Returns a list of all groups,
+    an array of the dataset label for each group, and an array of the index
+    of the first group in the same dataset for each group.
+    """
+    groups = []
+    labels = []
+    firsts = []
+    for label, grps in datasets:
+        first = len(groups)
+        groups.extend(grps)
+        labels.extend([label] * len(grps))
+        firsts.extend([first] * len(grps))
+    return groups, np.array(labels, dtype=object), np.array(firsts, dtype=int)
+
+
+def get_array(groups, key):
+    """
+    Return a float array of values for `key` in each group; None is NaN.
+    """
+    return np.array(
+        [np.nan if g.get(key) is None else g[key] for g in groups],
+        dtype=float)
+
+
+def to_value(value, ndigits=None):
+    value = float(value)
+    if math.isnan(value):
+        return None
+    if ndigits is not None:
+        value = round(value, ndigits)
+    return value
+
+
+def update_groups(groups, mask=None, ndigits=None, **arrays):
+    """
+    Write arrays back to each group as Python floats (or None); only groups
+    where `mask` is True are updated, if a mask is given.
+    """
+    keys = list(arrays.keys())
+    columns = [arrays[key].tolist() for key in keys]
+    for i, group in enumerate(groups):
+        if mask is not None and not mask[i]:
+            continue
+        group.update({
+            key: to_value(column[i], ndigits)
+            for key, column in zip(keys, columns)
+        })
+
+
+def is_truthy(arr):
+    # equivalent to python truthiness of an optional number
+    return ~np.isnan(arr) & (arr != 0)
+
+
+def stdevs(variance, n, is_sd, is_se):
+    """
+    Calculate standard deviations, given the variance for each group and if
+    the variance is a standard-deviation or standard-error.
+    """
+    with np.errstate(invalid='ignore'):
+        return np.where(
+            is_sd, variance,
+            np.where(is_se, variance * np.sqrt(n), np.nan))
+
+
+def percent_control(n, mu, sd, control):
+    """
+    Calculate the percent-difference from control, and a 95% confidence
+    interval, taking into account variance from both groups using a Fisher
+    Information Matrix and assuming independent normal distributions.
+
+    `control` is an array of the index of the control group for each group.
+    Returns a tuple of (mean, low, high) arrays.
+    """
+    n_1 = n[control]
+    mu_1 = mu[control]
+    sd_1 = sd[control]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        has_mean = is_truthy(mu_1) & is_truthy(mu)
+        mean = np.where(has_mean, (mu - mu_1) / mu_1 * 100., np.nan)
+
+        has_ci = has_mean & is_truthy(sd_1) & is_truthy(sd) & \
+            is_truthy(n_1) & is_truthy(n)
+        sd_pct = np.sqrt(
+            np.power(mu_1, -2.) * (
+                (np.power(sd, 2) / n) +
+                (np.power(mu, 2) * np.power(sd_1, 2)) / (n_1 * np.power(mu_1, 2))
+            )
+        )
+        ci = (1.96 * sd_pct) * 100
+        low = np.where(has_ci, np.minimum(mean - ci, mean + ci), np.nan)
+        high = np.where(has_ci, np.maximum(mean - ci, mean + ci), np.nan)
+
+    return mean, low, high
+
+
+def t_confidence_intervals(estimate, se, n, mask):
+    """
+    Two-tailed t-test 95% confidence intervals, given the estimate and the
+    standard-error for each group. Only groups where `mask` is True are
+    calculated. Returns a tuple of (lower, upper) arrays.
+    """
+    dfs = np.where(mask, np.maximum(np.nan_to_num(n) - 1, 1), 1)
+    change = t_quantiles(dfs) * se
+    with np.errstate(invalid='ignore'):
+        lower = np.where(mask, estimate - change, np.nan)
+        upper = np.where(mask, estimate + change, np.nan)
+    return lower, upper
+
+
+def dichotomous_confidence_intervals(incidence, n):
+    """
+    Confidence intervals for dichotomous datasets; taken from
+    bmds231_manual.pdf, pg 124-5. Returns a tuple of (lower, upper) arrays;
+    both bounds are 0 when n is 0.
+    """
+    z = Z_975
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.where(n > 0, incidence / n, 0.)
+        q = 1. - p
+        lower = ((2 * n * p + 2 * z - 1) - z * np.sqrt(
+            2 * z - (2 + 1 / n) + 4 * p * (n * q + 1))) / (2 * (n + 2 * z))
+        upper = ((2 * n * p + 2 * z + 1) + z * np.sqrt(
+            2 * z + (2 + 1 / n) + 4 * p * (n * q - 1))) / (2 * (n + 2 * z))
+        lower = np.where(n == 0, 0., lower)
+        upper = np.where(n == 0, 0., upper)
+    return lower, upper
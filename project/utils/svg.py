@@ -1,12 +1,19 @@
 from datetime import datetime
 import base64
+import hashlib
+import json
 import logging
 import os
+import queue
 import re
+import select
 import subprocess
+import threading
+import time
 from io import BytesIO
 import tempfile
 from urllib import parse
+from uuid import uuid4
 
 from django.conf import settings
 from django.template.loader import render_to_string
@@ -75,6 +82,127 @@ class HawcStyles:
 Styles = HawcStyles()
 
 
+def get_export_key(svg, url, width, height, extension):
+    """
+    Cache key for an exported figure; the url is only embedded in the
+    output for pptx, so other formats are shared between pages.
+    """
+    parts = [extension, str(width), str(height), svg]
+    if extension == 'pptx':
+        parts.append(url)
+    digest = hashlib.sha256('\n'.join(parts).encode('utf8')).hexdigest()
+    return 'svg-export-{}'.format(digest)
+
+
+class Renderer(object):
+    """
+    A long-lived PhantomJS process running rasterize.js in worker mode; jobs
+    are written to stdin as JSON lines, and results are read from stdout.
+    """
+
+    def __init__(self):
+        rasterize = os.path.join(
+            settings.PROJECT_PATH, 'static/js/rasterize.js')
+        self.process = subprocess.Popen(
+            [settings.PHANTOMJS_PATH, rasterize],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=0,
+        )
+        self.jobs = 0
+
+    def render(self, html_fn, out_fn, timeout):
+        job_id = uuid4().hex
+        job = json.dumps(dict(id=job_id, input=html_fn, output=out_fn))
+        self.process.stdin.write(job.encode('utf8') + b'\n')
+        self.process.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError('Rasterization timed out')
+            ready, _, _ = select.select([self.process.stdout], [], [], remaining)
+            if not ready:
+                continue
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError('Rasterization process exited')
+            try:
+                result = json.loads(line.decode('utf8'))
+            except ValueError:
+                # console output from the page being rendered
+                logger.debug(line)
+                continue
+            if isinstance(result, dict) and result.get('id') == job_id:
+                self.jobs += 1
+                return result.get('ok', False)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+class RendererPool(object):
+    """
+    A bounded pool of renderers, shared by threads in a process. Renderers
+    are started when first needed, and replaced after `max_jobs` renders or
+    after any failure.
+    """
+
+    def __init__(self, size, max_jobs, timeout):
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def render(self, html_fn, out_fn):
+        with self.slots:
+            try:
+                renderer = self.idle.get_nowait()
+            except queue.Empty:
+                renderer = Renderer()
+
+            try:
+                ok = renderer.render(html_fn, out_fn, self.timeout)
+            except Exception:
+                renderer.close()
+                raise
+
+            if renderer.jobs >= self.max_jobs:
+                renderer.close()
+            else:
+                self.idle.put(renderer)
+
+        return ok
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_renderer_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool(
+                size=settings.RASTERIZE_POOL_SIZE,
+                max_jobs=settings.RASTERIZE_MAX_JOBS,
+                timeout=settings.RASTERIZE_TIMEOUT,
+            )
+    return _pool
+
+
 class SVGConverter(object):
 
     def __init__(self, svg, url, width, height):
@@ -118,7 +246,7 @@ class SVGConverter(object):
             with open(png, 'rb') as f:
                 content = f.read()
         except Exception as e:
-            logger.error(e.message, exc_info=True)
+            logger.error(e, exc_info=True)
         finally:
             self.cleanup()
         return content
@@ -132,7 +260,7 @@ class SVGConverter(object):
             with open(pdf, 'rb') as f:
                 content = f.read()
         except Exception as e:
-            logger.error(e.message, exc_info=True)
+            logger.error(e, exc_info=True)
         finally:
             self.cleanup()
         return content
@@ -211,6 +339,15 @@ class SVGConverter(object):
 
         return content
 
+    def convert(self, extension):
+        # return exported content as bytes, or None if conversion failed
+        content = getattr(self, 'to_{}'.format(extension))()
+        if isinstance(content, str):
+            content = content.encode('utf8')
+        elif isinstance(content, BytesIO):
+            content = content.getvalue()
+        return content
+
     def get_tempfile(self, prefix='hawc-', suffix='.txt'):
         _, fn = tempfile.mkstemp(prefix=prefix, suffix=suffix)
         self.tempfns.append(fn)
@@ -233,13 +370,7 @@ class SVGConverter(object):
         return fn
 
     def _rasterize(self, out_fn):
-        phantom = settings.PHANTOMJS_PATH
-        rasterize = os.path.join(
-            settings.PROJECT_PATH, 'static/js/rasterize.js')
         html_fn = self._to_html()
-        try:
-            commands = [phantom, rasterize, html_fn, out_fn]
-            subprocess.call(commands)
-            logger.info('Conversion successful')
-        except Exception as e:
-            logger.error(e.message, exc_info=True)
+        if not get_renderer_pool().render(html_fn, out_fn):
+            raise RuntimeError('Unable to rasterize {}'.format(html_fn))
+        logger.info('Conversion successful')
@@ -18,7 +18,7 @@ class FormTester(TestCase):
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-from . import validators
+from . import helper, validators
 
 
 class CustomURLValidtor(TestCase):
@@ -57,3 +57,27 @@ class CustomURLValidtor(TestCase):
         ]:
             with self.assertRaises(ValidationError):
                 validator(path)
+
+
+class FlatFileBuilders(TestCase):
+
+    header = ['id', 'name']
+
+    def rows(self):
+        for i in range(3):
+            yield [i, 'row {}'.format(i)]
+
+    def test_tsv_streaming(self):
+        builder = helper.TSVFileBuilder(filename='test')
+        response = builder.generate_response(self.header, self.rows())
+        assert response.streaming
+        content = b''.join(response.streaming_content).decode('utf8')
+        assert content == 'id\tname\r\n0\trow 0\r\n1\trow 1\r\n2\trow 2\r\n'
+
+    def test_excel_streaming(self):
+        builder = helper.ExcelFileBuilder(filename='test')
+        response = builder.generate_response(self.header, self.rows())
+        assert response.streaming
+        content = b''.join(response.streaming_content)
+        assert content[:2] == b'PK'  # zip archive
+        assert response['Content-Disposition'] == 'attachment; filename="test.xlsx"'
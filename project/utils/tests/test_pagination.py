@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+from django.core.paginator import InvalidPage
+
+import pytest
+
+from animal.models import Endpoint
+from animal.tests.utils import build_endpoints_for_permission_testing
+from utils.pagination import KeysetPaginator, decode_cursor, encode_cursor, get_keyset_field
+
+
+def test_keyset_field():
+    assert get_keyset_field(Endpoint, None) == ('id', False)
+    assert get_keyset_field(Endpoint, '-NOEL') == ('NOEL', True)
+    assert get_keyset_field(Endpoint, 'animal_group__experiment__name') == \
+        ('animal_group__experiment__name', False)
+
+    # to-many relations and custom orderings are paginated by offset
+    assert get_keyset_field(
+        Endpoint, 'animal_group__dosing_regime__doses__dose_units_id') is None
+    assert get_keyset_field(Endpoint, 'customBMD') is None
+
+
+def test_cursor():
+    obj = SimpleNamespace(id=12, keyset_value='Smith et al. 2010')
+    assert decode_cursor(encode_cursor(obj)) == ('Smith et al. 2010', 12)
+
+    obj = SimpleNamespace(id=3, keyset_value=None)
+    assert decode_cursor(encode_cursor(obj)) == (None, 3)
+
+    with pytest.raises(InvalidPage):
+        decode_cursor('not-a-cursor')
+
+
+def walk_pages(paginator):
+    # follow cursors forward to the last page, and then back to the first
+    page = paginator.page()
+    forward = [page]
+    while page.has_next():
+        page = paginator.page(after=page.next_cursor())
+        forward.append(page)
+    backward = [page]
+    while page.has_previous():
+        page = paginator.page(before=page.previous_cursor())
+        backward.append(page)
+    return forward, backward[::-1]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('descending', [False, True])
+def test_keyset_walk(descending):
+    obj = SimpleNamespace()
+    build_endpoints_for_permission_testing(obj)
+    values = [2., None, 1., 2., None, 3., 1., None, 2., 1.]
+    for i, value in enumerate(values):
+        Endpoint.objects.create(
+            assessment=obj.assessment_working,
+            animal_group=obj.animal_group_working,
+            name='endpoint {}'.format(i),
+            response_units='mg/L',
+            data_type='C',
+            observation_time=value)
+
+    qs = Endpoint.objects.filter(assessment=obj.assessment_working)
+    endpoints = list(qs)
+    # ties are ordered by id; nulls are always last
+    expected = sorted(
+        [ep for ep in endpoints if ep.observation_time is not None],
+        key=lambda ep: (-ep.observation_time if descending else ep.observation_time, ep.id))
+    expected.extend(sorted(
+        [ep for ep in endpoints if ep.observation_time is None], key=lambda ep: ep.id))
+    expected = [ep.id for ep in expected]
+
+    paginator = KeysetPaginator(qs, 3, 'observation_time', descending, count=len(endpoints))
+    forward, backward = walk_pages(paginator)
+    assert len(forward) == paginator.num_pages
+    for pages in (forward, backward):
+        assert [ep.id for page in pages for ep in page] == expected
+    assert not forward[0].has_previous()
+    assert not forward[-1].has_next()
@@ -0,0 +1,53 @@
+import os
+import stat
+import sys
+
+from utils.svg import RendererPool, get_export_key
+
+
+FAKE_PHANTOM = """#!{python}
+import json
+import sys
+
+for line in iter(sys.stdin.readline, ''):
+    job = json.loads(line)
+    with open(job['output'], 'w') as f:
+        f.write(job['input'])
+    sys.stdout.write('page console output\\n')
+    sys.stdout.write(json.dumps({{'id': job['id'], 'ok': True}}) + '\\n')
+    sys.stdout.flush()
+"""
+
+
+def test_export_key():
+    key = get_export_key('<svg/>', 'http://a/', 10, 20, 'png')
+    assert key == get_export_key('<svg/>', 'http://b/', 10, 20, 'png')
+    assert key != get_export_key('<svg/>', 'http://a/', 10, 20, 'pdf')
+    assert key != get_export_key('<svg/>', 'http://a/', 10, 21, 'png')
+
+    # url is embedded in pptx output
+    key = get_export_key('<svg/>', 'http://a/', 10, 20, 'pptx')
+    assert key != get_export_key('<svg/>', 'http://b/', 10, 20, 'pptx')
+
+
+def test_renderer_pool(tmpdir, settings):
+    phantom = str(tmpdir.join('phantom'))
+    with open(phantom, 'w') as f:
+        f.write(FAKE_PHANTOM.format(python=sys.executable))
+    os.chmod(phantom, os.stat(phantom).st_mode | stat.S_IEXEC)
+    settings.PHANTOMJS_PATH = phantom
+
+    pool = RendererPool(size=1, max_jobs=2, timeout=10)
+    try:
+        for i in range(3):
+            out_fn = str(tmpdir.join('{}.png'.format(i)))
+            assert pool.render('input-{}'.format(i), out_fn) is True
+            with open(out_fn) as f:
+                assert f.read() == 'input-{}'.format(i)
+
+        # renderer is recycled after max_jobs; one job on the current process
+        renderer = pool.idle.get_nowait()
+        assert renderer.jobs == 1
+        pool.idle.put(renderer)
+    finally:
+        pool.close()
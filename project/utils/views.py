@@ -1,20 +1,27 @@
 import abc
+import hashlib
+import json
 import logging
 
 from django.apps import apps
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage
 from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.forms.models import model_to_dict
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views.generic import DetailView, ListView
 from django.views.generic.edit import DeleteView, UpdateView, CreateView
 
 from assessment.models import Assessment, TimeSpentEditing
+from . import counts
 from .helper import tryParseInt
+from .pagination import (CountedPaginator, KeysetPage, KeysetPaginator,
+                         get_keyset_field)
 
 
 class MessageMixin(object):
@@ -211,7 +218,7 @@ class TimeSpentOnPageMixin(object):
 
     def get_success_url(self):
         response = super().get_success_url()
-        TimeSpentEditing.add_time_spent_job(
+        TimeSpentEditing.add_time_spent(
             self.request.session.session_key,
             self.request.path,
             self.object,
@@ -301,8 +308,7 @@ class CanCreateMixin(object):
             return False
         else:
             return ((assessment.editable is True) and
-                    ((self.request.user in assessment.project_manager.all()) or
-                     (self.request.user in assessment.team_members.all())))
+                    assessment.user_is_editor(self.request.user))
 
     def get(self, request, *args, **kwargs):
         if self.user_can_create_object(self.assessment):
@@ -590,8 +596,16 @@ class BaseUpdateWithFormset(BaseUpdate):
 
 
 class BaseEndpointFilterList(BaseList):
+    """
+    Filtered list of endpoints in an assessment. Pages are loaded using
+    keyset pagination when the ordering is a single-valued field, and the
+    total count is cached for each set of filters.
+    """
     parent_model = Assessment
     form_class = None  # required
+    order_by = None
+    PAGINATION_PARAMS = ('page', 'after', 'before')
+    COUNT_CACHE_TIMEOUT = 60 * 5
 
     def get_paginate_by(self, qs):
         val = 25
@@ -601,8 +615,16 @@ class BaseEndpointFilterList(BaseList):
             pass
         return val
 
+    def get_filter_params(self):
+        return sorted(
+            (key, value)
+            for key, values in self.request.GET.lists()
+            for value in values
+            if key not in self.PAGINATION_PARAMS
+        )
+
     def get(self, request, *args, **kwargs):
-        if len(self.request.GET) > 0:
+        if len(self.get_filter_params()) > 0:
             self.form = self.form_class(
                 self.request.GET,
                 assessment_id=self.assessment.id
@@ -624,29 +646,85 @@ class BaseEndpointFilterList(BaseList):
 
     def get_queryset(self):
         perms = super().get_obj_perms()
-        order_by = None
+        self.order_by = None
 
         query = self.get_query(perms)
 
         if self.form.is_valid():
             query &= self.form.get_query()
-            order_by = self.form.get_order_by()
-
-        ids = self.model.objects.filter(query)\
-            .order_by('id')\
-            .distinct('id')\
-            .values_list('id', flat=True)
-
-        qs = self.model.objects.filter(id__in=ids)
-
-        if order_by:
-            qs = qs.order_by(order_by)
-
-        return qs
+            self.order_by = self.form.get_order_by()
+
+        # filters may join to-many relations; a semi-join on the matching ids
+        # avoids duplicate rows without a DISTINCT sort
+        matches = self.model.objects.filter(query).values('id')
+        return self.model.objects.filter(id__in=matches)
+
+    def order_queryset(self, qs, order_by):
+        # ordering for non-keyset (offset) pagination
+        return qs.order_by(order_by or 'id')
+
+    def get_count(self, queryset):
+        edit = super().get_obj_perms()['edit']
+        if not self.form.is_bound and edit:
+            return counts.get_count(self.model, self.assessment.id)
+
+        digest = hashlib.md5(json.dumps([
+            self.model._meta.label, self.assessment.id, edit, self.get_filter_params()
+        ]).encode()).hexdigest()
+        key = 'filter-count-{}'.format(digest)
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_paginator(self, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True, **kwargs):
+        return CountedPaginator(
+            queryset, per_page, count=self.get_count(queryset), orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page, **kwargs)
+
+    def paginate_queryset(self, queryset, page_size):
+        keyset = get_keyset_field(self.model, self.order_by)
+        if keyset is None:
+            return super().paginate_queryset(
+                self.order_queryset(queryset, self.order_by), page_size)
+
+        number = tryParseInt(self.request.GET.get('page'), 1)
+        paginator = KeysetPaginator(
+            queryset, page_size, *keyset, count=self.get_count(queryset))
+        try:
+            page = paginator.page(
+                number=max(number, 1),
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_page_query(self, number, cursor=None):
+        params = self.request.GET.copy()
+        for key in self.PAGINATION_PARAMS:
+            params.pop(key, None)
+        params['page'] = number
+        if cursor:
+            params[cursor[0]] = cursor[1]
+        return params.urlencode()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['form'] = self.form
+        page = context['page_obj']
+        if page is not None and page.has_previous():
+            cursor = ('before', page.previous_cursor()) \
+                if isinstance(page, KeysetPage) else None
+            context['previous_query'] = self.get_page_query(
+                page.previous_page_number(), cursor)
+        if page is not None and page.has_next():
+            cursor = ('after', page.next_cursor()) \
+                if isinstance(page, KeysetPage) else None
+            context['next_query'] = self.get_page_query(
+                page.next_page_number(), cursor)
         context['list_json'] = self.model.get_qs_json(
             context['object_list'], json_encode=True)
         return context
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .helper import DeferredFlush, SerializerHelper
+
+
+# serialized models which are used in assessment-level visuals and exports
+WARM_CACHE_MODELS = (
+    'study.Study',
+    'animal.Endpoint',
+    'epi.Outcome',
+    'invitro.IVEndpoint',
+    'epimeta.MetaResult',
+)
+
+
+class CacheWarmer(object):
+    """
+    Serialize and cache all objects in an assessment which are not currently
+    cached. Batches of objects are serialized using a bounded thread pool;
+    each worker uses its own database connection.
+    """
+
+    def __init__(self, assessment_id, models=WARM_CACHE_MODELS,
+                 batch_size=500, max_workers=None):
+        self.assessment_id = assessment_id
+        self.models = [apps.get_model(model) for model in models]
+        self.batch_size = batch_size
+        self.max_workers = max_workers or settings.CACHE_WARM_MAX_WORKERS
+
+    def get_ids(self, model):
+        relation = model.objects.assessment_relation
+        return list(
+            model.objects
+                .filter(**{relation: self.assessment_id})
+                .order_by('id')
+                .values_list('id', flat=True)
+        )
+
+    def get_coverage(self):
+        """
+        Return a dictionary of the number of objects, number of cached
+        objects, and percentage cached, for each model.
+        """
+        coverage = {}
+        for model in self.models:
+            ids = self.get_ids(model)
+            cached = len(SerializerHelper.get_cached_ids(model, ids))
+            coverage[model._meta.label] = {
+                'total': len(ids),
+                'cached': cached,
+                'percent': round(100. * cached / len(ids), 1) if ids else 100.,
+            }
+        return coverage
+
+    def get_batches(self):
+        for model in self.models:
+            ids = self.get_ids(model)
+            for i in range(0, len(ids), self.batch_size):
+                yield model, ids[i:i + self.batch_size]
+
+    def _warm_batch(self, model, ids):
+        try:
+            return SerializerHelper.warm_cache(model, ids, batch_size=self.batch_size)
+        finally:
+            connection.close()
+
+    def warm(self):
+        """
+        Cache all objects in the assessment; returns the coverage afterwards.
+        """
+        batches = list(self.get_batches())
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                counts = list(executor.map(lambda args: self._warm_batch(*args), batches))
+        else:
+            counts = [
+                SerializerHelper.warm_cache(model, ids, batch_size=self.batch_size)
+                for model, ids in batches
+            ]
+        logging.info('Assessment {}: {} objects serialized'.format(
+            self.assessment_id, sum(counts)))
+        return self.get_coverage()
+
+
+def get_warm_lock_name(assessment_id, models):
+    return 'warm-cache-queued-{}-{}'.format(assessment_id, ','.join(sorted(models)))
+
+
+def queue_warm_cache(assessment_id, models=WARM_CACHE_MODELS):
+    """
+    Queue a warm-up of `models` in an assessment, unless an identical
+    warm-up is already queued and hasn't started.
+    """
+    from assessment.tasks import warm_cache
+
+    models = sorted(set(models).intersection(WARM_CACHE_MODELS))
+    if models and cache.add(get_warm_lock_name(assessment_id, models), True, 60 * 10):
+        warm_cache.delay(assessment_id, models)
+
+
+class CacheRefresher(DeferredFlush):
+    """
+    Collect serializer-generation bumps made by model signals, and apply
+    them once when the current transaction is committed (or immediately, if
+    not in a transaction). Each assessment is then re-warmed once, for only
+    the models which were bumped.
+    """
+
+    def add(self, model, assessment_id):
+        self.pending.setdefault(assessment_id, set()).add(model)
+        self.schedule_flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, OrderedDict()
+        for assessment_id, models in pending.items():
+            for model in models:
+                SerializerHelper.bump_generation(model, assessment_id)
+            queue_warm_cache(assessment_id, [model._meta.label for model in models])
+
+
+cache_refresher = CacheRefresher()